@@ -3,6 +3,7 @@
 import json
 import os
 import threading
+from utils import replace_file_atomically
 
 CONFIG_FILE = "config.json"
 
@@ -182,8 +183,8 @@ def save_project_config(project_path: str, config_data: dict) -> bool:
     config_path = os.path.join(project_path, PROJECT_SETTINGS_FILE)
     
     try:
-        with open(config_path, 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, ensure_ascii=False, indent=4)
+        # 工作流节点并发执行时，其他任务可能同时读取该文件
+        replace_file_atomically(config_path, lambda f: json.dump(config_data, f, ensure_ascii=False, indent=4))
         return True
     except IOError:
         return False
@@ -3,9 +3,9 @@
 import logging
 import traceback
 from typing import List
-import requests
-import tiktoken
-from langchain_openai import AzureOpenAIEmbeddings, OpenAIEmbeddings
+import httpx
+from http_transport import http_transport
+from tokenizer_service import tokenizer_service
 import config_manager as cm
 
 def _get_embedding_config_by_details(interface_format, model_name):
@@ -54,6 +54,7 @@ class OpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
     def __init__(self, api_key: str, base_url: str, model_name: str):
         super().__init__()
         self.model_name = model_name
+        from langchain_openai import OpenAIEmbeddings
         self._embedding = OpenAIEmbeddings(
             openai_api_key=api_key,
             openai_api_base=ensure_openai_base_url_has_v1(base_url),
@@ -102,6 +103,7 @@ class AzureOpenAIEmbeddingAdapter(BaseEmbeddingAdapter):
         else:
             raise ValueError("Invalid Azure OpenAI base_url format")
         
+        from langchain_openai import AzureOpenAIEmbeddings
         self._embedding = AzureOpenAIEmbeddings(
             azure_endpoint=self.azure_endpoint,
             azure_deployment=self.azure_deployment,
@@ -171,13 +173,13 @@ class OllamaEmbeddingAdapter(BaseEmbeddingAdapter):
             "prompt": text
         }
         try:
-            response = requests.post(url, json=data)
+            response = http_transport.post(url, json=data)
             response.raise_for_status()
             result = response.json()
             if "embedding" not in result:
                 raise ValueError("No 'embedding' field in Ollama response.")
             return result["embedding"]
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"Ollama embeddings request error: {e}\n{traceback.format_exc()}")
             return []
 
@@ -202,14 +204,14 @@ class LMStudioEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": texts,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = http_transport.post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result:
                 logging.error(f"Invalid response format from LM Studio API: {result}")
                 return [[]] * len(texts)
             return [item.get("embedding", []) for item in result["data"]]
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"LM Studio API request failed: {str(e)}")
             return [[]] * len(texts)
         except (KeyError, IndexError, ValueError, TypeError) as e:
@@ -222,14 +224,14 @@ class LMStudioEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": query,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = http_transport.post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             if "data" not in result or not result["data"]:
                 logging.error(f"Invalid response format from LM Studio API: {result}")
                 return []
             return result["data"][0].get("embedding", [])
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"LM Studio API request failed: {str(e)}")
             return []
         except (KeyError, IndexError, ValueError, TypeError) as e:
@@ -277,13 +279,13 @@ class GeminiEmbeddingAdapter(BaseEmbeddingAdapter):
         }
 
         try:
-            response = requests.post(url, json=payload)
+            response = http_transport.post(url, json=payload)
             print(response.text)
             response.raise_for_status()
             result = response.json()
             embedding_data = result.get("embedding", {})
             return embedding_data.get("values", [])
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"Gemini embed_content request error: {e}\n{traceback.format_exc()}")
             return []
         except Exception as e:
@@ -320,7 +322,7 @@ class AliyunBailianEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": texts,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = http_transport.post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             
@@ -331,7 +333,7 @@ class AliyunBailianEmbeddingAdapter(BaseEmbeddingAdapter):
             sorted_data = sorted(result["data"], key=lambda x: x.get("index", 0))
             
             return [item.get("embedding", []) for item in sorted_data]
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"Aliyun API request failed: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logging.error(f"Response status: {e.response.status_code}, body: {e.response.text}")
@@ -366,7 +368,7 @@ class VolcanoEngineEmbeddingAdapter(BaseEmbeddingAdapter):
                 "input": texts,
                 "model": self.model_name
             }
-            response = requests.post(self.url, json=payload, headers=self.headers)
+            response = http_transport.post(self.url, json=payload, headers=self.headers)
             response.raise_for_status()
             result = response.json()
             
@@ -377,7 +379,7 @@ class VolcanoEngineEmbeddingAdapter(BaseEmbeddingAdapter):
             sorted_data = sorted(result["data"], key=lambda x: x.get("index", 0))
             
             return [item.get("embedding", []) for item in sorted_data]
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"Volcano Engine API request failed: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logging.error(f"Response status: {e.response.status_code}, body: {e.response.text}")
@@ -414,11 +416,9 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
     def _embed(self, texts: list[str]) -> list[list[float]]:
         logging.info(f"向 SiliconFlow 接口 (模型: {self.model_name}) 发送 {len(texts)} 个文档进行向量化...")
         
-        try:
-            encoding = tiktoken.get_encoding("cl100k_base")
-        except Exception:
+        encoding = tokenizer_service.get_encoder()
+        if encoding is None:
             logging.warning("tiktoken 不可用，将使用字符数进行粗略估算。")
-            encoding = None
 
         final_embeddings = [[] for _ in texts]
         batch_size = 32  # 设定一个合理的批次大小
@@ -457,7 +457,7 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
             }
             
             try:
-                response = requests.post(self.url, json=payload, headers=self.headers)
+                response = http_transport.post(self.url, json=payload, headers=self.headers)
                 response.raise_for_status()
                 result = response.json()
                 
@@ -471,7 +471,7 @@ class SiliconFlowEmbeddingAdapter(BaseEmbeddingAdapter):
                     original_idx = batch_indices[j]
                     final_embeddings[original_idx] = item.get("embedding", [])
 
-            except requests.exceptions.RequestException as e:
+            except httpx.HTTPError as e:
                 logging.error(f"❌ SiliconFlow API 批次请求失败: {e}")
                 if hasattr(e, 'response') and e.response is not None:
                     logging.error(f"  - Response status: {e.response.status_code}")
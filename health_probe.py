@@ -0,0 +1,134 @@
+# health_probe.py
+# -*- coding: utf-8 -*-
+"""
+LLM端点的并发预热与健康探测。
+会话中第一次调用某个配置时要付出 DNS 解析和 TLS 握手的代价，轮询列表中失效的配置也要等到
+步骤失败切换时才会被发现。这里并发探测 config.json 中的全部配置和轮询列表中的成员：
+- 通过适配器池借出适配器，在共享HTTP传输层中预先建立连接，请求带上该接口自己的认证头；
+- 在超时限制内调用 _fetch_models 获取模型列表，并记录连接延迟；
+- 结果写入轮询设定.json 的 调用状态/AI状态，无法连接或认证被拒绝的配置在工作流开始前即被熔断跳过。
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError, as_completed
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+import config_manager as cm
+from http_transport import http_transport
+
+
+@dataclass
+class ProbeResult:
+    """单个配置的探测结果。"""
+    config_name: str
+    ok: bool
+    latency: Optional[float] = None   # 建立连接并收到响应的耗时（秒）
+    status_code: Optional[int] = None
+    models: List[str] = field(default_factory=list)
+    model_listed: Optional[bool] = None  # 配置的模型是否出现在模型列表中
+    error: Optional[str] = None
+
+    def describe(self) -> str:
+        if not self.ok:
+            return f"❌ {self.config_name}: {self.error}"
+        parts = []
+        if self.latency is not None:
+            parts.append(f"延迟 {self.latency * 1000:.0f} ms")
+        if self.models:
+            parts.append(f"{len(self.models)} 个模型")
+        text = f"✅ {self.config_name}: " + ("，".join(parts) or "可用")
+        if self.model_listed is False:
+            text += "（模型列表中未找到所配置的模型）"
+        return text
+
+
+def collect_probe_targets(polling_list: Optional[list] = None) -> List[str]:
+    """config.json 中的全部配置加上轮询列表中的成员，保持顺序并去重。"""
+    names = list(cm.get_config_names())
+    for item in polling_list or []:
+        name = item.get("name") if isinstance(item, dict) else item
+        if name and name not in names:
+            names.append(name)
+    return names
+
+
+def _probe_connection(adapter, timeout: float):
+    """
+    向 base_url 发送一次请求以建立并预热连接。任何HTTP响应都说明端点可达；
+    认证头按适配器的认证方式生成（Bearer、x-api-key、api-key 等），401 才能说明密钥无效。
+    """
+    base_url = adapter.base_url or ""
+    parts = urlsplit(base_url)
+    if parts.scheme not in ("http", "https"):
+        return None, None
+    headers = adapter.get_probe_headers()
+    start = time.monotonic()
+    response = http_transport.get(base_url, proxy=adapter.proxy, verify=adapter.verify_ssl, timeout=timeout, headers=headers)
+    return time.monotonic() - start, response.status_code
+
+
+def probe_config(polling_manager, config_name: str, timeout: float = 10.0) -> ProbeResult:
+    """探测单个配置：借出适配器、预热连接、在超时内获取模型列表。"""
+    adapter = None
+    release_later = False
+    try:
+        adapter = polling_manager.get_adapter_by_name(config_name)
+        if adapter is None:
+            return ProbeResult(config_name, False, error="找不到该配置")
+        try:
+            latency, status_code = _probe_connection(adapter, timeout)
+        except httpx.HTTPError as e:
+            return ProbeResult(config_name, False, error=f"无法连接: {type(e).__name__}: {e}")
+        # 只有带着接口自己的认证头仍被拒绝（401）才判定密钥无效；403 可能只是探测路径无权限，不据此熔断
+        if status_code == 401:
+            return ProbeResult(config_name, False, latency, status_code, error=f"认证失败 (HTTP {status_code})")
+
+        # _fetch_models 内部使用同一共享客户端；放到线程中以便施加整体超时。
+        # 超时后不等待该线程（_fetch_models 自身的超时更长），适配器等它结束后再归还
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-probe-models")
+        future = executor.submit(adapter.get_available_models)
+        executor.shutdown(wait=False)
+        try:
+            models = list(future.result(timeout=timeout) or [])
+        except FutureTimeoutError:
+            models = []
+            logging.warning(f"配置 '{config_name}' 获取模型列表超时（{timeout} 秒）。")
+            release_later = True
+            future.add_done_callback(lambda _: polling_manager.release_adapter(adapter))
+        model_listed = (adapter.model_name in models) if models and adapter.model_name else None
+        return ProbeResult(config_name, True, latency, status_code, models, model_listed)
+    except Exception as e:
+        return ProbeResult(config_name, False, error=f"{type(e).__name__}: {e}")
+    finally:
+        if adapter is not None and not release_later:
+            polling_manager.release_adapter(adapter)
+
+
+def probe_all(polling_manager, config_names: Optional[Iterable[str]] = None, timeout: float = 10.0,
+              max_workers: int = 8, on_result: Optional[Callable[[ProbeResult], None]] = None) -> List[ProbeResult]:
+    """
+    并发探测多个配置，每完成一个即回调 on_result，并把结果写入 AI状态。
+    config_names 为空时探测 collect_probe_targets 返回的全部配置。
+    """
+    names = list(config_names) if config_names is not None else collect_probe_targets(polling_manager.polling_list)
+    if not names:
+        return []
+    results: List[ProbeResult] = []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(names))), thread_name_prefix="llm-probe") as executor:
+        futures = [executor.submit(probe_config, polling_manager, name, timeout) for name in names]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            polling_manager.record_probe_result(result.config_name, result.ok, result.latency, result.error)
+            if on_result:
+                try:
+                    on_result(result)
+                except Exception as e:
+                    logging.error(f"探测结果回调执行失败: {e}")
+    order = {name: index for index, name in enumerate(names)}
+    results.sort(key=lambda r: order.get(r.config_name, len(order)))
+    return results
@@ -0,0 +1,145 @@
+# http_transport.py
+# -*- coding: utf-8 -*-
+"""
+统一的HTTP传输层。
+- 按 (代理, 是否校验证书, 目标主机) 复用 httpx 客户端，所有LLM适配器、模型列表查询和Embedding请求共用连接池；
+- 统一设置连接/读取超时和连接池上限，安装了 h2 时启用 HTTP/2；
+- 异步客户端与事件循环绑定，按事件循环分别缓存。
+"""
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class HttpTransport:
+    """
+    共享的 httpx 客户端池。客户端由传输层持有，适配器关闭时不应关闭它们，
+    需要判断时使用 owns()。
+    """
+    def __init__(self, connect_timeout: float = 30.0, read_timeout: float = 600.0,
+                 max_connections: int = 50, max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 60.0, http2: bool = True):
+        self._lock = threading.Lock()
+        self._clients: Dict[Tuple[str, bool, str], httpx.Client] = {}
+        self._async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Tuple[str, bool, str], httpx.AsyncClient]]" = weakref.WeakKeyDictionary()
+        self._owned_ids = set()
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.http2 = http2
+
+    def configure(self, connect_timeout: Optional[float] = None, read_timeout: Optional[float] = None,
+                  max_connections: Optional[int] = None, max_keepalive_connections: Optional[int] = None,
+                  http2: Optional[bool] = None):
+        """更新传输参数。只影响之后新建的客户端，已有客户端保持不变以免中断进行中的请求。"""
+        with self._lock:
+            if connect_timeout is not None:
+                self.connect_timeout = float(connect_timeout)
+            if read_timeout is not None:
+                self.read_timeout = float(read_timeout)
+            if max_connections is not None:
+                self.max_connections = int(max_connections)
+            if max_keepalive_connections is not None:
+                self.max_keepalive_connections = int(max_keepalive_connections)
+            if http2 is not None:
+                self.http2 = bool(http2)
+
+    @staticmethod
+    def make_key(base_url: str, proxy: Optional[str] = None, verify: bool = True) -> Tuple[str, bool, str]:
+        parts = urlsplit(base_url or "")
+        host = f"{parts.scheme}://{parts.netloc}" if parts.netloc else (base_url or "")
+        return (proxy or "", bool(verify), host.lower())
+
+    def _client_options(self, proxy: Optional[str], verify: bool) -> Dict[str, Any]:
+        options: Dict[str, Any] = {
+            "verify": verify,
+            "timeout": httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "http2": self.http2 and HTTP2_AVAILABLE,
+        }
+        if proxy:
+            options["proxies"] = proxy
+        return options
+
+    def get_client(self, base_url: str, proxy: Optional[str] = None, verify: bool = True) -> httpx.Client:
+        """获取访问 base_url 所在主机的共享同步客户端。"""
+        key = self.make_key(base_url, proxy, verify)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.Client(**self._client_options(proxy, verify))
+                self._clients[key] = client
+                self._owned_ids.add(id(client))
+                logging.info(f"已创建共享HTTP客户端: {key[2] or '默认'}{' (代理)' if proxy else ''}")
+            return client
+
+    def get_async_client(self, base_url: str, proxy: Optional[str] = None, verify: bool = True) -> httpx.AsyncClient:
+        """获取当前事件循环中访问 base_url 所在主机的共享异步客户端。"""
+        loop = asyncio.get_running_loop()
+        key = self.make_key(base_url, proxy, verify)
+        with self._lock:
+            clients = self._async_clients.setdefault(loop, {})
+            client = clients.get(key)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(**self._client_options(proxy, verify))
+                clients[key] = client
+                self._owned_ids.add(id(client))
+            return client
+
+    def owns(self, client: Any) -> bool:
+        """判断客户端是否由传输层持有（持有的客户端不应由适配器关闭）。"""
+        return client is not None and id(client) in self._owned_ids
+
+    def request(self, method: str, url: str, proxy: Optional[str] = None, verify: bool = True,
+                timeout: Optional[float] = None, **kwargs) -> httpx.Response:
+        """通过共享客户端发送一次请求。timeout 为读取超时秒数，默认使用传输层设置。"""
+        client = self.get_client(url, proxy, verify)
+        if timeout is not None:
+            kwargs["timeout"] = httpx.Timeout(timeout, connect=min(self.connect_timeout, timeout))
+        return client.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> httpx.Response:
+        return self.request("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "clients": len(self._clients),
+                "hosts": sorted({key[2] for key in self._clients}),
+                "http2": self.http2 and HTTP2_AVAILABLE,
+            }
+
+    def close_all(self):
+        """关闭全部同步客户端（程序退出时调用）。"""
+        with self._lock:
+            clients, self._clients = list(self._clients.values()), {}
+            self._owned_ids.difference_update(id(client) for client in clients)
+        for client in clients:
+            try:
+                client.close()
+            except Exception as e:
+                logging.error(f"关闭共享HTTP客户端时出错: {e}")
+
+
+# 全局共享实例
+http_transport = HttpTransport()
@@ -1,24 +1,31 @@
 # llm_adapters.py
 # -*- coding: utf-8 -*-
+import asyncio
+import atexit
 import logging
 import os
 import json
+import hashlib
 import random
 import time
 import traceback
-import tiktoken
 from datetime import datetime
-from typing import Optional, Tuple, Dict, Any, Iterator
-import requests
+from typing import Optional, Tuple, Dict, Any, Iterator, AsyncIterator
 import httpx
 import config_manager as cm
 import threading
-
-# 创建一个可重用的httpx客户端
-# 在大多数情况下，我们应该启用SSL验证。
-# 仅在连接本地或自签名证书的服务时，才考虑在特定适配器中禁用它。
-http_client = httpx.Client(verify=True)
-logging.info("全局httpx客户端已启用SSL验证。")
+from tokenizer_service import tokenizer_service, resolve_future, estimate_tokens
+from rate_limiter import rate_limiters, RateLimitCancelled
+from log_writer import RotatingLogWriter, get_log_writer, configure_log_writers
+from llm_cache import TRUNCATED_FINISH_REASONS, response_cache
+# 所有适配器的HTTP连接都通过共享传输层获取，按 (代理, 证书校验, 主机) 复用
+from http_transport import http_transport
+from think_filter import ThinkTagFilter, REASONING_KEEP, normalize_reasoning_mode, strip_think
+from utils import replace_file_atomically
+
+class LLMRequestCancelled(Exception):
+    """调用被主动取消（例如对冲请求中落败的一方），不应重试。"""
+    pass
 
 def check_base_url(url: str) -> str:
     """处理base_url的规则"""
@@ -48,7 +55,11 @@ class BaseLLMAdapter:
         self.top_p = llm_config.get("top_p", 0.9)
         self.timeout = llm_config.get("timeout", 600)
         self.proxy = llm_config.get("proxy", "")
+        # 仅在连接本地或自签名证书的服务时才应关闭证书校验
+        self.verify_ssl = llm_config.get("verify_ssl", True)
         self.step_name = llm_config.get("step_name", "未指定步骤")
+        # 不带调用前缀和章节信息的步骤名（step_name 会被改写为用于日志的完整名称），响应缓存按它判断是否启用
+        self.cache_step: Optional[str] = llm_config.get("step_name")
         self.config_name = llm_config.get("config_name", "Unknown")
 
         # 初始化日志文件路径
@@ -56,28 +67,143 @@ class BaseLLMAdapter:
         os.makedirs(log_dir, exist_ok=True)
         self.log_file = os.path.join(log_dir, "polling_run.log")
         self.error_log_file = os.path.join(log_dir, "polling_error.log")
-
-        # 初始化tiktoken编码器
-        try:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        except Exception as e:
-            logging.warning(f"无法加载tiktoken编码器: {e}，Token数量将无法计算。")
-            self.tokenizer = None
+        # 日志由后台写入器批量落盘，调用线程不会阻塞在磁盘I/O上
+        self.run_log_writer = get_log_writer(self.log_file)
+        self.error_log_writer = get_log_writer(self.error_log_file)
+
+        # 服务端返回的用量信息（如 stream_options.include_usage），优先于本地计数
+        self.last_usage: Optional[Dict[str, int]] = None
+        # 最近一次调用的结束原因（如 stop、length），接口未返回时为 None
+        self.last_finish_reason: Optional[str] = None
+        # 是否在流式请求中要求服务端返回用量信息（仅OpenAI兼容接口）
+        self.stream_include_usage = llm_config.get("stream_include_usage", True)
+        # 是否为提示词的稳定前缀启用服务端缓存标记（目前用于 Anthropic cache_control）
+        self.prompt_prefix_cache = llm_config.get("prompt_prefix_cache", True)
+
+        # 流式调用收到第一个分片时的回调（对冲请求用它判断哪一路先出字）
+        self.on_first_chunk = None
+        # 推理模型的思考内容（<think> 块或 reasoning_content）不进入正文，设置时交给此回调
+        self.reasoning_mode = normalize_reasoning_mode(llm_config.get("reasoning_mode"))
+        self.on_reasoning = None
+        self._first_output_time: Optional[datetime] = None
+        self._first_answer_time: Optional[datetime] = None
+        self._reasoning_chars = 0
+        # 步骤重试预算，由 execute_with_polling 在借出后挂载
+        self.retry_budget = None
+        # 中断续写状态（novel_generator.stream_salvage.StreamSalvage），同样由 execute_with_polling 挂载
+        self.stream_salvage = None
+        # 步骤是否启用结构化输出，由 execute_with_polling 挂载
+        self.structured_output = False
+        # 请求级对冲（novel_generator.common._RequestHedge），由 execute_with_polling 挂载；
+        # 挂载后流式请求由它决定实际发出请求的适配器，只重复发出请求本身，不重复执行步骤函数
+        self.hedge = None
+        # 结构化输出调用期间的输出定义（novel_generator.structured_output.OutputSpec），由 invoke_structured 设置
+        self.response_schema = None
+        # OpenAI兼容接口的结构化输出方式：json_schema / json_object / prompt（只在提示词中说明）
+        self.structured_output_format = llm_config.get("structured_output_format", "json_schema")
+        # 最近一次调用记录的 (输入Token, 输出Token)
+        self.last_invocation_tokens: Tuple[int, int] = (0, 0)
+        # 最近一次实际请求的首字延迟与生成速度，供自适应轮询统计（命中缓存时为 None）
+        self.last_call_stats: Optional[Dict[str, float]] = None
+        # 最近一次调用对应的缓存键（未启用缓存时为 None），供 reject_cached_response 删除无效条目
+        self.last_cache_key: Optional[str] = None
+        self._cancel_event = threading.Event()
+        self._active_response = None
+
+        # 客户端限流：同一 base_url + api_key 的所有适配器共享 RPM/TPM 配额（0 表示不限制）
+        self.rate_limiter = rate_limiters.get(self.base_url, self.api_key,
+                                              llm_config.get("rpm_limit", 0), llm_config.get("tpm_limit", 0))
 
     def _calculate_tokens(self, text: str) -> int:
-        """使用tiktoken计算文本的token数量"""
-        if not self.tokenizer or not text:
-            return 0
-        try:
-            return len(self.tokenizer.encode(text))
-        except Exception as e:
-            logging.error(f"计算token时出错: {e}")
-            return 0
+        """使用共享的Token计数服务计算文本的token数量"""
+        return tokenizer_service.count(text)
 
-    def _log_invocation(self, start_time: datetime, prompt: str, response: str, input_tokens: int, output_tokens: int):
-        """记录一次完整的LLM调用日志"""
+    def _record_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int],
+                      cached_tokens: Optional[int] = None, cache_write_tokens: Optional[int] = None):
+        """记录服务端报告的Token用量，cached_tokens 为命中前缀缓存的输入Token数。"""
+        if prompt_tokens is None and completion_tokens is None:
+            return
+        self.last_usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+        }
+        if cached_tokens is not None:
+            self.last_usage["cached_tokens"] = cached_tokens
+        if cache_write_tokens is not None:
+            self.last_usage["cache_write_tokens"] = cache_write_tokens
+
+    def _record_openai_usage(self, chunk):
+        """从OpenAI兼容接口的流式分片中提取用量（include_usage 时最后一个分片携带）和结束原因。"""
+        choices = getattr(chunk, "choices", None)
+        if choices and getattr(choices[0], "finish_reason", None):
+            self.last_finish_reason = choices[0].finish_reason
+        usage = getattr(chunk, "usage", None)
+        if usage:
+            # OpenAI 在 prompt_tokens_details.cached_tokens 中返回，DeepSeek 使用 prompt_cache_hit_tokens
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached_tokens = getattr(details, "cached_tokens", None) if details else None
+            if cached_tokens is None:
+                cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None)
+            self._record_usage(getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None), cached_tokens)
+
+    def _record_langchain_usage(self, response):
+        """从 LangChain 消息的 usage_metadata 中提取用量。"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage:
+            details = usage.get("input_token_details") or {}
+            self._record_usage(usage.get("input_tokens"), usage.get("output_tokens"),
+                               details.get("cache_read"), details.get("cache_creation"))
+
+    def _record_anthropic_usage(self, usage):
+        """记录 Anthropic 响应的用量。其 input_tokens 不含缓存部分，这里合并为总输入Token数。"""
+        if not usage:
+            return
+        cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+        cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+        self._record_usage((usage.input_tokens or 0) + cache_read + cache_write, usage.output_tokens,
+                           cache_read, cache_write)
+
+    def _split_cache_prefix(self, prompt: str) -> Tuple[Optional[str], str]:
+        """拆分出提示词中可缓存的稳定前缀（见 novel_generator.prompt_prefix），没有时返回 (None, prompt)。"""
+        prefix = getattr(prompt, "cache_prefix", None)
+        if not self.prompt_prefix_cache or not prefix or not prompt.startswith(prefix):
+            return None, prompt
+        return prefix, prompt[len(prefix):]
+
+    def _stream_options(self) -> Dict[str, Any]:
+        """OpenAI兼容流式请求的额外参数。"""
+        return {"stream_options": {"include_usage": True}} if self.stream_include_usage else {}
+
+    def _response_format_options(self) -> Dict[str, Any]:
+        """结构化输出调用时OpenAI兼容请求的 response_format 参数。"""
+        spec = self.response_schema
+        if spec is None or self.structured_output_format == "prompt":
+            return {}
+        if self.structured_output_format == "json_object":
+            return {"response_format": {"type": "json_object"}}
+        return {"response_format": {"type": "json_schema", "json_schema": {
+            "name": spec.name, "description": spec.description, "schema": spec.schema}}}
+
+    def _resolve_token_counts(self, prompt_future, output_tokens: int) -> Tuple[int, int]:
+        """优先采用服务端报告的用量，缺失时回退到本地计数。"""
+        usage = self.last_usage or {}
+        input_tokens = usage.get("prompt_tokens")
+        if input_tokens is None:
+            input_tokens = resolve_future(prompt_future)
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = output_tokens
+        return input_tokens, completion_tokens
+
+    def _log_invocation(self, start_time: datetime, prompt: str, response: str, input_tokens: int, output_tokens: int,
+                        cache_hit: bool = False, first_chunk_time: Optional[datetime] = None,
+                        first_answer_time: Optional[datetime] = None, reasoning_chars: int = 0):
+        """记录一次完整的LLM调用日志。first_answer_time 为首个正文分片的时间，与首个分片不同时说明模型先输出了思考内容。"""
         end_time = datetime.now()
         duration = (end_time - start_time).total_seconds()
+        # 非流式调用没有首个分片时间，以整体耗时作为首字延迟
+        ttft = ((first_chunk_time or end_time) - start_time).total_seconds()
+        generation_seconds = (end_time - (first_chunk_time or start_time)).total_seconds()
         
         log_entry = {
             "timestamp": time.strftime('%Y-%m-%d %H:%M:%S'),
@@ -90,12 +216,29 @@ class BaseLLMAdapter:
             "prompt": prompt,
             "response": response
         }
+        self.last_invocation_tokens = (input_tokens or 0, output_tokens or 0)
+        if cache_hit:
+            log_entry["cache_hit"] = True
+            self.last_call_stats = None
+        else:
+            if first_chunk_time is not None:
+                log_entry["ttft_seconds"] = round(ttft, 2)
+            self.last_call_stats = {
+                "ttft": ttft,
+                "tokens_per_sec": (output_tokens or 0) / generation_seconds if generation_seconds > 0 else 0.0,
+            }
+            if reasoning_chars:
+                log_entry["reasoning_chars"] = reasoning_chars
+            if first_answer_time is not None and reasoning_chars:
+                ttfat = (first_answer_time - start_time).total_seconds()
+                log_entry["ttfat_seconds"] = round(ttfat, 2)
+                self.last_call_stats["ttfat"] = ttfat
+            usage = self.last_usage or {}
+            for key in ("cached_tokens", "cache_write_tokens"):
+                if usage.get(key) is not None:
+                    log_entry[key] = usage[key]
         
-        try:
-            with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logging.error(f"写入LLM调用日志失败: {e}")
+        self.run_log_writer.write(log_entry)
 
     def _log_error(self, prompt: str, error: Exception):
         """记录一次LLM调用错误日志"""
@@ -109,11 +252,7 @@ class BaseLLMAdapter:
             "traceback": traceback.format_exc()
         }
         
-        try:
-            with open(self.error_log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
-        except Exception as e:
-            logging.error(f"写入LLM错误日志失败: {e}")
+        self.error_log_writer.write(log_entry)
 
     def get_config(self) -> dict:
         return self.llm_config
@@ -121,42 +260,255 @@ class BaseLLMAdapter:
     def get_config_name(self) -> str:
         return self.config_name
 
+    def _cache_fingerprint(self) -> Dict[str, Any]:
+        """参与缓存键计算的模型与生成参数。"""
+        return {
+            "adapter": type(self).__name__,
+            "base_url": self.base_url,
+            "model": self.model_name,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "top_p": self.top_p,
+        }
+
+    def _cache_lookup(self, prompt: str) -> Tuple[Optional[str], Optional[Dict[str, Any]]]:
+        """当前步骤启用了响应缓存时返回 (缓存键, 命中的条目)，否则返回 (None, None)。"""
+        self.last_cache_key = None
+        if not response_cache.is_enabled_for(self.cache_step):
+            return None, None
+        key = response_cache.make_key(self._cache_fingerprint(), prompt)
+        self.last_cache_key = key
+        return key, response_cache.get(key)
+
+    def _cache_store(self, key: Optional[str], response: str, input_tokens: int, output_tokens: int):
+        """只缓存完整且成功的响应：出错或因长度上限被截断的响应不缓存。"""
+        if not key or not response or response.startswith("Error:"):
+            return
+        if self.last_finish_reason in TRUNCATED_FINISH_REASONS:
+            logging.info(f"步骤 '{self.step_name}' 的响应因长度上限被截断（{self.last_finish_reason}），不写入缓存。")
+            return
+        response_cache.put(key, response, step=self.cache_step, model=self.model_name,
+                           input_tokens=input_tokens, output_tokens=output_tokens)
+
+    def reject_cached_response(self):
+        """
+        调用方判定最近一次响应无效（如结构化输出校验失败）时调用：删除其缓存条目，
+        使重试重新请求服务端，而不是反复回放同一个无效结果。
+        """
+        key = self.last_cache_key
+        self.last_cache_key = None
+        if key and response_cache.discard(key):
+            logging.info(f"步骤 '{self.step_name}' 的响应未通过校验，已删除对应的缓存条目。")
+
     def invoke(self, prompt: str) -> str:
         """模板方法：执行非流式调用并记录日志"""
         start_time = datetime.now()
-        input_tokens = self._calculate_tokens(prompt)
+        self.last_usage = None
+        self.last_call_stats = None
+        self.last_finish_reason = None
+        cache_key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            logging.info(f"步骤 '{self.step_name}' 命中响应缓存，跳过LLM调用。")
+            self._log_invocation(start_time, prompt, cached["response"], 0, 0, cache_hit=True)
+            return cached["response"]
+        reserved_tokens = self._acquire_rate_limit(prompt)
+        # 提示词的Token计数在后台线程中与请求并行进行
+        prompt_tokens_future = tokenizer_service.count_async(prompt)
         response_content = ""
+        succeeded = False
+        self._reset_reasoning_state()
         try:
-            response_content = self._invoke(prompt)
+            response_content = self._strip_reasoning(self._invoke(prompt))
+            succeeded = True
         except Exception as e:
             logging.error(f"LLM调用失败 ({self.config_name}/{self.model_name}): {e}")
             self._log_error(prompt, e)
             response_content = f"Error: {e}"
         finally:
-            output_tokens = self._calculate_tokens(response_content)
-            self._log_invocation(start_time, prompt, response_content, input_tokens, output_tokens)
+            usage = self.last_usage or {}
+            local_output_tokens = 0 if usage.get("completion_tokens") is not None else self._calculate_tokens(response_content)
+            input_tokens, output_tokens = self._resolve_token_counts(prompt_tokens_future, local_output_tokens)
+            self._log_invocation(start_time, prompt, response_content, input_tokens, output_tokens,
+                                 reasoning_chars=self._reasoning_chars)
+            self._settle_rate_limit(reserved_tokens, input_tokens, output_tokens, succeeded)
+        self._cache_store(cache_key, response_content, input_tokens, output_tokens)
         return response_content
 
     def invoke_stream(self, prompt: str) -> Iterator[str]:
-        """模板方法：执行流式调用并记录日志"""
+        """执行流式调用。挂载了对冲时交给对冲对象，否则直接由本适配器请求。"""
+        hedge = self.hedge
+        if hedge is not None:
+            return hedge.stream(self, prompt)
+        return self._logged_stream(prompt)
+
+    def _logged_stream(self, prompt: str) -> Iterator[str]:
+        """模板方法：由本适配器执行流式调用并记录日志"""
         start_time = datetime.now()
-        input_tokens = self._calculate_tokens(prompt)
-        full_response = ""
+        self.last_usage = None
+        self.last_call_stats = None
+        self.last_finish_reason = None
+        if self._cancel_event.is_set():
+            raise LLMRequestCancelled(f"适配器 '{self.config_name}' 的调用已被取消。")
+        cache_key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            logging.info(f"步骤 '{self.step_name}' 命中响应缓存，回放缓存的流式输出。")
+            self._notify_first_chunk()
+            yield from response_cache.replay(cached["response"])
+            self._log_invocation(start_time, prompt, cached["response"], 0, 0, cache_hit=True)
+            return
+        reserved_tokens = self._acquire_rate_limit(prompt)
+        prompt_tokens_future = tokenizer_service.count_async(prompt)
+        output_counter = tokenizer_service.stream_counter()
+        response_parts = []
+        completed = False
+        self._reset_reasoning_state()
+        think_filter = None if self.reasoning_mode == REASONING_KEEP else ThinkTagFilter()
         
+        stream = None
         try:
             stream = self._invoke_stream(prompt)
             for chunk in stream:
-                full_response += chunk
-                yield chunk
+                if self._cancel_event.is_set():
+                    raise LLMRequestCancelled(f"适配器 '{self.config_name}' 的调用已被取消。")
+                # 输出Token按原始分片（含思考内容）计数，调用方只收到正文
+                output_counter.feed(chunk)
+                answer = self._filter_chunk(think_filter, chunk)
+                if answer:
+                    response_parts.append(answer)
+                    yield answer
+            answer = self._filter_chunk(think_filter, None)
+            if answer:
+                response_parts.append(answer)
+                yield answer
+            completed = True
         except Exception as e:
+            if self._cancel_event.is_set():
+                # 主动取消导致的连接中断不是服务端错误，不写入错误日志
+                logging.info(f"LLM流式调用已取消 ({self.config_name}/{self.model_name})。")
+                raise LLMRequestCancelled(f"适配器 '{self.config_name}' 的调用已被取消。") from e
             logging.error(f"LLM流式调用失败 ({self.config_name}/{self.model_name}): {e}")
             self._log_error(prompt, e)
             # 关键修复：重新抛出异常，而不是yield一个错误字符串
             # 这将允许上层调用者捕获它并触发轮询切换
             raise
         finally:
-            output_tokens = self._calculate_tokens(full_response)
-            self._log_invocation(start_time, prompt, full_response, input_tokens, output_tokens)
+            if not completed:
+                # 调用方提前结束（如结构化输出校验失败）或出错时立即关闭HTTP连接，不再接收剩余输出
+                self._close_active_stream(stream)
+            self._active_response = None
+            input_tokens, output_tokens = self._resolve_token_counts(prompt_tokens_future, output_counter.total)
+            self._log_invocation(start_time, prompt, "".join(response_parts), input_tokens, output_tokens,
+                                 first_chunk_time=self._first_output_time, first_answer_time=self._first_answer_time,
+                                 reasoning_chars=self._reasoning_chars)
+            self._settle_rate_limit(reserved_tokens, input_tokens, output_tokens, bool(response_parts))
+            # 被中途取消或出错的流不写入缓存
+            if completed:
+                self._cache_store(cache_key, "".join(response_parts), input_tokens, output_tokens)
+
+    def _acquire_rate_limit(self, prompt: str) -> int:
+        """在限流队列中等待配额，返回按提示词估算预扣的Token数。"""
+        if self.rate_limiter is None:
+            return 0
+        reserved = estimate_tokens(prompt)
+        try:
+            self.rate_limiter.acquire(reserved, self._cancel_event)
+        except RateLimitCancelled as e:
+            raise LLMRequestCancelled(str(e)) from e
+        return reserved
+
+    def _settle_rate_limit(self, reserved: int, input_tokens: int, output_tokens: int, succeeded: bool):
+        """调用结束后按实际用量修正预扣的Token；请求未产生任何输出时退还预扣部分。"""
+        if self.rate_limiter is None:
+            return
+        if succeeded:
+            self.rate_limiter.adjust((input_tokens or 0) + (output_tokens or 0) - reserved)
+        else:
+            self.rate_limiter.adjust(-reserved)
+
+    def _notify_first_chunk(self):
+        callback = self.on_first_chunk
+        if callback:
+            try:
+                callback()
+            except Exception as e:
+                logging.error(f"首个分片回调执行失败: {e}")
+
+    def _reset_reasoning_state(self):
+        self._first_output_time = None
+        self._first_answer_time = None
+        self._reasoning_chars = 0
+
+    def _mark_output(self, answer: bool):
+        """记录首个分片（含思考内容）与首个正文分片的时间。"""
+        now = datetime.now()
+        if self._first_output_time is None:
+            self._first_output_time = now
+            self._notify_first_chunk()
+        if answer and self._first_answer_time is None:
+            self._first_answer_time = now
+
+    def _emit_reasoning(self, text: str):
+        """思考内容的分流出口：计数并交给 on_reasoning，不进入正文。"""
+        if not text:
+            return
+        self._mark_output(answer=False)
+        self._reasoning_chars += len(text)
+        callback = self.on_reasoning
+        if callback:
+            try:
+                callback(text)
+            except Exception as e:
+                logging.error(f"思考内容回调执行失败: {e}")
+
+    def _route_reasoning_delta(self, delta):
+        """OpenAI兼容接口中单独返回的思考内容（DeepSeek 的 reasoning_content，部分服务为 reasoning）。"""
+        if self.reasoning_mode == REASONING_KEEP or delta is None:
+            return
+        reasoning = getattr(delta, "reasoning_content", None) or getattr(delta, "reasoning", None)
+        if isinstance(reasoning, str):
+            self._emit_reasoning(reasoning)
+
+    def _filter_chunk(self, think_filter: Optional[ThinkTagFilter], chunk: Optional[str]) -> str:
+        """用流式过滤器拆出正文；chunk 为 None 表示流已结束，放行残留内容。"""
+        if think_filter is None:
+            answer = chunk or ""
+        else:
+            answer, reasoning = think_filter.flush() if chunk is None else think_filter.feed(chunk)
+            self._emit_reasoning(reasoning)
+        if chunk:
+            self._mark_output(answer=bool(answer))
+        elif answer:
+            self._mark_output(answer=True)
+        return answer
+
+    def _strip_reasoning(self, text: str) -> str:
+        if self.reasoning_mode == REASONING_KEEP or not text:
+            return text
+        return strip_think(text, self._emit_reasoning)
+
+    def _close_active_stream(self, stream):
+        response = self._active_response
+        for closable in (stream, response):
+            if closable is not None and hasattr(closable, "close"):
+                try:
+                    closable.close()
+                except Exception as e:
+                    logging.debug(f"关闭适配器 '{self.config_name}' 的响应流时出错: {e}")
+
+    def cancel(self):
+        """
+        取消正在进行的流式调用：设置取消标记并关闭当前响应，中断该次请求的HTTP连接。
+        通过传输层共享的客户端不会被关闭，同一连接池中其他适配器的请求不受影响；适配器自己创建的客户端随 close() 关闭。
+        Azure AI 与 Gemini 使用各自 SDK 的连接，不经过传输层。被取消的适配器不会再被放回适配器池。
+        """
+        self._cancel_event.set()
+        response = self._active_response
+        if response is not None and hasattr(response, "close"):
+            try:
+                response.close()
+            except Exception as e:
+                logging.debug(f"关闭适配器 '{self.config_name}' 的响应流时出错: {e}")
+        self.close()
 
     def _invoke(self, prompt: str) -> str:
         raise NotImplementedError("Subclasses must implement ._invoke(prompt) method.")
@@ -164,6 +516,101 @@ class BaseLLMAdapter:
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
         raise NotImplementedError("Subclasses must implement ._invoke_stream() method.")
 
+    async def ainvoke(self, prompt: str) -> str:
+        """异步模板方法：执行非流式调用并记录日志，与 invoke 的日志和Token统计一致"""
+        start_time = datetime.now()
+        self.last_usage = None
+        self.last_call_stats = None
+        self.last_finish_reason = None
+        cache_key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            self._log_invocation(start_time, prompt, cached["response"], 0, 0, cache_hit=True)
+            return cached["response"]
+        reserved_tokens = await asyncio.to_thread(self._acquire_rate_limit, prompt) if self.rate_limiter else 0
+        prompt_tokens_future = tokenizer_service.count_async(prompt)
+        response_content = ""
+        succeeded = False
+        self._reset_reasoning_state()
+        try:
+            response_content = self._strip_reasoning(await self._ainvoke(prompt))
+            succeeded = True
+        except Exception as e:
+            logging.error(f"LLM异步调用失败 ({self.config_name}/{self.model_name}): {e}")
+            self._log_error(prompt, e)
+            response_content = f"Error: {e}"
+        finally:
+            usage = self.last_usage or {}
+            local_output_tokens = 0 if usage.get("completion_tokens") is not None else self._calculate_tokens(response_content)
+            input_tokens, output_tokens = self._resolve_token_counts(prompt_tokens_future, local_output_tokens)
+            self._log_invocation(start_time, prompt, response_content, input_tokens, output_tokens,
+                                 reasoning_chars=self._reasoning_chars)
+            self._settle_rate_limit(reserved_tokens, input_tokens, output_tokens, succeeded)
+        self._cache_store(cache_key, response_content, input_tokens, output_tokens)
+        return response_content
+
+    async def ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        """异步模板方法：执行流式调用并记录日志，与 invoke_stream 的日志和Token统计一致"""
+        start_time = datetime.now()
+        self.last_usage = None
+        self.last_call_stats = None
+        self.last_finish_reason = None
+        cache_key, cached = self._cache_lookup(prompt)
+        if cached is not None:
+            for chunk in response_cache.replay(cached["response"]):
+                yield chunk
+            self._log_invocation(start_time, prompt, cached["response"], 0, 0, cache_hit=True)
+            return
+        reserved_tokens = await asyncio.to_thread(self._acquire_rate_limit, prompt) if self.rate_limiter else 0
+        prompt_tokens_future = tokenizer_service.count_async(prompt)
+        output_counter = tokenizer_service.stream_counter()
+        response_parts = []
+        completed = False
+        self._reset_reasoning_state()
+        think_filter = None if self.reasoning_mode == REASONING_KEEP else ThinkTagFilter()
+
+        try:
+            async for chunk in self._ainvoke_stream(prompt):
+                output_counter.feed(chunk)
+                answer = self._filter_chunk(think_filter, chunk)
+                if answer:
+                    response_parts.append(answer)
+                    yield answer
+            answer = self._filter_chunk(think_filter, None)
+            if answer:
+                response_parts.append(answer)
+                yield answer
+            completed = True
+        except Exception as e:
+            logging.error(f"LLM异步流式调用失败 ({self.config_name}/{self.model_name}): {e}")
+            self._log_error(prompt, e)
+            raise
+        finally:
+            input_tokens, output_tokens = self._resolve_token_counts(prompt_tokens_future, output_counter.total)
+            self._log_invocation(start_time, prompt, "".join(response_parts), input_tokens, output_tokens,
+                                 first_chunk_time=self._first_output_time, first_answer_time=self._first_answer_time,
+                                 reasoning_chars=self._reasoning_chars)
+            self._settle_rate_limit(reserved_tokens, input_tokens, output_tokens, bool(response_parts))
+            if completed:
+                self._cache_store(cache_key, "".join(response_parts), input_tokens, output_tokens)
+
+    async def _ainvoke(self, prompt: str) -> str:
+        """默认实现：在线程中执行同步调用。有原生异步SDK的子类应覆盖此方法。"""
+        return await asyncio.to_thread(self._invoke, prompt)
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        """默认实现：在线程中逐块拉取同步流。有原生异步SDK的子类应覆盖此方法。"""
+        iterator = iter(self._invoke_stream(prompt))
+        sentinel = object()
+        while True:
+            chunk = await asyncio.to_thread(next, iterator, sentinel)
+            if chunk is sentinel:
+                break
+            yield chunk
+
+    def get_probe_headers(self) -> Dict[str, str]:
+        """启动探测使用的认证头，须与该接口实际调用时的认证方式一致（默认为 OpenAI 兼容的 Bearer）。"""
+        return {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+
     def get_available_models(self) -> list:
         try:
             return self._fetch_models()
@@ -174,10 +621,24 @@ class BaseLLMAdapter:
     def _fetch_models(self) -> list:
         return []
 
+    async def aclose(self):
+        """关闭与此适配器关联的异步客户端连接。"""
+        client = getattr(self, "_async_client", None)
+        if client is not None:
+            # 底层连接来自传输层共享池时只释放引用，不关闭连接
+            if not http_transport.owns(getattr(client, "_client", None)):
+                try:
+                    await client.close()
+                except Exception as e:
+                    logging.error(f"关闭适配器 '{self.config_name}' 的异步客户端时出错: {e}")
+            self._async_client = None
+
     def close(self):
         """关闭与此适配器关联的网络连接。"""
+        self._closed = True
         # 检查 self.client 是否存在并且有 close 方法
-        if hasattr(self, 'client') and self.client and hasattr(self.client, 'close'):
+        # 传输层的共享客户端被多个适配器复用，不能随单个适配器一起关闭
+        if hasattr(self, 'client') and self.client and not http_transport.owns(self.client) and hasattr(self.client, 'close'):
             try:
                 self.client.close()
                 logging.info(f"适配器 '{self.config_name}' 的 httpx 客户端已关闭。")
@@ -188,32 +649,92 @@ class BaseLLMAdapter:
         if hasattr(self, '_stream_client') and self._stream_client and hasattr(self._stream_client, '_client') and hasattr(self._stream_client._client, 'close'):
             try:
                 # 检查是否与 self.client 是同一个对象，避免重复关闭
-                if self._stream_client._client is not self.client:
+                if self._stream_client._client is not self.client and not http_transport.owns(self._stream_client._client):
                     self._stream_client._client.close()
                     logging.info(f"适配器 '{self.config_name}' 的流式客户端已关闭。")
             except Exception as e:
                 logging.error(f"关闭适配器 '{self.config_name}' 的流式客户端时出错: {e}")
 
 
-class DeepSeekAdapter(BaseLLMAdapter):
+class OpenAICompatibleAsyncMixin:
+    """
+    为OpenAI兼容接口的适配器提供基于 AsyncOpenAI + httpx.AsyncClient 的原生异步调用。
+    异步客户端与创建它的事件循环绑定，在其他事件循环中使用时会重新创建。
+    """
+    _async_default_headers: Dict[str, str] = {"User-Agent": "Mozilla/5.0"}
+
+    def _get_async_client(self):
+        from openai import AsyncOpenAI
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_async_client", None) is None or getattr(self, "_async_client_loop", None) is not loop:
+            timeout_config = httpx.Timeout(self.timeout, connect=http_transport.connect_timeout)
+            async_http_client = http_transport.get_async_client(self.base_url, self.proxy, self.verify_ssl)
+            self._async_client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=timeout_config,
+                http_client=async_http_client,
+                default_headers=self._async_default_headers
+            )
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def _ainvoke(self, prompt: str) -> str:
+        client = self._get_async_client()
+        response = await client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens
+        )
+        if response.usage:
+            self._record_usage(response.usage.prompt_tokens, response.usage.completion_tokens)
+        return response.choices[0].message.content if response and response.choices else ""
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        client = self._get_async_client()
+        response = await client.chat.completions.create(
+            model=self.model_name,
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+            temperature=self.temperature,
+            top_p=self.top_p,
+            max_tokens=self.max_tokens,
+            **self._stream_options(),
+            **self._response_format_options()
+        )
+        async for chunk in response:
+            self._record_openai_usage(chunk)
+            if chunk.choices:
+                self._route_reasoning_delta(chunk.choices[0].delta)
+                content = chunk.choices[0].delta.content
+                if content is not None and content != "":
+                    yield content
+
+class DeepSeekAdapter(OpenAICompatibleAsyncMixin, BaseLLMAdapter):
     def __init__(self, llm_config: Dict[str, Any]):
         from langchain_openai import ChatOpenAI
         from openai import OpenAI
         super().__init__(llm_config)
         self.base_url = check_base_url(self.base_url)
+        # DeepSeek 的 response_format 只支持 json_object
+        self.structured_output_format = llm_config.get("structured_output_format", "json_object")
         default_headers = {"User-Agent": "Mozilla/5.0"}
-        self._client = ChatOpenAI(model=self.model_name, api_key=self.api_key, base_url=self.base_url, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, default_headers=default_headers)
+        http_client = http_transport.get_client(self.base_url, self.proxy, self.verify_ssl)
+        self._client = ChatOpenAI(model=self.model_name, api_key=self.api_key, base_url=self.base_url, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, default_headers=default_headers, http_client=http_client)
         self._stream_client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, default_headers=default_headers, http_client=http_client)
         self.client = self._stream_client._client
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
         # 增加超时并处理keep-alive信号
         # DeepSeek文档提到高负载时会有长达30分钟的等待
-        timeout_config = httpx.Timeout(600.0, connect=60.0)
+        timeout_config = httpx.Timeout(600.0, connect=http_transport.connect_timeout)
         streaming_client_with_timeout = self.llm_config.get("_stream_client") or self._stream_client
         if hasattr(streaming_client_with_timeout, 'timeout'):
             streaming_client_with_timeout.timeout = timeout_config
@@ -224,11 +745,16 @@ class DeepSeekAdapter(BaseLLMAdapter):
             stream=True,
             temperature=self.temperature,
             top_p=self.top_p,
-            max_tokens=self.max_tokens
+            max_tokens=self.max_tokens,
+            **self._stream_options(),
+            **self._response_format_options()
         )
+        self._active_response = response  # 供 cancel() 关闭该HTTP连接
         for chunk in response:
+            self._record_openai_usage(chunk)
             # 保留仅包含换行的分片，避免结构化文本在流式拼接时丢失行边界
             if chunk.choices:
+                self._route_reasoning_delta(chunk.choices[0].delta)
                 content = chunk.choices[0].delta.content
                 if content is not None and content != "":
                     yield content
@@ -236,31 +762,24 @@ class DeepSeekAdapter(BaseLLMAdapter):
     def _fetch_models(self) -> list:
         try:
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(f"{self.base_url}/models", headers=headers)
+            response = http_transport.get(f"{self.base_url}/models", proxy=self.proxy, verify=self.verify_ssl, timeout=20, headers=headers)
             if response.status_code == 200:
                 return [model["id"] for model in response.json().get("data", [])]
         except Exception:
             pass
         return ["deepseek-chat", "deepseek-coder"]
 
-class OpenAIAdapter(BaseLLMAdapter):
+class OpenAIAdapter(OpenAICompatibleAsyncMixin, BaseLLMAdapter):
     def __init__(self, llm_config: Dict[str, Any]):
         from langchain_openai import ChatOpenAI
         from openai import OpenAI
         super().__init__(llm_config)
         self.base_url = check_base_url(self.base_url)
-        # 如果设置了代理，则为这个特定的适配器创建一个新的、带有代理的客户端实例
-        # 否则，使用全局的http_client
         default_headers = {"User-Agent": "Mozilla/5.0"}
         # 为所有操作设置统一且延长的超时
-        timeout_config = httpx.Timeout(self.timeout, connect=60.0)
-        
-        http_client_instance = httpx.Client(
-            proxies=self.proxy, 
-            verify=True, 
-            headers=default_headers,
-            timeout=timeout_config
-        ) if self.proxy else httpx.Client(verify=True, headers=default_headers, timeout=timeout_config)
+        timeout_config = httpx.Timeout(self.timeout, connect=http_transport.connect_timeout)
+        # 连接由传输层按 (代理, 证书校验, 主机) 共享
+        http_client_instance = http_transport.get_client(self.base_url, self.proxy, self.verify_ssl)
         
         self._client = ChatOpenAI(
             model=self.model_name, 
@@ -284,6 +803,7 @@ class OpenAIAdapter(BaseLLMAdapter):
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
@@ -296,12 +816,17 @@ class OpenAIAdapter(BaseLLMAdapter):
             stream=True,
             temperature=self.temperature,
             top_p=self.top_p,
-            max_tokens=self.max_tokens
+            max_tokens=self.max_tokens,
+            **self._stream_options(),
+            **self._response_format_options()
         )
+        self._active_response = response  # 供 cancel() 关闭该HTTP连接
         for chunk in response:
+            self._record_openai_usage(chunk)
             try:
                 # 保留仅包含换行的分片，避免结构化文本在流式拼接时丢失行边界
                 if chunk.choices:
+                    self._route_reasoning_delta(chunk.choices[0].delta)
                     content = chunk.choices[0].delta.content
                     if content is not None and content != "":
                         yield content
@@ -312,11 +837,9 @@ class OpenAIAdapter(BaseLLMAdapter):
                 logging.warning(f"处理OpenAI流块时发生未知错误: {e}")
 
     def _fetch_models(self) -> list:
-        import urllib3
         try:
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            # 移除 verify=False，使用默认的安全SSL验证
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=20)
+            response = http_transport.get(f"{self.base_url}/models", proxy=self.proxy, verify=self.verify_ssl, timeout=20, headers=headers)
             if response.status_code == 200:
                 data = response.json()
                 if "data" in data:
@@ -333,6 +856,16 @@ class GeminiAdapter(BaseLLMAdapter):
         self._configure_genai()
         self._model = self.genai.GenerativeModel(self.model_name)
 
+    def get_probe_headers(self) -> Dict[str, str]:
+        return {"x-goog-api-key": self.api_key} if self.api_key else {}
+
+    def _generation_config(self):
+        options = {"max_output_tokens": self.max_tokens, "temperature": self.temperature}
+        if self.response_schema is not None:
+            # 结构化输出调用：要求直接返回 JSON
+            options["response_mime_type"] = "application/json"
+        return self.genai.types.GenerationConfig(**options)
+
     def _configure_genai(self):
         if self.proxy:
             os.environ['https_proxy'] = self.proxy
@@ -349,7 +882,7 @@ class GeminiAdapter(BaseLLMAdapter):
         self.genai.configure(api_key=self.api_key, client_options=client_options)
 
     def _invoke(self, prompt: str) -> str:
-        response = self._model.generate_content(prompt, generation_config=self.genai.types.GenerationConfig(max_output_tokens=self.max_tokens, temperature=self.temperature))
+        response = self._model.generate_content(prompt, generation_config=self._generation_config())
         # 增加对 response.candidates 是否存在的检查
         if response and response.candidates:
             return response.text
@@ -362,10 +895,7 @@ class GeminiAdapter(BaseLLMAdapter):
         # Gemini API也可能发送空块作为keep-alive信号
         response = self._model.generate_content(
             prompt,
-            generation_config=self.genai.types.GenerationConfig(
-                max_output_tokens=self.max_tokens,
-                temperature=self.temperature
-            ),
+            generation_config=self._generation_config(),
             stream=True,
             request_options={"timeout": 1800} # 设置长超时
         )
@@ -387,6 +917,33 @@ class GeminiAdapter(BaseLLMAdapter):
                 # 捕获并记录其他预料之外的错误
                 logging.warning(f"处理Gemini流块时发生未知错误: {e}")
 
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._model.generate_content_async(prompt, generation_config=self._generation_config())
+        if response and response.candidates:
+            return response.text
+        logging.warning("Gemini API 响应中没有有效的候选内容。")
+        return ""
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self._model.generate_content_async(
+            prompt,
+            generation_config=self._generation_config(),
+            stream=True,
+            request_options={"timeout": 1800}
+        )
+        async for chunk in response:
+            try:
+                if chunk.text is not None and chunk.text != "":
+                    yield chunk.text
+            except IndexError:
+                feedback_info = ""
+                if hasattr(chunk, 'prompt_feedback'):
+                    feedback_info = f" Prompt Feedback: {chunk.prompt_feedback}"
+                logging.warning(f"Gemini API 流式响应中遇到一个不含候选内容的块，已忽略。{feedback_info}")
+                continue
+            except Exception as e:
+                logging.warning(f"处理Gemini流块时发生未知错误: {e}")
+
     def _fetch_models(self) -> list:
         try:
             self._configure_genai()
@@ -404,10 +961,14 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
         self.azure_endpoint = f"https://{match.group(1)}"
         self.azure_deployment = match.group(2)
         self.api_version = self.base_url.split('api-version=')[-1]
-        self._client = AzureChatOpenAI(azure_endpoint=self.azure_endpoint, azure_deployment=self.azure_deployment, api_version=self.api_version, api_key=self.api_key, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, http_client=http_client)
+        self._client = AzureChatOpenAI(azure_endpoint=self.azure_endpoint, azure_deployment=self.azure_deployment, api_version=self.api_version, api_key=self.api_key, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, http_client=http_transport.get_client(self.azure_endpoint, self.proxy, self.verify_ssl))
+
+    def get_probe_headers(self) -> Dict[str, str]:
+        return {"api-key": self.api_key} if self.api_key else {}
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
@@ -420,55 +981,75 @@ class AzureOpenAIAdapter(BaseLLMAdapter):
             logging.error(f"Azure OpenAI流式调用失败: {e}")
             yield f"\nError: {e}"
 
-class OllamaAdapter(BaseLLMAdapter):
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._client.ainvoke(prompt)
+        self._record_langchain_usage(response)
+        return response.content if response else ""
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        async for chunk in self._client.astream(prompt):
+            if chunk.content:
+                yield chunk.content
+
+class OllamaAdapter(OpenAICompatibleAsyncMixin, BaseLLMAdapter):
     def __init__(self, llm_config: Dict[str, Any]):
         from langchain_openai import ChatOpenAI
         from openai import OpenAI
         super().__init__(llm_config)
         self.base_url = check_base_url(self.base_url)
         self.api_key = self.api_key or 'ollama'
-        http_client_instance = httpx.Client(proxies=self.proxy, verify=True) if self.proxy else http_client
+        # 本地服务对 stream_options 的支持因版本而异，默认不请求用量
+        self.stream_include_usage = llm_config.get("stream_include_usage", False)
+        http_client_instance = http_transport.get_client(self.base_url, self.proxy, self.verify_ssl)
         self._client = ChatOpenAI(model=self.model_name, api_key=self.api_key, base_url=self.base_url, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, http_client=http_client_instance)
         self._stream_client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, http_client=http_client_instance)
         self.client = self._stream_client._client
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
-        response = self._stream_client.chat.completions.create(model=self.model_name, messages=[{"role": "user", "content": prompt}], stream=True, temperature=self.temperature, top_p=self.top_p, max_tokens=self.max_tokens)
+        # Ollama 的OpenAI兼容接口会把 response_format 中的 json_schema 转为原生 /api/chat 的 format 参数
+        response = self._stream_client.chat.completions.create(model=self.model_name, messages=[{"role": "user", "content": prompt}], stream=True, temperature=self.temperature, top_p=self.top_p, max_tokens=self.max_tokens, **self._response_format_options())
+        self._active_response = response  # 供 cancel() 关闭该HTTP连接
         for chunk in response:
+            self._route_reasoning_delta(chunk.choices[0].delta)
             if chunk.choices[0].delta.content:
                 yield chunk.choices[0].delta.content
 
     def _fetch_models(self) -> list:
         try:
-            response = requests.get(f"{self.base_url.replace('/v1', '')}/api/tags")
+            response = http_transport.get(f"{self.base_url.replace('/v1', '')}/api/tags", proxy=self.proxy, verify=self.verify_ssl, timeout=10)
             if response.status_code == 200:
                 return [model["name"] for model in response.json()["models"]]
         except Exception:
             pass
         return ["llama2", "mistral"]
 
-class LMStudioAdapter(BaseLLMAdapter):
+class LMStudioAdapter(OpenAICompatibleAsyncMixin, BaseLLMAdapter):
     def __init__(self, llm_config: Dict[str, Any]):
         from langchain_openai import ChatOpenAI
         from openai import OpenAI
         super().__init__(llm_config)
         self.base_url = check_base_url(self.base_url)
-        http_client_instance = httpx.Client(proxies=self.proxy, verify=True) if self.proxy else http_client
+        self.stream_include_usage = llm_config.get("stream_include_usage", False)
+        http_client_instance = http_transport.get_client(self.base_url, self.proxy, self.verify_ssl)
         self._client = ChatOpenAI(model=self.model_name, api_key=self.api_key, base_url=self.base_url, max_tokens=self.max_tokens, temperature=self.temperature, top_p=self.top_p, timeout=self.timeout, http_client=http_client_instance)
         self._stream_client = OpenAI(api_key=self.api_key, base_url=self.base_url, timeout=self.timeout, http_client=http_client_instance)
         self.client = self._stream_client._client
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
-        response = self._stream_client.chat.completions.create(model=self.model_name, messages=[{"role": "user", "content": prompt}], stream=True, temperature=self.temperature, top_p=self.top_p, max_tokens=self.max_tokens)
+        response = self._stream_client.chat.completions.create(model=self.model_name, messages=[{"role": "user", "content": prompt}], stream=True, temperature=self.temperature, top_p=self.top_p, max_tokens=self.max_tokens, **self._response_format_options())
+        self._active_response = response  # 供 cancel() 关闭该HTTP连接
         for chunk in response:
+            self._route_reasoning_delta(chunk.choices[0].delta)
             if chunk.choices[0].delta.content:
                 yield chunk.choices[0].delta.content
 
@@ -483,6 +1064,9 @@ class AzureAIAdapter(BaseLLMAdapter):
         self.endpoint = f"https://{match.group(1)}.services.ai.azure.com/models"
         self._client = ChatCompletionsClient(endpoint=self.endpoint, credential=AzureKeyCredential(self.api_key), model=self.model_name, temperature=self.temperature, max_tokens=self.max_tokens, timeout=self.timeout)
 
+    def get_probe_headers(self) -> Dict[str, str]:
+        return {"api-key": self.api_key} if self.api_key else {}
+
     def _invoke(self, prompt: str) -> str:
         from azure.ai.inference.models import UserMessage
         response = self._client.complete(messages=[UserMessage(prompt)])
@@ -493,6 +1077,7 @@ class AzureAIAdapter(BaseLLMAdapter):
         from azure.ai.inference.models import UserMessage
         try:
             response = self._client.complete(messages=[UserMessage(prompt)], stream=True)
+            self._active_response = response  # 供 cancel() 关闭该HTTP连接
             for chunk in response:
                 if chunk.choices:
                     content = chunk.choices[0].delta.content
@@ -502,7 +1087,30 @@ class AzureAIAdapter(BaseLLMAdapter):
             logging.error(f"Azure AI流式调用失败: {e}")
             yield f"\nError: {e}"
 
-class VolcanoEngineAIAdapter(BaseLLMAdapter): # Inherits from BaseLLMAdapter
+    def _get_async_client(self):
+        from azure.ai.inference.aio import ChatCompletionsClient as AsyncChatCompletionsClient
+        from azure.core.credentials import AzureKeyCredential
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_async_client", None) is None or getattr(self, "_async_client_loop", None) is not loop:
+            self._async_client = AsyncChatCompletionsClient(endpoint=self.endpoint, credential=AzureKeyCredential(self.api_key), model=self.model_name, temperature=self.temperature, max_tokens=self.max_tokens, timeout=self.timeout)
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def _ainvoke(self, prompt: str) -> str:
+        from azure.ai.inference.models import UserMessage
+        response = await self._get_async_client().complete(messages=[UserMessage(prompt)])
+        return response.choices[0].message.content if response and response.choices else ""
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        from azure.ai.inference.models import UserMessage
+        response = await self._get_async_client().complete(messages=[UserMessage(prompt)], stream=True)
+        async for chunk in response:
+            if chunk.choices:
+                content = chunk.choices[0].delta.content
+                if content:
+                    yield content
+
+class VolcanoEngineAIAdapter(OpenAICompatibleAsyncMixin, BaseLLMAdapter): # Inherits from BaseLLMAdapter
     def __init__(self, llm_config: Dict[str, Any]):
         from langchain_openai import ChatOpenAI
         from openai import OpenAI
@@ -511,14 +1119,8 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter): # Inherits from BaseLLMAdapter
         # 火山引擎的API与OpenAI兼容，但可能需要特定的headers或处理
         # 暂时沿用OpenAIAdapter的客户端初始化逻辑，但需要注意其base_url和api_key的正确性
         default_headers = {"User-Agent": "Mozilla/5.0"}
-        timeout_config = httpx.Timeout(self.timeout, connect=60.0)
-        
-        http_client_instance = httpx.Client(
-            proxies=self.proxy, 
-            verify=True, 
-            headers=default_headers,
-            timeout=timeout_config
-        ) if self.proxy else httpx.Client(verify=True, headers=default_headers, timeout=timeout_config)
+        timeout_config = httpx.Timeout(self.timeout, connect=http_transport.connect_timeout)
+        http_client_instance = http_transport.get_client(self.base_url, self.proxy, self.verify_ssl)
         
         self._client = ChatOpenAI(
             model=self.model_name, 
@@ -543,6 +1145,7 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter): # Inherits from BaseLLMAdapter
     def _invoke(self, prompt: str) -> str:
         # 火山引擎的调用方式与OpenAI兼容
         response = self._client.invoke(prompt)
+        self._record_langchain_usage(response)
         return response.content if response else ""
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
@@ -555,11 +1158,16 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter): # Inherits from BaseLLMAdapter
             stream=True,
             temperature=self.temperature,
             top_p=self.top_p,
-            max_tokens=self.max_tokens
+            max_tokens=self.max_tokens,
+            **self._stream_options(),
+            **self._response_format_options()
         )
+        self._active_response = response  # 供 cancel() 关闭该HTTP连接
         for chunk in response:
+            self._record_openai_usage(chunk)
             try:
                 if chunk.choices:
+                    self._route_reasoning_delta(chunk.choices[0].delta)
                     content = chunk.choices[0].delta.content
                     if content is not None and content != "":
                         yield content
@@ -579,13 +1187,13 @@ class VolcanoEngineAIAdapter(BaseLLMAdapter): # Inherits from BaseLLMAdapter
             # 火山引擎的API可能与OpenAI的/models端点不同，需要根据实际文档调整
             # 假设它也支持 /models 端点，如果不支持，这里会失败
             # 如果火山引擎没有公开的模型列表API，这里应该返回空列表
-            response = requests.get(f"{self.base_url}/models", headers=headers, timeout=20)
+            response = http_transport.get(f"{self.base_url}/models", proxy=self.proxy, verify=self.verify_ssl, timeout=20, headers=headers)
             if response.status_code == 200:
                 data = response.json()
                 if "data" in data:
                     return [model["id"] for model in data["data"]]
             logging.warning(f"从火山引擎获取模型列表失败，状态码: {response.status_code}, 响应: {response.text}")
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logging.error(f"请求火山引擎模型列表时发生网络错误: {e}")
         except Exception as e:
             logging.error(f"从火山引擎获取模型列表时发生未知错误: {e}")
@@ -599,30 +1207,236 @@ class ClaudeAdapter(BaseLLMAdapter):
         from anthropic import Anthropic
         super().__init__(llm_config)
         self.base_url = check_base_url(self.base_url)
-        self._client = Anthropic(api_key=self.api_key, base_url=self.base_url)
+        self._client = Anthropic(api_key=self.api_key, base_url=self.base_url, http_client=http_transport.get_client(self.base_url, self.proxy, self.verify_ssl))
+
+    def get_probe_headers(self) -> Dict[str, str]:
+        headers = {"anthropic-version": "2023-06-01"}
+        if self.api_key:
+            headers["x-api-key"] = self.api_key
+        return headers
+
+    def _claude_messages(self, prompt: str) -> list:
+        """提示词带有稳定前缀时拆为两个文本块，并在前缀块上设置 cache_control。"""
+        prefix, tail = self._split_cache_prefix(prompt)
+        if prefix is None:
+            return [{"role": "user", "content": prompt}]
+        return [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                {"type": "text", "text": tail},
+            ]
+        }]
+
+    def _tool_options(self) -> Dict[str, Any]:
+        """结构化输出调用：把输出定义声明为工具并强制模型调用，工具参数即为所需的 JSON。"""
+        spec = self.response_schema
+        if spec is None:
+            return {}
+        return {
+            "tools": [{"name": spec.name, "description": spec.description, "input_schema": spec.schema}],
+            "tool_choice": {"type": "tool", "name": spec.name},
+        }
+
+    @staticmethod
+    def _response_text(response) -> str:
+        for block in response.content or []:
+            if block.type == "tool_use":
+                return json.dumps(block.input, ensure_ascii=False)
+        return response.content[0].text if response.content else ""
+
+    @staticmethod
+    def _tool_json_delta(event) -> str:
+        """工具参数以 input_json_delta 事件逐段返回。"""
+        if event.type == "content_block_delta" and getattr(event.delta, "type", None) == "input_json_delta":
+            return event.delta.partial_json or ""
+        return ""
 
     def _invoke(self, prompt: str) -> str:
         response = self._client.messages.create(
             model=self.model_name,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+            messages=self._claude_messages(prompt),
+            **self._tool_options()
         )
-        return response.content[0].text if response.content else ""
+        self._record_anthropic_usage(response.usage)
+        return self._response_text(response)
 
     def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        tool_options = self._tool_options()
         with self._client.messages.stream(
             model=self.model_name,
             max_tokens=self.max_tokens,
             temperature=self.temperature,
-            messages=[
-                {"role": "user", "content": prompt}
-            ]
+            messages=self._claude_messages(prompt),
+            **tool_options
         ) as stream:
-            for text in stream.text_stream:
-                yield text
+            self._active_response = stream
+            if tool_options:
+                for event in stream:
+                    partial = self._tool_json_delta(event)
+                    if partial:
+                        yield partial
+            else:
+                for text in stream.text_stream:
+                    yield text
+            final_message = stream.get_final_message()
+            if final_message:
+                self._record_anthropic_usage(final_message.usage)
+                self.last_finish_reason = final_message.stop_reason
+
+    def _get_async_client(self):
+        from anthropic import AsyncAnthropic
+        loop = asyncio.get_running_loop()
+        if getattr(self, "_async_client", None) is None or getattr(self, "_async_client_loop", None) is not loop:
+            async_http_client = http_transport.get_async_client(self.base_url, self.proxy, self.verify_ssl)
+            self._async_client = AsyncAnthropic(api_key=self.api_key, base_url=self.base_url, http_client=async_http_client)
+            self._async_client_loop = loop
+        return self._async_client
+
+    async def _ainvoke(self, prompt: str) -> str:
+        response = await self._get_async_client().messages.create(
+            model=self.model_name,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            messages=self._claude_messages(prompt),
+            **self._tool_options()
+        )
+        self._record_anthropic_usage(response.usage)
+        return self._response_text(response)
+
+    async def _ainvoke_stream(self, prompt: str) -> AsyncIterator[str]:
+        tool_options = self._tool_options()
+        async with self._get_async_client().messages.stream(
+            model=self.model_name,
+            max_tokens=self.max_tokens,
+            temperature=self.temperature,
+            messages=self._claude_messages(prompt),
+            **tool_options
+        ) as stream:
+            if tool_options:
+                async for event in stream:
+                    partial = self._tool_json_delta(event)
+                    if partial:
+                        yield partial
+            else:
+                async for text in stream.text_stream:
+                    yield text
+            final_message = await stream.get_final_message()
+            if final_message:
+                self._record_anthropic_usage(final_message.usage)
+                self.last_finish_reason = final_message.stop_reason
+
+class ReplayMissError(LookupError):
+    """严格回放模式下，日志中没有与提示词对应的记录。"""
+    # 让重试策略按 404 归为不可重试错误
+    status_code = 404
+
+
+class ReplayAdapter(BaseLLMAdapter):
+    """
+    按提示词哈希回放 polling_run.log 中记录的响应，用于确定性地重跑整部小说，
+    剖析 WorkflowEngine 中文件读写、解析、存储更新等非LLM开销。
+    llm_config 中的可选参数：
+    - replay_log：日志路径（base_url 为 .log/.gz 路径时也会被当作日志路径），默认 polling_run.log 及其轮转分段；
+    - replay_speed：回放速度，1 为按原始耗时回放，大于 1 为加速，0（默认）为不等待；
+    - replay_strict：为 True 时未命中直接报错，否则按提示词类型生成占位内容。
+    """
+    _indexes: Dict[str, Dict[str, list]] = {}
+    _cursors: Dict[str, Dict[str, int]] = {}
+    _index_lock = threading.Lock()
+
+    def __init__(self, llm_config: Dict[str, Any]):
+        super().__init__(llm_config)
+        default_log = os.path.join("ui", "轮询设定", "polling_run.log")
+        self.replay_log = llm_config.get("replay_log") or (self.base_url if self.base_url.endswith((".log", ".gz")) else default_log)
+        self.replay_speed = float(llm_config.get("replay_speed", 0) or 0)
+        self.replay_strict = bool(llm_config.get("replay_strict", False))
+        self.model_name = self.model_name or "replay"
+        # 回放产生的调用日志单独存放，避免混入被回放的日志
+        self.run_log_writer = get_log_writer(os.path.join("ui", "轮询设定", "replay_run.log"))
+        self._index = self._load_index(self.replay_log)
+
+    @staticmethod
+    def prompt_key(prompt: str) -> str:
+        return hashlib.sha256(str(prompt).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _load_index(cls, log_path: str) -> Dict[str, list]:
+        """读取日志的全部分段（含 .gz），按提示词哈希建立索引；同一进程内只加载一次。"""
+        key = os.path.abspath(log_path)
+        with cls._index_lock:
+            if key in cls._indexes:
+                return cls._indexes[key]
+            if log_path.endswith(".gz") or os.path.basename(log_path) != "polling_run.log":
+                segments = [log_path]
+            else:
+                writer = get_log_writer(log_path)
+                writer.flush()
+                # list_segments 按时间倒序返回，回放时按记录先后顺序取用
+                segments = list(reversed(writer.list_segments()))
+            index: Dict[str, list] = {}
+            for segment in segments:
+                for entry in RotatingLogWriter.read_segment(segment):
+                    response = entry.get("response")
+                    if not entry.get("prompt") or not response or str(response).startswith("Error:"):
+                        continue
+                    index.setdefault(cls.prompt_key(entry["prompt"]), []).append(entry)
+            logging.info(f"回放适配器已从 {len(segments)} 个日志分段加载 {sum(len(v) for v in index.values())} 条记录。")
+            cls._indexes[key] = index
+            cls._cursors[key] = {}
+            return index
+
+    def _lookup(self, prompt: str) -> Optional[Dict[str, Any]]:
+        """同一提示词被记录多次时按记录顺序依次返回，用完后重复最后一条。"""
+        prompt_key = self.prompt_key(prompt)
+        entries = self._index.get(prompt_key)
+        if not entries:
+            return None
+        with self._index_lock:
+            cursors = self._cursors[os.path.abspath(self.replay_log)]
+            position = cursors.get(prompt_key, 0)
+            cursors[prompt_key] = position + 1
+        return entries[min(position, len(entries) - 1)]
+
+    def _replay_entry(self, prompt: str) -> Dict[str, Any]:
+        entry = self._lookup(prompt)
+        if entry is not None:
+            self._record_usage(entry.get("input_tokens"), entry.get("output_tokens"))
+            return entry
+        if self.replay_strict:
+            raise ReplayMissError(f"回放日志中没有与步骤 '{self.step_name}' 的提示词对应的记录。")
+        from mock_llm_server import canned_response
+        logging.warning(f"回放未命中（步骤 '{self.step_name}'），返回占位内容。")
+        seed = int(self.prompt_key(prompt)[:8], 16)
+        return {"response": canned_response(str(prompt), random.Random(seed)), "duration_seconds": 0, "ttft_seconds": 0}
+
+    def _wait(self, seconds: float):
+        if self.replay_speed > 0 and seconds > 0:
+            if self._cancel_event.wait(seconds / self.replay_speed):
+                raise LLMRequestCancelled(f"适配器 '{self.config_name}' 的调用已被取消。")
+
+    def _invoke(self, prompt: str) -> str:
+        entry = self._replay_entry(prompt)
+        self._wait(float(entry.get("duration_seconds") or 0))
+        return entry["response"]
+
+    def _invoke_stream(self, prompt: str) -> Iterator[str]:
+        entry = self._replay_entry(prompt)
+        response = entry["response"]
+        duration = float(entry.get("duration_seconds") or 0)
+        ttft = float(entry.get("ttft_seconds") or 0)
+        self._wait(ttft)
+        chunks = list(response_cache.replay(response, chunk_size=16))
+        interval = max(0.0, duration - ttft) / len(chunks) if chunks else 0.0
+        for chunk in chunks:
+            yield chunk
+            self._wait(interval)
+
+    def _fetch_models(self) -> list:
+        return [self.model_name]
+
 
 class SimpleEmbeddingAdapter:
     def __init__(self, model_name="text-embedding-ada-002"):
@@ -634,8 +1448,26 @@ class SimpleEmbeddingAdapter:
         import numpy as np
         return np.ones(1536)
 
+_langchain_configured = False
+
+def _configure_langchain():
+    """首次创建适配器时关闭 langchain 的 verbose 日志（原先在 main.py 启动时导入 langchain 完成）。"""
+    global _langchain_configured
+    if _langchain_configured:
+        return
+    _langchain_configured = True
+    try:
+        try:
+            from langchain_core.globals import set_verbose
+        except ImportError:
+            from langchain.globals import set_verbose
+        set_verbose(False)
+    except ImportError:
+        pass
+
 def create_llm_adapter(llm_config: dict) -> BaseLLMAdapter:
-    """工厂函数：根据 llm_config 字典返回不同的适配器实例。"""
+    """工厂函数：根据 llm_config 字典返回不同的适配器实例。SDK 在此时才按接口类型导入。"""
+    _configure_langchain()
     interface_format = llm_config.get("interface_format", "").strip().lower()
     
     adapter_map = {
@@ -653,11 +1485,13 @@ def create_llm_adapter(llm_config: dict) -> BaseLLMAdapter:
         "azure openai": AzureOpenAIAdapter,
         "moonshot kimi": OpenAIAdapter,
         "阿里云百炼": OpenAIAdapter,
+        "回放": ReplayAdapter,
         
         # --- 用于兼容旧配置或别名的键 ---
         "gemini": GeminiAdapter,
         "azure ai": AzureAIAdapter,
         "lm studio": LMStudioAdapter,
+        "replay": ReplayAdapter,
     }
     
     adapter_class = adapter_map.get(interface_format)
@@ -674,6 +1508,141 @@ def create_llm_adapter(llm_config: dict) -> BaseLLMAdapter:
     
     return adapter
 
+class AdapterPool:
+    """
+    线程安全的LLM适配器池。
+    以“配置名 + 配置参数哈希”为键缓存空闲的适配器实例，使同一配置的多次调用复用
+    已建立的 keep-alive 连接与 TLS 会话。适配器在使用期间被独占借出，归还后才能被
+    其他调用方再次取用；空闲超时或 config.json 变化时，池中的适配器会被关闭并丢弃。
+    """
+    def __init__(self, idle_timeout: float = 300, max_idle_per_key: int = 2):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self._lock = threading.Lock()
+        self._idle: Dict[str, list] = {}  # key -> [(adapter, 归还时间), ...]
+        self._generation = 0
+        self._config_mtime = self._get_config_mtime()
+
+    @staticmethod
+    def _get_config_mtime() -> Optional[float]:
+        try:
+            return os.path.getmtime(cm.CONFIG_FILE)
+        except OSError:
+            return None
+
+    @staticmethod
+    def make_key(config_name: str, llm_config: Dict[str, Any]) -> str:
+        """根据配置名和配置参数生成池键，参数任何变化都会得到新的键。"""
+        params = {k: v for k, v in llm_config.items() if not k.startswith("_")}
+        digest = hashlib.sha1(json.dumps(params, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+        return f"{config_name}:{digest[:16]}"
+
+    def _check_config_changed_locked(self):
+        """config.json 被修改后，当前池中的所有适配器都视为过期。"""
+        mtime = self._get_config_mtime()
+        if mtime != self._config_mtime:
+            self._config_mtime = mtime
+            self._generation += 1
+            stale = [adapter for entries in self._idle.values() for adapter, _ in entries]
+            self._idle.clear()
+            if stale:
+                logging.info(f"检测到 {cm.CONFIG_FILE} 已变化，已使适配器池中的 {len(stale)} 个适配器失效。")
+            return stale
+        return []
+
+    def _evict_idle_locked(self, now: float) -> list:
+        """移除空闲时间超过 idle_timeout 的适配器，返回待关闭的列表。"""
+        expired = []
+        for key in list(self._idle.keys()):
+            entries = self._idle[key]
+            keep = []
+            for adapter, released_at in entries:
+                if now - released_at > self.idle_timeout:
+                    expired.append(adapter)
+                else:
+                    keep.append((adapter, released_at))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        return expired
+
+    @staticmethod
+    def _close_adapters(adapters: list):
+        # 在锁外关闭，避免网络关闭操作阻塞其他线程借还适配器
+        for adapter in adapters:
+            try:
+                adapter.close()
+            except Exception as e:
+                logging.error(f"关闭池中适配器时出错: {e}")
+
+    def acquire(self, config_name: str, llm_config: Dict[str, Any]) -> BaseLLMAdapter:
+        """借出一个适配器；池中没有可用实例时新建一个。"""
+        key = self.make_key(config_name, llm_config)
+        adapter = None
+        with self._lock:
+            to_close = self._check_config_changed_locked()
+            to_close += self._evict_idle_locked(time.time())
+            entries = self._idle.get(key)
+            if entries:
+                adapter, _ = entries.pop()
+                if not entries:
+                    del self._idle[key]
+            generation = self._generation
+        self._close_adapters(to_close)
+
+        if adapter is None:
+            adapter = create_llm_adapter(llm_config)
+            adapter._pool_key = key
+        else:
+            logging.debug(f"复用适配器池中的适配器: {key}")
+        adapter._pool_generation = generation
+        # 借出前恢复由上一位调用方改写过的运行时属性
+        adapter.step_name = llm_config.get("step_name", "未指定步骤")
+        adapter.cache_step = llm_config.get("step_name")
+        adapter.config_name = llm_config.get("config_name", config_name)
+        adapter.model_name = llm_config.get("model_name", "")
+        adapter.on_first_chunk = None
+        adapter.on_reasoning = None
+        adapter.hedge = None
+        adapter.last_call_stats = None
+        adapter.retry_budget = None
+        adapter.stream_salvage = None
+        adapter.structured_output = False
+        adapter.response_schema = None
+        return adapter
+
+    def release(self, adapter: Optional[BaseLLMAdapter]):
+        """归还适配器。已关闭或已过期的适配器直接丢弃。"""
+        if adapter is None or not getattr(adapter, "_pool_key", None):
+            return
+        if getattr(adapter, "_closed", False):
+            return
+        to_close = []
+        with self._lock:
+            to_close += self._check_config_changed_locked()
+            entries = self._idle.setdefault(adapter._pool_key, [])
+            if adapter._pool_generation != self._generation or len(entries) >= self.max_idle_per_key:
+                to_close.append(adapter)
+            else:
+                entries.append((adapter, time.time()))
+            if not entries:
+                del self._idle[adapter._pool_key]
+        self._close_adapters(to_close)
+
+    def invalidate(self):
+        """关闭并清空池中所有空闲的适配器。"""
+        with self._lock:
+            self._generation += 1
+            stale = [adapter for entries in self._idle.values() for adapter, _ in entries]
+            self._idle.clear()
+        self._close_adapters(stale)
+
+    def stats(self) -> Dict[str, int]:
+        """返回每个池键当前空闲的适配器数量。"""
+        with self._lock:
+            return {key: len(entries) for key, entries in self._idle.items()}
+
 class PollingManager:
     """管理LLM轮询调用的核心类。"""
     _instance = None
@@ -701,6 +1670,38 @@ class PollingManager:
             self.state = self.settings.get("调用状态", {"上次调用AI索引": -1, "AI状态": {}})
             self.last_used_index = self.state.get("上次调用AI索引", -1)
             self.shuffled_indices = None
+            # 自适应轮询：本轮已尝试过的配置，以及保护 AI状态 读写的锁
+            self.adaptive_tried = set()
+            self._state_lock = threading.RLock()
+            # 调用状态延迟合并写入（见 _save_state），程序退出时由 flush_state 写入剩余部分
+            self._state_dirty = False
+            self._state_timer: Optional[threading.Timer] = None
+            atexit.register(self.flush_state)
+            general_settings = self.settings.get("设置", {})
+            idle_timeout = general_settings.get("适配器空闲回收秒数", 300)
+            self.adapter_pool = AdapterPool(idle_timeout=idle_timeout)
+            # Token计数模式: "tiktoken"（精确）或 "estimate"（快速估算）
+            tokenizer_service.set_mode(general_settings.get("Token计数模式", "tiktoken"))
+            # 调用日志的分段大小与压缩设置
+            configure_log_writers(
+                max_bytes=int(general_settings.get("日志分段大小MB", 20)) * 1024 * 1024,
+                compress=general_settings.get("日志分段压缩", True)
+            )
+            # 共享HTTP传输层的超时与连接池上限
+            http_transport.configure(
+                connect_timeout=general_settings.get("连接超时秒", 30),
+                max_connections=general_settings.get("连接池最大连接数", 50),
+                max_keepalive_connections=general_settings.get("连接池空闲连接数", 20),
+                http2=general_settings.get("启用HTTP2", True)
+            )
+            # 响应缓存：主开关默认关闭，各步骤可通过“启用缓存”单独开关
+            response_cache.configure(
+                enabled=general_settings.get("响应缓存启用", False),
+                ttl_hours=general_settings.get("响应缓存有效期小时", 168),
+                max_mb=general_settings.get("响应缓存容量MB", 200),
+                step_settings={name: conf["启用缓存"] for name, conf in self.step_configs.items()
+                               if isinstance(conf, dict) and "启用缓存" in conf}
+            )
             self._initialized = True
 
     def get_next_config_name(self, step_name: str) -> Optional[str]:
@@ -719,21 +1720,74 @@ class PollingManager:
 
         strategy = self.settings.get("设置", {}).get("轮询策略", "sequential")
         
-        if strategy == "random":
-            if self.shuffled_indices is None or not self.shuffled_indices:
-                self.shuffled_indices = list(range(len(self.polling_list)))
-                random.shuffle(self.shuffled_indices)
-            
-            next_index = self.shuffled_indices.pop(0)
-            config_name = self.polling_list[next_index]["name"]
-        else:  # sequential
-            self.last_used_index = (self.last_used_index + 1) % len(self.polling_list)
-            config_name = self.polling_list[self.last_used_index]["name"]
-            self.state["上次调用AI索引"] = self.last_used_index
-            self._save_state()
-            
+        if strategy == "adaptive":
+            return self._pick_adaptive_config()
+
+        # 定稿等步骤会并发取配置，轮询游标的读改写需在锁内完成
+        with self._state_lock:
+            # 跳过处于熔断期的配置（例如启动探测时不可达的端点）；全部熔断时按原顺序返回
+            first_choice = None
+            for _ in range(len(self.polling_list)):
+                if strategy == "random":
+                    if self.shuffled_indices is None or not self.shuffled_indices:
+                        self.shuffled_indices = list(range(len(self.polling_list)))
+                        random.shuffle(self.shuffled_indices)
+
+                    next_index = self.shuffled_indices.pop(0)
+                    config_name = self.polling_list[next_index]["name"]
+                else:  # sequential
+                    self.last_used_index = (self.last_used_index + 1) % len(self.polling_list)
+                    config_name = self.polling_list[self.last_used_index]["name"]
+                    self.state["上次调用AI索引"] = self.last_used_index
+                first_choice = first_choice or config_name
+                if not self.is_config_paused(config_name):
+                    break
+            else:
+                config_name = first_choice
+            if strategy != "random":
+                self._save_state()
+
         return config_name
 
+    def peek_next_config_name(self, step_name: str, exclude: Tuple[str, ...] = ()) -> Optional[str]:
+        """
+        不改变轮询状态地预选一个配置（用于对冲请求），跳过 exclude 中的配置和处于熔断期的配置。
+        顺序轮询取游标之后的下一个，随机轮询取本轮洗牌序列中的下一个，自适应轮询取当前评分最高的一个。
+        """
+        step_config = self.step_configs.get(step_name, {})
+        specific_config_name = step_config.get("指定配置")
+        if specific_config_name and specific_config_name != "无":
+            return None if specific_config_name in exclude else specific_config_name
+        # 与 polling_list 下标一一对应，游标和洗牌序列保存的都是下标
+        names = [item.get("name") for item in self.polling_list]
+        if not names:
+            return None
+
+        strategy = self.settings.get("设置", {}).get("轮询策略", "sequential")
+        with self._state_lock:
+            if strategy == "adaptive":
+                ordered = sorted((name for name in names if name), key=lambda name: self._adaptive_score(self._get_ai_state(name)), reverse=True)
+            elif strategy == "random" and self.shuffled_indices:
+                upcoming = [names[i] for i in self.shuffled_indices]
+                ordered = upcoming + [name for name in names if name not in upcoming]
+            else:
+                start = (self.last_used_index + 1) % len(names)
+                ordered = names[start:] + names[:start]
+            candidates = [name for name in ordered if name and name not in exclude]
+            for name in candidates:
+                if not self.is_config_paused(name):
+                    return name
+        return None
+
+    def is_config_paused(self, config_name: str) -> bool:
+        """配置是否处于熔断期（暂停至 尚未到达）。"""
+        with self._state_lock:
+            ai_state = self.state.get("AI状态", {}).get(config_name)
+            if not isinstance(ai_state, dict) or ai_state.get("状态") != "circuit_open":
+                return False
+            paused_until = self._paused_until(ai_state)
+            return bool(paused_until and paused_until > time.time())
+
     def _get_default_settings(self) -> Dict[str, Any]:
         """返回默认的轮询设置"""
         return {
@@ -783,26 +1837,210 @@ class PollingManager:
             return default_settings
 
     def reset_random_polling(self):
-        """重置随机轮询的状态，以便开始新的轮询周期。"""
+        """重置随机轮询（及自适应轮询）的状态，以便开始新的轮询周期。"""
         self.shuffled_indices = None
+        self.adaptive_tried = set()
 
-    def _save_state(self):
-        """保存当前的调用状态到配置文件"""
+    # ---------- 自适应轮询 ----------
+
+    def _adaptive_settings(self) -> Tuple[float, int, float]:
+        """返回 (EWMA平滑系数, 熔断连续失败次数, 熔断冷却秒数)。"""
+        settings = self.settings.get("设置", {})
+        return (
+            float(settings.get("自适应平滑系数", 0.3)),
+            int(settings.get("熔断连续失败次数", 3)),
+            float(settings.get("熔断冷却秒数", 300)),
+        )
+
+    def _get_ai_state(self, config_name: str) -> Dict[str, Any]:
+        ai_states = self.state.setdefault("AI状态", {})
+        ai_state = ai_states.get(config_name)
+        if not isinstance(ai_state, dict):
+            ai_state = {"状态": "available", "最后错误": None, "暂停至": None}
+            ai_states[config_name] = ai_state
+        return ai_state
+
+    @staticmethod
+    def _paused_until(ai_state: Dict[str, Any]) -> Optional[float]:
+        paused_until = ai_state.get("暂停至")
+        if not paused_until:
+            return None
         try:
+            return datetime.strptime(paused_until, "%Y-%m-%d %H:%M:%S").timestamp()
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _ewma(old: Optional[float], value: float, alpha: float) -> float:
+        return value if old is None else alpha * value + (1 - alpha) * old
+
+    def record_call_result(self, config_name: str, success: bool, stats: Optional[Dict[str, float]] = None,
+                           error: Optional[str] = None, status_code: Optional[int] = None):
+        """
+        记录一次调用的结果，更新该配置的首字延迟、生成速度和错误率（EWMA），并维护熔断状态。
+        status_code 为重试策略从异常中识别出的HTTP状态码，429 时按限流暂停该配置。
+        结果写入轮询设定.json 的 调用状态/AI状态。
+        """
+        if not config_name:
+            return
+        alpha, failure_threshold, cooldown = self._adaptive_settings()
+        with self._state_lock:
+            ai_state = self._get_ai_state(config_name)
+            ai_state["调用次数"] = ai_state.get("调用次数", 0) + 1
+            ai_state["错误率"] = round(self._ewma(ai_state.get("错误率"), 0.0 if success else 1.0, alpha), 4)
+            ai_state["最后更新"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if success:
+                if stats:
+                    ai_state["平均首字延迟秒"] = round(self._ewma(ai_state.get("平均首字延迟秒"), stats.get("ttft", 0.0), alpha), 3)
+                    ai_state["平均生成速度"] = round(self._ewma(ai_state.get("平均生成速度"), stats.get("tokens_per_sec", 0.0), alpha), 2)
+                    if stats.get("ttfat") is not None:
+                        ai_state["平均首答延迟秒"] = round(self._ewma(ai_state.get("平均首答延迟秒"), stats["ttfat"], alpha), 3)
+                ai_state["连续失败次数"] = 0
+                ai_state["状态"] = "available"
+                ai_state["暂停至"] = None
+            else:
+                failures = ai_state.get("连续失败次数", 0) + 1
+                ai_state["连续失败次数"] = failures
+                ai_state["最后错误"] = (error or "")[:500]
+                pause_seconds = 0
+                if status_code == 429:
+                    # 限流错误按设置的暂停时间熔断
+                    pause_seconds = float(self.settings.get("设置", {}).get("429错误暂停分钟", 5)) * 60
+                elif failures >= failure_threshold or ai_state.get("状态") == "half_open":
+                    pause_seconds = cooldown
+                if pause_seconds:
+                    ai_state["状态"] = "circuit_open"
+                    ai_state["暂停至"] = datetime.fromtimestamp(time.time() + pause_seconds).strftime("%Y-%m-%d %H:%M:%S")
+                    logging.warning(f"配置 '{config_name}' 已熔断，暂停至 {ai_state['暂停至']}（连续失败 {failures} 次）。")
+            self._save_state()
+
+    def record_probe_result(self, config_name: str, ok: bool, latency: Optional[float] = None, error: Optional[str] = None):
+        """
+        记录启动探测的结果。探测不计入调用次数和错误率：可达时记录连接延迟并解除熔断，
+        不可达时按熔断冷却时间暂停该配置，使轮询在工作流开始前就跳过它。
+        """
+        if not config_name:
+            return
+        _, _, cooldown = self._adaptive_settings()
+        with self._state_lock:
+            ai_state = self._get_ai_state(config_name)
+            ai_state["最后探测"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            if ok:
+                if latency is not None:
+                    ai_state["探测延迟秒"] = round(latency, 3)
+                if ai_state.get("状态") in ("circuit_open", "half_open"):
+                    ai_state["状态"] = "available"
+                    ai_state["暂停至"] = None
+                    ai_state["连续失败次数"] = 0
+            else:
+                ai_state["最后错误"] = (error or "")[:500]
+                ai_state["状态"] = "circuit_open"
+                ai_state["暂停至"] = datetime.fromtimestamp(time.time() + cooldown).strftime("%Y-%m-%d %H:%M:%S")
+                logging.warning(f"配置 '{config_name}' 探测失败，暂停至 {ai_state['暂停至']}: {error}")
+            self._save_state()
+
+    def _adaptive_score(self, ai_state: Dict[str, Any]) -> float:
+        """综合首字延迟、生成速度和错误率计算权重，没有历史数据的配置给予较高的初始分以便探索。"""
+        ttft = ai_state.get("平均首字延迟秒")
+        tps = ai_state.get("平均生成速度")
+        error_rate = ai_state.get("错误率") or 0.0
+        ttft_score = 0.75 if ttft is None else 1.0 / (1.0 + ttft / 10.0)
+        tps_score = 0.75 if tps is None else tps / (tps + 20.0)
+        success_rate = 1.0 - error_rate
+        return max(0.01, (0.4 * ttft_score + 0.3 * tps_score + 0.3 * success_rate) * success_rate)
+
+    def _pick_adaptive_config(self) -> Optional[str]:
+        """按权重随机选择本轮未尝试过、且未处于熔断期的配置；全部熔断时选择最早恢复的一个。"""
+        names = [item["name"] for item in self.polling_list if item.get("name")]
+        now = time.time()
+        with self._state_lock:
+            candidates = [n for n in names if n not in self.adaptive_tried] or names
+            available, weights, open_circuits = [], [], []
+            for name in candidates:
+                ai_state = self._get_ai_state(name)
+                paused_until = self._paused_until(ai_state)
+                if ai_state.get("状态") == "circuit_open" and paused_until and paused_until > now:
+                    open_circuits.append((paused_until, name))
+                    continue
+                if ai_state.get("状态") == "circuit_open":
+                    # 冷却结束，半开状态下放行一次试探请求
+                    ai_state["状态"] = "half_open"
+                available.append(name)
+                weights.append(self._adaptive_score(ai_state) ** 2)
+            if available:
+                config_name = random.choices(available, weights=weights, k=1)[0]
+            elif open_circuits:
+                config_name = min(open_circuits)[1]
+            else:
+                return None
+            self.adaptive_tried.add(config_name)
+            return config_name
+
+    def _save_state(self):
+        """
+        安排保存调用状态。每次调用都会更新状态，并发步骤下频繁整文件重写代价较高，
+        因此合并为延迟 设置.调用状态保存间隔秒（默认 2 秒）后的一次写入。
+        """
+        with self._state_lock:
+            self._state_dirty = True
+            if self._state_timer is not None:
+                return
+            try:
+                delay = float(self.settings.get("设置", {}).get("调用状态保存间隔秒", 2))
+            except (TypeError, ValueError):
+                delay = 2.0
+            self._state_timer = threading.Timer(max(0.0, delay), self.flush_state)
+            self._state_timer.daemon = True
+            self._state_timer.start()
+
+    def flush_state(self):
+        """
+        立即写入调用状态。只替换磁盘上 轮询设定.json 中的 调用状态 一项，
+        其余内容以文件为准，不会覆盖界面在此期间保存的设置。
+        """
+        with self._state_lock:
+            if self._state_timer is not None:
+                self._state_timer.cancel()
+                self._state_timer = None
+            if not self._state_dirty:
+                return
+            self._state_dirty = False
+            state = json.loads(json.dumps(self.state, ensure_ascii=False))
+            try:
+                with open(self.polling_settings_file, 'r', encoding='utf-8') as f:
+                    on_disk = json.load(f)
+                if not isinstance(on_disk, dict):
+                    raise ValueError("配置文件格式无效")
+            except FileNotFoundError:
+                on_disk = self.settings
+            except (OSError, ValueError) as e:
+                # 文件可能正被界面写入，保留脏标记稍后重试，避免用内存中的旧设置覆盖它
+                logging.warning(f"读取轮询配置文件失败，稍后重试保存调用状态: {e}")
+                # 计时器已在上面清除，需重新安排一次写入，否则要等下一次调用才会重试
+                self._save_state()
+                return
+            on_disk["调用状态"] = state
             self.settings["调用状态"] = self.state
-            self._save_settings(self.settings)
-        except Exception as e:
-            logging.error(f"保存轮询状态失败: {e}")
+            try:
+                replace_file_atomically(self.polling_settings_file,
+                                        lambda f: json.dump(on_disk, f, indent=2, ensure_ascii=False))
+            except Exception as e:
+                logging.error(f"保存轮询状态失败: {e}")
 
     def get_adapter_by_name(self, config_name: str) -> Optional[BaseLLMAdapter]:
         """
-        根据配置名称直接获取一个LLM适配器实例。
+        根据配置名称从适配器池借出一个LLM适配器实例。
+        使用完毕后应调用 release_adapter 归还，以便复用其连接。
         """
         config_data = cm.get_config(config_name)
         if config_data and "llm_config" in config_data:
             llm_config = config_data["llm_config"].copy()
             llm_config["config_name"] = config_name
-            return create_llm_adapter(llm_config)
+            return self.adapter_pool.acquire(config_name, llm_config)
         
         logging.error(f"找不到配置 '{config_name}' 的数据。")
         return None
+
+    def release_adapter(self, adapter: Optional[BaseLLMAdapter]):
+        """将通过 get_adapter_by_name 借出的适配器归还到池中。"""
+        self.adapter_pool.release(adapter)
@@ -0,0 +1,212 @@
+# llm_cache.py
+# -*- coding: utf-8 -*-
+"""
+LLM响应的内容寻址磁盘缓存。
+- 以 (适配器类型, 模型, 生成参数, 提示词) 的哈希作为键，相同请求直接返回上次的结果；
+- 按步骤启用（默认关闭），适用于章节定稿等输入确定、重复执行时结果可复用的步骤；
+- 条目带有效期，总容量超过上限时按最近最少使用（LRU）淘汰；
+- 流式调用命中缓存时按分片回放，调用方无需区分；
+- 被截断的响应不缓存，调用方校验失败时可用 discard 删除条目，使重试重新请求服务端。
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Optional
+
+# 主开关打开后，未单独设置“启用缓存”的步骤中，以下前缀的步骤默认启用缓存
+DEFAULT_CACHEABLE_STEP_PREFIXES = ("章节定稿_", "定稿章节_")
+
+# 表示输出因长度上限被截断的结束原因（OpenAI 兼容接口为 length，Anthropic 为 max_tokens），此类响应不写入缓存
+TRUNCATED_FINISH_REASONS = ("length", "max_tokens")
+
+
+class ResponseCache:
+    """
+    响应缓存（单例）。每个条目保存为缓存目录下的一个 JSON 文件，
+    文件的修改时间即最近访问时间，用于进程重启后恢复 LRU 顺序。
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(ResponseCache, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, cache_dir: str = os.path.join("ui", "轮询设定", "llm_cache")):
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+        with self._lock:
+            if hasattr(self, '_initialized') and self._initialized:
+                return
+            self.cache_dir = cache_dir
+            self.enabled = False
+            self.ttl_seconds = 7 * 24 * 3600
+            self.max_bytes = 200 * 1024 * 1024
+            self.step_settings: Dict[str, bool] = {}
+            # key -> 文件大小，顺序即 LRU 顺序（最近使用的在末尾）
+            self._entries: "OrderedDict[str, int]" = OrderedDict()
+            self._total_bytes = 0
+            self._loaded = False
+            self._io_lock = threading.Lock()
+            self.hits = 0
+            self.misses = 0
+            self._initialized = True
+
+    def configure(self, enabled: bool = False, ttl_hours: float = 168, max_mb: float = 200,
+                  step_settings: Optional[Dict[str, bool]] = None):
+        """应用轮询设定中的缓存参数。step_settings 为 {步骤名: 是否启用缓存}。"""
+        self.enabled = bool(enabled)
+        self.ttl_seconds = float(ttl_hours) * 3600
+        self.max_bytes = int(float(max_mb) * 1024 * 1024)
+        self.step_settings = dict(step_settings or {})
+        if self.enabled and self._loaded:
+            with self._io_lock:
+                self._evict_locked()
+
+    def is_enabled_for(self, step_name: Optional[str]) -> bool:
+        """判断指定步骤是否使用缓存。"""
+        if not self.enabled or not step_name:
+            return False
+        if step_name in self.step_settings:
+            return bool(self.step_settings[step_name])
+        return step_name.startswith(DEFAULT_CACHEABLE_STEP_PREFIXES)
+
+    @staticmethod
+    def make_key(fingerprint: Dict[str, Any], prompt: str) -> str:
+        """根据适配器指纹（模型与参数）和提示词计算缓存键。"""
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps(fingerprint, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8'))
+        hasher.update(b'\0')
+        hasher.update(prompt.encode('utf-8'))
+        return hasher.hexdigest()
+
+    def _path_for(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.json")
+
+    def _ensure_loaded_locked(self):
+        """首次使用时扫描缓存目录，按文件修改时间重建 LRU 顺序。"""
+        if self._loaded:
+            return
+        found = []
+        if os.path.isdir(self.cache_dir):
+            for root, _, files in os.walk(self.cache_dir):
+                for name in files:
+                    if not name.endswith(".json"):
+                        continue
+                    try:
+                        stat = os.stat(os.path.join(root, name))
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, name[:-5], stat.st_size))
+        found.sort()
+        for _, key, size in found:
+            self._entries[key] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._evict_locked()
+
+    def _remove_locked(self, key: str):
+        size = self._entries.pop(key, None)
+        if size is not None:
+            self._total_bytes -= size
+        try:
+            os.remove(self._path_for(key))
+        except OSError:
+            pass
+
+    def _evict_locked(self):
+        while self._entries and self._total_bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove_locked(oldest)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存条目，不存在或已过期时返回 None。"""
+        with self._io_lock:
+            self._ensure_loaded_locked()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            path = self._path_for(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, json.JSONDecodeError) as e:
+                logging.warning(f"读取响应缓存 {key[:12]} 失败: {e}")
+                self._remove_locked(key)
+                self.misses += 1
+                return None
+            if time.time() - record.get("created", 0) > self.ttl_seconds:
+                self._remove_locked(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            try:
+                os.utime(path, None)
+            except OSError:
+                pass
+            self.hits += 1
+            return record
+
+    def put(self, key: str, response: str, **meta):
+        """写入一个缓存条目（先写临时文件再替换，避免进程中断留下半个文件）。"""
+        record = {"created": time.time(), "response": response}
+        record.update(meta)
+        data = json.dumps(record, ensure_ascii=False).encode('utf-8')
+        with self._io_lock:
+            self._ensure_loaded_locked()
+            path = self._path_for(key)
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logging.error(f"写入响应缓存失败: {e}")
+                return
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict_locked()
+
+    def discard(self, key: str) -> bool:
+        """删除一个条目（例如回放的响应未通过调用方的校验），返回条目是否存在。"""
+        with self._io_lock:
+            self._ensure_loaded_locked()
+            existed = key in self._entries
+            self._remove_locked(key)
+            return existed
+
+    @staticmethod
+    def replay(text: str, chunk_size: int = 64) -> Iterator[str]:
+        """将缓存的完整响应按分片回放，模拟流式输出。"""
+        for i in range(0, len(text), chunk_size):
+            yield text[i:i + chunk_size]
+
+    def clear(self):
+        """删除全部缓存条目。"""
+        with self._io_lock:
+            self._ensure_loaded_locked()
+            for key in list(self._entries):
+                self._remove_locked(key)
+            self._total_bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._io_lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# 全局共享实例
+response_cache = ResponseCache()
@@ -0,0 +1,313 @@
+# log_writer.py
+# -*- coding: utf-8 -*-
+"""
+LLM调用日志的后台批量写入器。
+- 调用方只把日志条目放入队列，序列化和磁盘写入由后台线程批量完成；
+- 当前日志文件超过大小上限或跨天时进行轮转，可选地将已关闭的分段压缩为 .gz；
+- 为当前分段维护一份内存中的偏移量索引，日志查看器可据此按需读取单条记录。
+"""
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+
+class RotatingLogWriter:
+    """
+    将 JSON Lines 日志异步写入文件的后台写入器。
+    轮转后的分段命名为 "<名称>.<日期>.<序号>.log[.gz]"，与当前文件位于同一目录。
+    """
+    def __init__(self, path: str, max_bytes: int = 20 * 1024 * 1024, compress: bool = True,
+                 rotate_daily: bool = True, flush_interval: float = 0.5, max_batch: int = 200):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self.rotate_daily = rotate_daily
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+
+        self._queue: "queue.Queue" = queue.Queue()
+        self._io_lock = threading.Lock()
+        self._index: List[Dict[str, Any]] = []
+        self._index_end = 0
+        self._index_built = False
+        self._current_date = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ---------- 写入 ----------
+
+    def write(self, entry: Dict[str, Any]):
+        """提交一条日志记录，立即返回，不会阻塞在磁盘I/O上。"""
+        self._ensure_started()
+        self._queue.put(entry)
+
+    def flush(self, timeout: float = 5.0):
+        """等待队列中已提交的记录全部落盘（用于查看日志或退出前）。"""
+        if self._thread is None:
+            return
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=f"log-writer-{os.path.basename(self.path)}", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.time() + self.flush_interval
+            # 在短时间窗口内尽量攒批，减少打开文件和系统调用的次数
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            entries = [item for item in batch if not isinstance(item, threading.Event)]
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            if entries:
+                try:
+                    self._write_batch(entries)
+                except Exception as e:
+                    logging.error(f"写入日志文件 {self.path} 失败: {e}")
+            for waiter in waiters:
+                waiter.set()
+
+    def _write_batch(self, entries: List[Dict[str, Any]]):
+        lines = []
+        for entry in entries:
+            try:
+                lines.append((entry, json.dumps(entry, ensure_ascii=False) + '\n'))
+            except (TypeError, ValueError) as e:
+                logging.error(f"序列化日志记录失败: {e}")
+
+        with self._io_lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._rotate_if_needed()
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                if offset < self._index_end:
+                    # 文件被外部截断（例如在查看器中清空），旧索引已失效
+                    self._index.clear()
+                    self._index_built = offset == 0
+                for entry, line in lines:
+                    data = line.encode('utf-8')
+                    f.write(data)
+                    if self._index_built:
+                        self._index.append(self._make_index_entry(entry, offset, len(data)))
+                    offset += len(data)
+                self._index_end = offset
+
+    # 索引中不保留的大字段，查看详情时再按偏移量从文件读取
+    _HEAVY_FIELDS = ("prompt", "response", "traceback")
+
+    @classmethod
+    def _make_index_entry(cls, entry: Dict[str, Any], offset: int, length: int) -> Dict[str, Any]:
+        summary = {k: v for k, v in entry.items() if k not in cls._HEAVY_FIELDS}
+        if isinstance(summary.get("error"), str):
+            summary["error"] = summary["error"][:500]
+        summary["offset"] = offset
+        summary["length"] = length
+        return summary
+
+    # ---------- 轮转 ----------
+
+    def _rotate_if_needed(self):
+        today = datetime.now().strftime("%Y-%m-%d")
+        if self._current_date is None:
+            self._current_date = self._file_date() or today
+        if not os.path.exists(self.path):
+            self._current_date = today
+            return
+        size = os.path.getsize(self.path)
+        if size == 0:
+            self._current_date = today
+            return
+        if size >= self.max_bytes or (self.rotate_daily and self._current_date != today):
+            self._rotate(self._current_date)
+            self._current_date = today
+
+    def _file_date(self) -> Optional[str]:
+        try:
+            return datetime.fromtimestamp(os.path.getmtime(self.path)).strftime("%Y-%m-%d")
+        except OSError:
+            return None
+
+    def _rotate(self, date_str: str):
+        base, ext = os.path.splitext(self.path)
+        seq = 1
+        while glob.glob(f"{base}.{date_str}.{seq}{ext}*"):
+            seq += 1
+        rotated = f"{base}.{date_str}.{seq}{ext}"
+        os.replace(self.path, rotated)
+        self._index.clear()
+        self._index_end = 0
+        self._index_built = True
+        logging.info(f"日志文件已轮转: {rotated}")
+        if self.compress:
+            threading.Thread(target=self._compress_segment, args=(rotated,), daemon=True).start()
+
+    @staticmethod
+    def _compress_segment(segment_path: str):
+        try:
+            with open(segment_path, 'rb') as src, gzip.open(segment_path + ".gz", 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.remove(segment_path)
+        except Exception as e:
+            logging.error(f"压缩日志分段 {segment_path} 失败: {e}")
+
+    # ---------- 读取 ----------
+
+    def list_segments(self) -> List[str]:
+        """返回所有日志分段路径，当前文件排在最前，其余按时间倒序。"""
+        base, ext = os.path.splitext(self.path)
+        # 分段名中包含日期和序号，按名称倒序即为时间倒序
+        rotated = sorted(set(glob.glob(f"{base}.*{ext}") + glob.glob(f"{base}.*{ext}.gz")), key=self._segment_sort_key, reverse=True)
+        segments = [self.path] if os.path.exists(self.path) else []
+        return segments + [p for p in rotated if p != self.path]
+
+    @staticmethod
+    def _segment_sort_key(segment_path: str):
+        parts = os.path.basename(segment_path).split(".")
+        date_str = parts[1] if len(parts) > 1 else ""
+        seq = int(parts[2]) if len(parts) > 2 and parts[2].isdigit() else 0
+        return (date_str, seq)
+
+    def get_index(self) -> List[Dict[str, Any]]:
+        """返回当前分段的偏移量索引（必要时从文件重建）。"""
+        self.flush()
+        with self._io_lock:
+            if not self._index_built:
+                self._rebuild_index()
+            return list(self._index)
+
+    def _rebuild_index(self):
+        self._index.clear()
+        offset = 0
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for raw in f:
+                    try:
+                        entry = json.loads(raw.decode('utf-8'))
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        entry = {}
+                    self._index.append(self._make_index_entry(entry, offset, len(raw)))
+                    offset += len(raw)
+        self._index_end = offset
+        self._index_built = True
+
+    def read_entry(self, offset: int, length: int) -> Optional[Dict[str, Any]]:
+        """按索引中的偏移量读取当前分段中的单条记录。"""
+        with self._io_lock:
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    return json.loads(f.read(length).decode('utf-8'))
+            except (OSError, UnicodeDecodeError, json.JSONDecodeError):
+                return None
+
+    @staticmethod
+    def read_segment(segment_path: str) -> List[Dict[str, Any]]:
+        """读取一个日志分段（支持 .gz）的全部记录。"""
+        opener = gzip.open if segment_path.endswith(".gz") else open
+        entries = []
+        try:
+            with opener(segment_path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass
+        except OSError as e:
+            logging.error(f"读取日志分段 {segment_path} 失败: {e}")
+        return entries
+
+    def clear(self, before_date: Optional[str] = None):
+        """
+        删除日志。before_date 为 None 时删除全部分段并清空当前文件；
+        否则删除该日期之前的分段，并过滤当前文件中更早的记录。
+        """
+        self.flush()
+        with self._io_lock:
+            base, ext = os.path.splitext(self.path)
+            for segment in glob.glob(f"{base}.*{ext}") + glob.glob(f"{base}.*{ext}.gz"):
+                segment_date = os.path.basename(segment)[len(os.path.basename(base)) + 1:][:10]
+                if before_date is None or segment_date < before_date:
+                    try:
+                        os.remove(segment)
+                    except OSError as e:
+                        logging.error(f"删除日志分段 {segment} 失败: {e}")
+            if os.path.exists(self.path):
+                if before_date is None:
+                    open(self.path, 'w').close()
+                else:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        lines = f.readlines()
+                    kept = []
+                    for line in lines:
+                        try:
+                            if json.loads(line)['timestamp'][:10] >= before_date:
+                                kept.append(line)
+                        except (json.JSONDecodeError, KeyError, TypeError):
+                            kept.append(line)  # 保留无法解析的行
+                    with open(self.path, 'w', encoding='utf-8') as f:
+                        f.writelines(kept)
+            self._index.clear()
+            self._index_end = 0
+            self._index_built = False
+
+
+_writers: Dict[str, RotatingLogWriter] = {}
+_writers_lock = threading.Lock()
+_default_options: Dict[str, Any] = {}
+
+
+def get_log_writer(path: str, **kwargs) -> RotatingLogWriter:
+    """获取指定路径的共享写入器，同一文件在进程内只有一个写入器。"""
+    key = os.path.abspath(path)
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            options = dict(_default_options)
+            options.update(kwargs)
+            writer = RotatingLogWriter(path, **options)
+            _writers[key] = writer
+        return writer
+
+
+def configure_log_writers(max_bytes: Optional[int] = None, compress: Optional[bool] = None):
+    """更新轮转参数，对已创建和之后创建的写入器均生效。"""
+    with _writers_lock:
+        if max_bytes is not None:
+            _default_options["max_bytes"] = max_bytes
+        if compress is not None:
+            _default_options["compress"] = compress
+        for writer in _writers.values():
+            if max_bytes is not None:
+                writer.max_bytes = max_bytes
+            if compress is not None:
+                writer.compress = compress
+
+
+def flush_all(timeout: float = 5.0):
+    """将所有写入器中尚未落盘的记录写入磁盘。"""
+    with _writers_lock:
+        writers = list(_writers.values())
+    for writer in writers:
+        writer.flush(timeout)
@@ -1,17 +1,17 @@
 # main.py
 # -*- coding: utf-8 -*-
+# 启动计时最先导入（仅依赖标准库），以便统计之后所有模块的导入耗时
+import startup_profiler
+if startup_profiler.import_profile_requested():
+    startup_profiler.enable_import_timing()
+
 import customtkinter as ctk
 import logging
 import sys
 import os
 
-try:
-    from langchain_core.globals import set_verbose
-except ImportError:
-    from langchain.globals import set_verbose
-
-# 关闭 langchain 的 verbose 日志
-set_verbose(False)
+# langchain 及各模型SDK在首次创建对应适配器时才导入（见 llm_adapters.create_llm_adapter），
+# 不再在启动时加载
 
 # 全局禁用 chromadb 的遥测功能，防止报错
 os.environ["ANONYMIZED_TELEMETRY"] = "false"
@@ -31,6 +31,7 @@ sys.path.insert(0, application_path)
 
 
 from ui import NovelGeneratorGUI
+startup_profiler.mark("导入界面模块")
 
 class StreamToLogger:
     """
@@ -62,7 +63,14 @@ def main():
     sys.stderr = sl_err
 
     app = ctk.CTk()
+    startup_profiler.mark("创建主窗口")
     gui = NovelGeneratorGUI(app)
+    startup_profiler.mark("构建界面")
+
+    def on_first_idle():
+        startup_profiler.mark("首次进入事件循环")
+        startup_profiler.report()
+    app.after_idle(on_first_idle)
 
     def on_closing():
         """处理窗口关闭事件"""
@@ -70,6 +78,13 @@ def main():
             gui.file_observer.stop()
             gui.file_observer.join()
         logging.info("正在关闭应用程序...")
+        # os._exit 不会执行 atexit，退出前先把后台队列中的调用日志写入磁盘
+        from log_writer import flush_all
+        flush_all(timeout=3.0)
+        # 轮询调用状态是延迟写入的，同样需要在退出前写入
+        llm_adapters = sys.modules.get("llm_adapters")
+        if llm_adapters is not None and llm_adapters.PollingManager._instance is not None:
+            llm_adapters.PollingManager().flush_state()
         app.destroy()
         os._exit(0)
 
@@ -0,0 +1,483 @@
+# mock_llm_server.py
+# -*- coding: utf-8 -*-
+"""
+本地模拟LLM服务，用于离线压测 WorkflowEngine / execute_with_polling 和真实适配器的故障切换。
+实现的接口：
+- OpenAI 兼容：/v1/chat/completions（流式与非流式）、/v1/models、/v1/embeddings
+- Anthropic：/v1/messages（流式与非流式）
+- Ollama：/api/chat、/api/embed、/api/embeddings、/api/tags
+- 统计：/_mock/stats
+
+可配置首字延迟、生成速度、错误率、周期性 429 突发和流中途卡死，
+并按提示词类型返回结构上可被解析的内容（如章节目录提示词返回合法的章节目录块）。
+
+用法：
+    python mock_llm_server.py --port 8765 --ttft 0.8 --tps 60 --error-rate 0.05
+然后在配置中将 base_url 设为 http://127.0.0.1:8765/v1（Ollama 为 http://127.0.0.1:8765）。
+"""
+import argparse
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+class MockBehavior:
+    """模拟服务的行为参数。"""
+    def __init__(self, ttft: float = 0.5, tokens_per_sec: float = 50.0, error_rate: float = 0.0,
+                 burst_429_every: int = 0, burst_429_length: int = 3, retry_after: float = 2.0,
+                 stall_rate: float = 0.0, stall_seconds: float = 30.0, embedding_dim: int = 256,
+                 seed: Optional[int] = None):
+        self.ttft = ttft                          # 首字延迟（秒）
+        self.tokens_per_sec = tokens_per_sec      # 生成速度，0 表示不限速
+        self.error_rate = error_rate              # 返回 500 的概率
+        self.burst_429_every = burst_429_every    # 每隔多少个请求出现一次 429 突发，0 表示关闭
+        self.burst_429_length = burst_429_length  # 每次突发连续返回 429 的请求数
+        self.retry_after = retry_after            # 429 响应中的 Retry-After 秒数
+        self.stall_rate = stall_rate              # 流式输出中途卡死并断开的概率
+        self.stall_seconds = stall_seconds        # 卡死的时长
+        self.embedding_dim = embedding_dim
+        self.random = random.Random(seed)
+
+
+class MockStats:
+    """请求计数，供压测脚本读取。"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {}
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counters)
+
+
+# ---------- 模拟内容 ----------
+
+_PROSE_SENTENCES = [
+    "夜色像一层薄雾压在城墙上，远处的更鼓声断断续续。",
+    "他握紧了袖中的铜牌，指节因为用力而微微发白。",
+    "风从破窗里灌进来，烛火摇晃，墙上的影子忽长忽短。",
+    "她没有回头，只是把那封信折好，塞进了贴身的衣襟。",
+    "院子里的老槐树沙沙作响，仿佛在低声诉说着什么旧事。",
+    "一阵急促的脚步声由远及近，停在了门外。",
+    "谁也没有开口，沉默比任何争吵都更令人不安。",
+    "他忽然想起三年前那个雨夜，想起那双在黑暗中发亮的眼睛。",
+]
+
+
+def _prose(length: int, rnd: random.Random) -> str:
+    parts, total = [], 0
+    while total < length:
+        sentence = rnd.choice(_PROSE_SENTENCES)
+        parts.append(sentence)
+        total += len(sentence)
+        if rnd.random() < 0.25:
+            parts.append("\n\n")
+    return "".join(parts)
+
+
+def _blueprint_entry(chapter: int, rnd: random.Random) -> str:
+    return (
+        f"第{chapter}章 暗潮{chapter}\n"
+        f"├─本章定位：推进主线，揭示与第{chapter}章相关的关键线索\n"
+        "├─核心作用：推动情节并激化主要矛盾\n"
+        "├─叙事视角：主角（第三人称限定）\n"
+        "├─场景设定：\n"
+        "│├─时间：黄昏\n"
+        "│├─地点：城西旧宅，院中荒草丛生\n"
+        "│└─氛围：紧张\n"
+        "├─出场角色与动机：\n"
+        "│├─主角：追查失踪的信使，情绪焦虑\n"
+        "│└─神秘人：试图阻止主角，态度坚决\n"
+        "├─情节脉络（起-承-转-合）：\n"
+        "│├─起：主角在旧宅发现信使留下的记号\n"
+        "│├─承：神秘人现身并试图销毁记号\n"
+        "│├─转：争执中暗格被打开，露出一卷残页\n"
+        "│└─合：残页内容指向更大的阴谋，神秘人趁乱逃离\n"
+        "├─悬念类型：信息差型\n"
+        "├─情绪演变：期待 → 错愕 → 坚定\n"
+        "├─伏笔条目：\n"
+        f"│└─YF{chapter:03d}(一般伏笔)-残页暗纹-埋设-残页背面有被火烤过的暗纹（第{chapter + 5}章前必须回收）\n"
+        f"├─颠覆指数：Lv.{rnd.randint(1, 5)}（颠覆源：残页内容）\n"
+        "└─本章简述：主角在旧宅追查线索，与神秘人交锋并得到指向阴谋的残页\n"
+    )
+
+
+def canned_response(prompt: str, rnd: random.Random) -> str:
+    """根据提示词类型生成结构上合理的模拟输出。"""
+    match = re.search(r"现在请设计第\s*(\d+)\s*章到第\s*(\d+)\s*章", prompt)
+    if match:
+        start, end = int(match.group(1)), int(match.group(2))
+        end = min(end, start + 49)
+        return "\n".join(_blueprint_entry(chapter, rnd) for chapter in range(start, end + 1))
+    if re.search(r"JSON|json", prompt):
+        return json.dumps({"status": "ok", "items": [], "summary": _prose(60, rnd)}, ensure_ascii=False)
+    match = re.search(r"(\d{3,5})\s*[-~～到至]\s*(\d{3,5})\s*字", prompt)
+    if match:
+        low, high = sorted((int(match.group(1)), int(match.group(2))))
+        return _prose(rnd.randint(low, high), rnd)
+    return _prose(300, rnd)
+
+
+def _tokenize(text: str) -> List[str]:
+    """粗略切分为“Token”：中文每两个字一块，便于按速率流式输出。"""
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+
+def _estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / 2))
+
+
+def _embedding(text: str, dim: int) -> List[float]:
+    """由文本哈希得到确定性的单位向量，相同文本总是得到相同向量。"""
+    seed = int(hashlib.sha256(text.encode('utf-8')).hexdigest()[:16], 16)
+    rnd = random.Random(seed)
+    vector = [rnd.uniform(-1, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+def _prompt_from_messages(messages: Any) -> str:
+    parts = []
+    for message in messages or []:
+        content = message.get("content", "") if isinstance(message, dict) else ""
+        if isinstance(content, list):
+            content = "".join(block.get("text", "") for block in content if isinstance(block, dict))
+        parts.append(str(content))
+    return "\n".join(parts)
+
+
+class StallAbort(Exception):
+    """模拟流卡死后断开连接。"""
+    pass
+
+
+# ---------- HTTP 处理 ----------
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def behavior(self) -> MockBehavior:
+        return self.server.behavior
+
+    @property
+    def stats(self) -> MockStats:
+        return self.server.stats
+
+    def log_message(self, format, *args):
+        logging.debug("mock-llm: " + format % args)
+
+    # ----- 基础工具 -----
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return {}
+
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self, content_type: str):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Cache-Control", "no-cache")
+        # 流式响应以关闭连接结束，不使用分块编码，便于模拟中途断开
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+    def _write(self, text: str):
+        self.wfile.write(text.encode('utf-8'))
+        self.wfile.flush()
+
+    def _injected_error(self) -> bool:
+        """按配置注入 429 突发或 500 错误，返回 True 表示已发送错误响应。"""
+        behavior = self.behavior
+        request_no = self.server.next_request_number()
+        if behavior.burst_429_every and request_no % behavior.burst_429_every < behavior.burst_429_length:
+            self.stats.incr("429")
+            self._send_json(429, {"error": {"message": "Rate limit exceeded (mock)", "type": "rate_limit_error", "code": 429}},
+                            {"Retry-After": f"{behavior.retry_after:g}"})
+            return True
+        if behavior.error_rate and behavior.random.random() < behavior.error_rate:
+            self.stats.incr("500")
+            self._send_json(500, {"error": {"message": "Internal server error (mock)", "type": "server_error", "code": 500}})
+            return True
+        return False
+
+    def _paced_tokens(self, text: str) -> Iterator[str]:
+        """按首字延迟和生成速度逐块产出文本；按配置概率在中途卡死并断开。"""
+        behavior = self.behavior
+        tokens = _tokenize(text)
+        stall_at = None
+        if behavior.stall_rate and behavior.random.random() < behavior.stall_rate and tokens:
+            stall_at = behavior.random.randint(0, len(tokens) - 1)
+        time.sleep(behavior.ttft)
+        interval = 1.0 / behavior.tokens_per_sec if behavior.tokens_per_sec > 0 else 0
+        for index, token in enumerate(tokens):
+            if index == stall_at:
+                self.stats.incr("stalled")
+                time.sleep(behavior.stall_seconds)
+                raise StallAbort()
+            yield token
+            if interval:
+                time.sleep(interval)
+
+    def _generate(self, prompt: str, max_tokens: Optional[int]) -> str:
+        text = canned_response(prompt, self.behavior.random)
+        if max_tokens:
+            text = text[:int(max_tokens) * 2]
+        return text
+
+    # ----- 路由 -----
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        self.stats.incr(f"GET {path}")
+        if path in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": name, "object": "model", "owned_by": "mock"} for name in self.server.model_names
+            ]})
+        elif path == "/api/tags":
+            self._send_json(200, {"models": [{"name": name, "model": name} for name in self.server.model_names]})
+        elif path == "/_mock/stats":
+            self._send_json(200, self.stats.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path: {path}"}})
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        body = self._read_json()
+        self.stats.incr(f"POST {path}")
+        routes = {
+            "/v1/chat/completions": self._openai_chat,
+            "/chat/completions": self._openai_chat,
+            "/v1/embeddings": self._openai_embeddings,
+            "/embeddings": self._openai_embeddings,
+            "/v1/messages": self._anthropic_messages,
+            "/api/chat": self._ollama_chat,
+            "/api/embed": self._ollama_embed,
+            "/api/embeddings": self._ollama_embed,
+        }
+        handler = routes.get(path)
+        if handler is None:
+            self._send_json(404, {"error": {"message": f"Unknown path: {path}"}})
+            return
+        if self._injected_error():
+            return
+        try:
+            handler(body)
+        except StallAbort:
+            pass
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端主动断开（例如对冲请求被取消）
+            self.stats.incr("client_disconnect")
+
+    # ----- OpenAI -----
+
+    def _openai_chat(self, body: Dict[str, Any]):
+        prompt = _prompt_from_messages(body.get("messages"))
+        model = body.get("model") or "mock-model"
+        text = self._generate(prompt, body.get("max_tokens"))
+        prompt_tokens, completion_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            time.sleep(self.behavior.ttft + (completion_tokens / self.behavior.tokens_per_sec if self.behavior.tokens_per_sec > 0 else 0))
+            self._send_json(200, {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            return
+
+        def chunk(delta: Dict[str, Any], finish_reason=None, **extra) -> str:
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+            payload.update(extra)
+            return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        self._start_stream("text/event-stream")
+        self._write(chunk({"role": "assistant", "content": ""}))
+        for token in self._paced_tokens(text):
+            self._write(chunk({"content": token}))
+        self._write(chunk({}, "stop"))
+        if (body.get("stream_options") or {}).get("include_usage"):
+            payload = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                       "choices": [], "usage": usage}
+            self._write(f"data: {json.dumps(payload)}\n\n")
+        self._write("data: [DONE]\n\n")
+
+    def _openai_embeddings(self, body: Dict[str, Any]):
+        inputs = body.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        data = [{"object": "embedding", "index": i, "embedding": _embedding(str(text), self.behavior.embedding_dim)}
+                for i, text in enumerate(inputs)]
+        tokens = sum(_estimate_tokens(str(text)) for text in inputs)
+        self._send_json(200, {"object": "list", "data": data, "model": body.get("model") or "mock-embedding",
+                              "usage": {"prompt_tokens": tokens, "total_tokens": tokens}})
+
+    # ----- Anthropic -----
+
+    def _anthropic_messages(self, body: Dict[str, Any]):
+        prompt = _prompt_from_messages(body.get("messages"))
+        model = body.get("model") or "mock-claude"
+        text = self._generate(prompt, body.get("max_tokens"))
+        input_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+
+        if not body.get("stream"):
+            time.sleep(self.behavior.ttft)
+            self._send_json(200, {
+                "id": message_id, "type": "message", "role": "assistant", "model": model,
+                "content": [{"type": "text", "text": text}], "stop_reason": "end_turn", "stop_sequence": None,
+                "usage": {"input_tokens": input_tokens, "output_tokens": output_tokens},
+            })
+            return
+
+        def event(name: str, payload: Dict[str, Any]) -> str:
+            return f"event: {name}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+        self._start_stream("text/event-stream")
+        self._write(event("message_start", {"type": "message_start", "message": {
+            "id": message_id, "type": "message", "role": "assistant", "model": model, "content": [],
+            "stop_reason": None, "stop_sequence": None, "usage": {"input_tokens": input_tokens, "output_tokens": 1}}}))
+        self._write(event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                  "content_block": {"type": "text", "text": ""}}))
+        for token in self._paced_tokens(text):
+            self._write(event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                      "delta": {"type": "text_delta", "text": token}}))
+        self._write(event("content_block_stop", {"type": "content_block_stop", "index": 0}))
+        self._write(event("message_delta", {"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                            "usage": {"output_tokens": output_tokens}}))
+        self._write(event("message_stop", {"type": "message_stop"}))
+
+    # ----- Ollama -----
+
+    def _ollama_chat(self, body: Dict[str, Any]):
+        prompt = _prompt_from_messages(body.get("messages"))
+        model = body.get("model") or "mock-llama"
+        text = self._generate(prompt, (body.get("options") or {}).get("num_predict"))
+        prompt_tokens, output_tokens = _estimate_tokens(prompt), _estimate_tokens(text)
+
+        def line(content: str, done: bool) -> str:
+            payload = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                       "message": {"role": "assistant", "content": content}, "done": done}
+            if done:
+                payload.update({"done_reason": "stop", "prompt_eval_count": prompt_tokens, "eval_count": output_tokens})
+            return json.dumps(payload, ensure_ascii=False) + "\n"
+
+        # Ollama 默认流式输出
+        if body.get("stream") is False:
+            time.sleep(self.behavior.ttft)
+            self._send_json(200, json.loads(line(text, True)))
+            return
+        self._start_stream("application/x-ndjson")
+        for token in self._paced_tokens(text):
+            self._write(line(token, False))
+        self._write(line("", True))
+
+    def _ollama_embed(self, body: Dict[str, Any]):
+        inputs = body.get("input", body.get("prompt", ""))
+        dim = self.behavior.embedding_dim
+        if isinstance(inputs, list):
+            self._send_json(200, {"model": body.get("model"), "embeddings": [_embedding(str(t), dim) for t in inputs]})
+        else:
+            # /api/embeddings（旧接口）返回单个 embedding，/api/embed 返回 embeddings 列表
+            vector = _embedding(str(inputs), dim)
+            self._send_json(200, {"model": body.get("model"), "embedding": vector, "embeddings": [vector]})
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], behavior: MockBehavior, model_names: Optional[List[str]] = None):
+        super().__init__(address, MockLLMHandler)
+        self.behavior = behavior
+        self.stats = MockStats()
+        self.model_names = model_names or ["mock-model", "mock-claude", "mock-llama", "mock-embedding"]
+        self._request_counter = 0
+        self._counter_lock = threading.Lock()
+
+    def next_request_number(self) -> int:
+        with self._counter_lock:
+            number = self._request_counter
+            self._request_counter += 1
+            return number
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 0, **behavior_kwargs) -> MockLLMServer:
+    """在后台线程中启动模拟服务（port 为 0 时自动分配端口），供压测脚本使用。"""
+    server = MockLLMServer((host, port), MockBehavior(**behavior_kwargs))
+    threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True).start()
+    logging.info(f"模拟LLM服务已启动: {server.base_url}")
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地模拟LLM服务（OpenAI / Anthropic / Ollama 兼容）")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.5, help="首字延迟（秒）")
+    parser.add_argument("--tps", type=float, default=50.0, help="生成速度（Token/秒），0 表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--burst-429-every", type=int, default=0, help="每隔多少个请求出现一次 429 突发")
+    parser.add_argument("--burst-429-length", type=int, default=3, help="每次突发连续返回 429 的请求数")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="429 响应中的 Retry-After 秒数")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="流式输出中途卡死并断开的概率")
+    parser.add_argument("--stall-seconds", type=float, default=30.0, help="卡死时长（秒）")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子，便于复现")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    behavior = MockBehavior(
+        ttft=args.ttft, tokens_per_sec=args.tps, error_rate=args.error_rate,
+        burst_429_every=args.burst_429_every, burst_429_length=args.burst_429_length,
+        retry_after=args.retry_after, stall_rate=args.stall_rate, stall_seconds=args.stall_seconds,
+        seed=args.seed,
+    )
+    server = MockLLMServer((args.host, args.port), behavior)
+    logging.info(f"模拟LLM服务监听于 {server.base_url}（OpenAI/Anthropic 使用 {server.base_url}/v1，Ollama 使用 {server.base_url}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import os
 import re
 import logging
 from novel_generator.common import invoke_with_cleaning
+from novel_generator.stream_sink import StreamSink
 from llm_adapters import create_llm_adapter
 from prompt_definitions import chapter_blueprint_prompt
 from utils import read_file, clear_file_content, save_string_to_txt
@@ -117,11 +118,11 @@ def Chapter_blueprint_generate(
                     log_func("\nLLM 返回内容:")
                 chunk_result = ""
                 from novel_generator.common import invoke_stream_with_cleaning
-                for chunk in invoke_stream_with_cleaning(llm_adapter, chunk_prompt):
-                    if chunk:
-                        chunk_result += chunk
-                        if log_func:
-                            log_func(chunk, stream=True)
+                with StreamSink(log_func, console=False) as sink:
+                    for chunk in invoke_stream_with_cleaning(llm_adapter, chunk_prompt):
+                        if chunk:
+                            chunk_result += chunk
+                            sink.write(chunk)
                 if log_func:
                     log_func("\n")
                 if chunk_result:
@@ -148,11 +149,11 @@ def Chapter_blueprint_generate(
                     log_func("\nLLM 返回内容:")
                 result = ""
                 from novel_generator.common import invoke_stream_with_cleaning
-                for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
-                    if chunk:
-                        result += chunk
-                        if log_func:
-                            log_func(chunk, stream=True)
+                with StreamSink(log_func, console=False) as sink:
+                    for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
+                        if chunk:
+                            result += chunk
+                            sink.write(chunk)
                 if log_func:
                     log_func("\n")
                 if result:
@@ -12,6 +12,7 @@ import asyncio
 import threading
 from typing import Dict, List, Tuple, Any, Optional
 from .common import invoke_stream_with_cleaning
+from .stream_sink import StreamSink
 from prompt_definitions import create_character_prompt  # 添加这行导入
 from utils import read_file, save_string_to_txt, clear_file_content
 from embedding_adapters import create_embedding_adapter  # 添加这一行导入语句
@@ -297,11 +298,11 @@ def generate_chapter_draft(
 
         # 流式调用LLM
         result = ""
-        for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
-            if chunk:
-                result += chunk
-                if log_func:
-                    log_func(chunk, stream=True)
+        with StreamSink(log_func, console=False) as sink:
+            for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
+                if chunk:
+                    result += chunk
+                    sink.write(chunk)
         
         if log_func:
             log_func("\n")
@@ -422,11 +423,11 @@ def finalize_chapter(
         
         # 流式调用LLM
         finalized_chapter = ""
-        for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
-            if chunk:
-                finalized_chapter += chunk
-                if log_func:
-                    log_func(chunk, stream=True)
+        with StreamSink(log_func, console=False) as sink:
+            for chunk in invoke_stream_with_cleaning(llm_adapter, prompt):
+                if chunk:
+                    finalized_chapter += chunk
+                    sink.write(chunk)
         
         if log_func:
             log_func("\n")
@@ -6,6 +6,7 @@ import json  # 添加json导入
 import threading
 
 from novel_generator.common import invoke_stream_with_cleaning
+from novel_generator.stream_sink import StreamSink
 from llm_adapters import create_llm_adapter
 from novel_generator.volume import extract_volume_outline
 from prompt_definitions import chapter_blueprint_prompt
@@ -967,10 +968,11 @@ def generate_volume_chapters(
         #     log_func("\nLLM 返回内容:")
 
         result = ""
-        for chunk in invoke_stream_with_cleaning(llm, prompt, log_func=log_func, log_stream=False):
-            if chunk:
-                result += chunk
-                _log(chunk, stream=True)
+        with StreamSink(_log, console=False) as sink:
+            for chunk in invoke_stream_with_cleaning(llm, prompt, log_func=log_func, log_stream=False):
+                if chunk:
+                    result += chunk
+                    sink.write(chunk)
         _log("\n")
 
         if not result or not result.strip():
@@ -0,0 +1,118 @@
+# novel_generator/chapter_prefetch.py
+# -*- coding: utf-8 -*-
+"""
+下一章草稿准备工作的提前执行（流水线模式）。
+第 N 章定稿期间，第 N+1 章不依赖定稿结果的准备工作可以先行：蓝图查找、角色候选挑选（LLM 调用）和伏笔检索。
+定稿完成后再用 validate 检查这些结果是否仍然有效：
+- 蓝图：第 N+1 章蓝图文本未变才沿用，否则全部作废；
+- 角色：挑选时看到的角色索引表未变才沿用 LLM 的挑选结果；角色详情检索始终在定稿后重做（只读本地文件）；
+- 伏笔：伏笔存储文件未被改写才沿用检索结果，否则重新检索（只读本地文件）。
+挑选角色时使用的前情摘要和剧情要点停留在第 N-1 章，只作为参考上下文，不作为失效条件。
+"""
+import os
+import re
+import threading
+from typing import Callable, List, Optional, Tuple
+
+from novel_generator.json_utils import get_store_path, load_store
+
+
+def lookup_chapter_blueprints(directory_content: str, chap_num: int) -> Tuple[str, str]:
+    """从章节目录中取出本章和下一章的蓝图文本。"""
+    current_match = re.search(rf"^第{chap_num}章.*?(?=^第\d+章|\Z)", directory_content, re.MULTILINE | re.DOTALL)
+    next_match = re.search(rf"^第{chap_num + 1}章.*?(?=^第\d+章|\Z)", directory_content, re.MULTILINE | re.DOTALL)
+    return (current_match.group(0).strip() if current_match else "",
+            next_match.group(0).strip() if next_match else "")
+
+
+def extract_foreshadowing_ids(chapter_blueprint: str) -> List[str]:
+    """提取本章蓝图中涉及的伏笔编号（去重排序）。"""
+    if not chapter_blueprint:
+        return []
+    # 在伏笔块中查找所有ID，然后去重
+    foreshadowing_block_match = re.search(r'├─伏笔条目：([\s\S]*?)(?=\n[├└]─[\u4e00-\u9fa5]|\Z)', chapter_blueprint)
+    if foreshadowing_block_match:
+        return sorted(set(re.findall(r'([A-Z]{1,2}F\d+)', foreshadowing_block_match.group(1))))
+    # 保险措施：如果找不到区块，则全局搜索
+    return sorted(set(re.findall(r'([A-Z]{1,2}F\d+)', chapter_blueprint)))
+
+
+def retrieve_foreshadowing_context(project_path: str, foreshadowing_ids: List[str], log_func: Callable[[str], None]) -> str:
+    """从伏笔存储中检索各伏笔的历史内容，拼成草稿提示词中的 knowledge_context。"""
+    if not foreshadowing_ids:
+        log_func("  -> 本章蓝图不涉及任何伏笔。")
+        return "(无相关伏笔历史记录)"
+
+    log_func(f"  -> 本章涉及伏笔: {', '.join(foreshadowing_ids)}")
+    foreshadowing_store = load_store(project_path, "foreshadowing_collection")
+    if not foreshadowing_store:
+        log_func("  -> ⚠️ `伏笔状态.md` 不存在或加载失败，无法检索历史。")
+        return "(伏笔JSON文件不可用)"
+
+    retrieved_foreshadows = []
+    for fb_id in foreshadowing_ids:
+        log_func(f"    -> 正在检索伏笔 {fb_id}...")
+        fs_data = foreshadowing_store.get(fb_id)
+        if fs_data and '内容' in fs_data:
+            retrieved_foreshadows.append(f"伏笔 {fb_id} 的历史内容:\n{fs_data['内容']}")
+            log_func(f"      ✅ 成功检索到伏笔 {fb_id}。")
+        else:
+            log_func(f"      ℹ️ 未找到伏笔 {fb_id} 的历史记录。")
+
+    if retrieved_foreshadows:
+        return "\n\n".join(retrieved_foreshadows)
+    return "(未检索到任何相关伏笔历史记录)"
+
+
+def store_signature(project_path: str, collection_name: str) -> Optional[Tuple[int, int]]:
+    """存储文件的 (修改时间, 大小)，文件不存在时为 None；用于判断定稿是否改写了它。"""
+    try:
+        stat = os.stat(get_store_path(project_path, collection_name))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def prefetch_log_func(logger: Callable[..., None], chap_num: int):
+    """提前准备只输出普通日志并加前缀，计时器和流式内容留给定稿的主流程显示。"""
+    def log(message, *args, **kwargs):
+        if kwargs.get("replace_last_line") or kwargs.get("stream"):
+            return
+        logger(f"[预取:第{chap_num}章] {message}")
+    return log
+
+
+class ChapterPrefetch:
+    """一次提前准备的结果。由后台线程填充，wait() 之后才可读取。"""
+    def __init__(self, chap_num: int):
+        self.chap_num = chap_num
+        self.current_chapter_blueprint = ""
+        self.foreshadowing_ids: List[str] = []
+        self.foreshadowing_signature = None
+        self.knowledge_context: Optional[str] = None
+        self.character_result = ""
+        self.character_ids: List[str] = []
+        self.character_index: Optional[str] = None
+        self.error: Optional[BaseException] = None
+        self._done = threading.Event()
+
+    def finish(self):
+        self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def validate(self, project_path: str, current_chapter_blueprint: str, character_index: str):
+        """
+        对照定稿后的最新文件检查提前准备的结果。
+        返回 (可沿用的角色挑选结果或 None, 可沿用的伏笔上下文或 None)。
+        """
+        if self.error is not None or current_chapter_blueprint != self.current_chapter_blueprint:
+            return None, None
+        characters = None
+        if self.character_result and character_index == self.character_index:
+            characters = (self.character_result, self.character_ids)
+        knowledge_context = None
+        if self.knowledge_context is not None and store_signature(project_path, "foreshadowing_collection") == self.foreshadowing_signature:
+            knowledge_context = self.knowledge_context
+        return characters, knowledge_context
@@ -8,6 +8,7 @@ import traceback
 import re
 from utils import read_file, save_string_to_txt
 from novel_generator.common import invoke_with_cleaning
+from novel_generator.structured_output import CHARACTER_STATE_SPEC, StructuredOutputError, invoke_structured, structured_output_enabled
 from prompt_definitions import Character_name_prompt, update_character_state_prompt
 
 def extract_character_index_table(file_path: str) -> str:
@@ -234,6 +235,36 @@ def parse_character_state_md(md_content: str) -> dict:
             
     return store
 
+def character_db_entries_from_states(states: dict) -> dict:
+    """
+    由结构化输出得到的角色状态对象（与 _final_perfect_parser 的结构一致）直接生成
+    update_character_db_txt 所需的数据，不再经过 Markdown 文本和正则解析。
+    """
+    store = {}
+    for char_id, char in states.items():
+        base_info = dict(char.get("基础信息") or {})
+        faction = (char.get("势力特征") or {}).get("势力归属", "无")
+        if isinstance(faction, dict):
+            faction = faction.get("所属势力", "无")
+
+        location = "未知"
+        tracks = []
+        for track in char.get("位置轨迹") or []:
+            details = [track.get("场景名称", "")] + [f"{k}：{v}" for k, v in track.items() if k != "场景名称"]
+            chapter_match = re.search(r'第(\d+)章', str(track.get("所在章节", "")))
+            tracks.append(("-".join(details), int(chapter_match.group(1)) if chapter_match else 0))
+        if tracks:
+            location = max(tracks, key=lambda x: x[1])[0]
+
+        store[char_id] = {
+            "正式名称": char.get("名称") or char_id,
+            "基础信息": base_info,
+            "势力特征": {"势力归属": faction or "无"},
+            "生命状态": {"身体状态": (char.get("生命状态") or {}).get("身体状态", "未知")},
+            "位置详情": location,
+        }
+    return store
+
 def update_character_states(chapter_text, chapter_title, chap_num, filepath, llm_adapter, chapter_blueprint_content="", log_func=None, genre="", volume_count=0, num_chapters=0, volume_number=1, **kwargs):
     """
     使用基于Markdown的工作流更新角色状态，并同步回 .txt 数据库。
@@ -285,25 +316,44 @@ def update_character_states(chapter_text, chapter_title, chap_num, filepath, llm
             old_state=old_state_md,
             Character_Database=character_id_result
         )
-        new_state_md_str = invoke_with_cleaning(llm_adapter, char_update_prompt, log_func=log_func)
-        
-        if not new_state_md_str or new_state_md_str.strip() == "(空)" or "{}" in new_state_md_str:
-            _log("    ℹ️ LLM返回的角色状态为空或无变化，跳过更新。")
-            result["status"] = "success"
-            result["message"] = "LLM返回的角色状态为空或无变化。"
-            result["character_state"] = ""
-            return result
+        from novel_generator.json_utils import _json_to_markdown_character, _markdown_to_json, load_store, save_store
+
+        structured_states = None
+        if structured_output_enabled(llm_adapter):
+            try:
+                characters = invoke_structured(llm_adapter, char_update_prompt, CHARACTER_STATE_SPEC, log_func=log_func)["角色"]
+                # 结构化输出的对象与解析后的存储结构一致，直接使用
+                structured_states = {char["ID"].strip(): char for char in characters if char["ID"].strip()}
+            except StructuredOutputError as e:
+                _log(f"  -> 结构化输出失败（{e}），改用Markdown格式重新请求。")
+
+        if structured_states is not None:
+            if not structured_states:
+                _log("    ℹ️ LLM返回的角色状态为空或无变化，跳过更新。")
+                result["status"] = "success"
+                result["message"] = "LLM返回的角色状态为空或无变化。"
+                return result
+            new_states_dict = structured_states
+            new_state_md_str = "\n---\n".join(_json_to_markdown_character(char) for char in structured_states.values())
+        else:
+            new_state_md_str = invoke_with_cleaning(llm_adapter, char_update_prompt, log_func=log_func)
+
+            if not new_state_md_str or new_state_md_str.strip() == "(空)" or "{}" in new_state_md_str:
+                _log("    ℹ️ LLM返回的角色状态为空或无变化，跳过更新。")
+                result["status"] = "success"
+                result["message"] = "LLM返回的角色状态为空或无变化。"
+                result["character_state"] = ""
+                return result
+
+            # 解析LLM返回的新状态
+            new_states_dict = _markdown_to_json(new_state_md_str, "character_state_collection")
+            if not new_states_dict:
+                _log("    ℹ️ LLM返回的角色状态无法解析，跳过更新。")
+                result["status"] = "success"
+                result["message"] = "LLM返回的角色状态无法解析。"
+                return result
 
         _log("步骤4: 合并并保存新的Markdown状态...")
-        from novel_generator.json_utils import _markdown_to_json, load_store, save_store
-        
-        # 解析LLM返回的新状态
-        new_states_dict = _markdown_to_json(new_state_md_str, "character_state_collection")
-        if not new_states_dict:
-            _log("    ℹ️ LLM返回的角色状态无法解析，跳过更新。")
-            result["status"] = "success"
-            result["message"] = "LLM返回的角色状态无法解析。"
-            return result
 
         # 加载现有的所有角色状态
         existing_states_dict = load_store(filepath, "character_state_collection")
@@ -319,7 +369,10 @@ def update_character_states(chapter_text, chapter_title, chap_num, filepath, llm
 
         _log("步骤5: 同步更新 角色数据库.txt...")
         try:
-            character_store = parse_character_state_md(new_state_md_str)
+            if structured_states is not None:
+                character_store = character_db_entries_from_states(structured_states)
+            else:
+                character_store = parse_character_state_md(new_state_md_str)
             if character_store:
                 update_character_db_txt(character_db_txt_path, character_store, _log)
             else:
@@ -1,6 +1,7 @@
 #novel_generator/common.py
 # -*- coding: utf-8 -*-
 """通用重试、清洗、日志工具"""
+import asyncio
 import logging
 import re
 import time
@@ -10,7 +11,13 @@ import queue
 import sys
 import sys
 import json
-from openai import APIStatusError
+from llm_adapters import LLMRequestCancelled
+from novel_generator.retry_policy import NonRetryableLLMError, RetryBudget, default_retry_policy, error_status_code, sleep_with_interrupt
+from novel_generator.stream_salvage import OverlapTrimmer, build_continuation_prompt, make_stream_salvage
+from novel_generator.stream_sink import StreamSink, configure_stream_sink
+from novel_generator.stream_ticker import stream_ticker
+from novel_generator.stream_result import StreamCollector, StreamResult, collect_stream
+from think_filter import REASONING_CHANNEL
 
 class SingleProviderExecutionError(Exception):
     """自定义异常，用于表示在单提供商模式下执行失败。"""
@@ -105,18 +112,54 @@ def extract_thinking_content(response_chunk):
     
     return thinking_content, content
 
-def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, check_interrupted=None, log_func=None, log_stream=True) -> str:
-    """使用流式输出调用 LLM 并清理返回结果"""
-    result_text = ""
-    for chunk in invoke_stream_with_cleaning(llm_adapter, prompt, max_retries, check_interrupted, log_func, log_stream):
-        result_text += chunk
-    return result_text
+def _make_reasoning_handler(llm_adapter, ticker_handle):
+    echo = getattr(llm_adapter, "reasoning_mode", None) == REASONING_CHANNEL
 
-def invoke_stream_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, check_interrupted=None, log_func=None, log_stream=True):
+    def handle(text: str):
+        ticker_handle.add_reasoning(len(text))
+        if echo:
+            stream_print(text, thinking=True)
+    return handle
+
+def invoke_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, check_interrupted=None, log_func=None, log_stream=True, retry_policy=None) -> str:
+    """使用流式输出调用 LLM 并清理返回结果。返回的 StreamResult 可按 str 使用，stats 中带有调用统计。"""
+    return collect_stream(invoke_stream_with_cleaning(llm_adapter, prompt, max_retries, check_interrupted, log_func, log_stream, retry_policy))
+
+def invoke_stream_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3, check_interrupted=None, log_func=None, log_stream=True, retry_policy=None):
     """
     使用流式输出调用 LLM，并以生成器方式返回清理后的文本块。
     增加了在LLM思考时的读秒计时功能，并能在GUI日志中反映。
+    失败时按 retry_policy（默认 default_retry_policy）判断是否重试及等待时间，
+    并受适配器上挂载的步骤重试预算（retry_budget）限制。
+    适配器上挂载了启用的续写状态（stream_salvage）时，中断后的重试改为从已生成内容处续写。
+    生成器结束时返回（StopIteration.value）带统计的 StreamResult，可用 collect_stream 取得。
     """
+    policy = retry_policy or default_retry_policy
+    salvage = getattr(llm_adapter, "stream_salvage", None)
+    if salvage is not None and not salvage.enabled:
+        salvage = None
+
+    # 分片先进入缓存，按时间间隔或字数批量刷新到终端和GUI日志（log_stream 为 False 时只写终端）
+    sink = StreamSink(log_func if log_stream else None)
+    # 交给调用方的文本按列表缓存，结束时生成 StreamResult
+    collector = StreamCollector()
+
+    def _emit(content):
+        sink.write(content)
+        cleaned_content = content.replace("```", "")
+        collector.add(cleaned_content)
+        yield cleaned_content
+
+    # 本次调用已经交给调用方的原始文本，续写时作为已生成部分
+    generated = ""
+    if salvage:
+        carried = salvage.get(prompt)
+        if carried:
+            # 上一个配置在中途断开：先把已生成部分交给调用方，再从断点续写
+            if log_func:
+                log_func(f"  -> 续写恢复：沿用上一配置中断前已生成的 {len(carried)} 字，从断点继续。")
+            yield from _emit(carried)
+            generated = carried
     # sys.__stdout__.write("\n" + "="*70 + "\n")
     # sys.__stdout__.write("发送到 LLM 的提示词:\n")
     # sys.__stdout__.write("-"*70 + "\n")
@@ -126,127 +169,94 @@ def invoke_stream_with_cleaning(llm_adapter, prompt: str, max_retries: int = 3,
 
     retry_count = 0
     while retry_count < max_retries:
-        stop_event = threading.Event()
-        timer_thread = None
-        
-        final_elapsed_time = 0
-        def _timer():
-            nonlocal final_elapsed_time
-            start_time = time.time()
-
-            while not stop_event.is_set():
-                elapsed = time.time() - start_time
-                final_elapsed_time = elapsed
-                
-                message = f"LLM 正在思考...  （{elapsed:.1f} 秒）"
-                
-                # 更新终端计时器
-                sys.__stdout__.write(f"\r{message}")
-                sys.__stdout__.flush()
-                
-                # 更新GUI日志
-                if log_func:
-                    # 对于计时器，总是替换最后一行
-                    log_func(message, replace_last_line=True)
-                
-                time.sleep(0.1)
-            
-            # 计时结束，在终端和GUI打印最终耗时
-            final_message = f"LLM 思考完毕，共耗时 {final_elapsed_time:.2f} 秒"
-            sys.__stdout__.write(f"\r{final_message}\n")
-            sys.__stdout__.flush()
-            if log_func:
-                log_func(final_message, replace_last_line=True)
-
+        # 由共享计时器显示“正在思考”读秒，并定期刷新 sink 中到期的内容
+        ticker_handle = stream_ticker.register(getattr(llm_adapter, "config_name", ""), log_func, sink)
+        # 思考内容由适配器从正文中分流：只计入读秒提示的字数，分流模式下额外打印到终端，不写入GUI日志
+        llm_adapter.on_reasoning = _make_reasoning_handler(llm_adapter, ticker_handle)
         try:
-            # 启动计时器
-            timer_thread = threading.Thread(target=_timer)
-            timer_thread.daemon = True
-            timer_thread.start()
+            request_prompt = prompt
+            trimmer = None
+            if salvage and generated:
+                request_prompt = build_continuation_prompt(prompt, generated)
+                trimmer = OverlapTrimmer(generated)
 
-            stream = llm_adapter.invoke_stream(prompt)
+            stream = llm_adapter.invoke_stream(request_prompt)
             if not stream:
                 raise Exception("Failed to get stream response")
 
-            first_chunk = True
             for chunk in stream:
-                if first_chunk:
-                    # 收到第一个数据块，停止计时器
-                    stop_event.set()
-                    timer_thread.join()
-                    # sys.__stdout__.write("\n" + "="*70 + "\n")
-                    # sys.__stdout__.write("LLM返回内容:\n")
-                    # sys.__stdout__.write("-"*70 + "\n")
-                    # sys.__stdout__.flush()
-                    first_chunk = False
-
-                content = chunk
-                
+                # 收到第一个数据块时停止读秒
+                ticker_handle.first_chunk()
+
+                content = trimmer.feed(chunk) if trimmer and chunk else chunk
+
                 if content:
-                    sys.__stdout__.write(content)
-                    sys.__stdout__.flush()
-                    
-                    # 根据log_stream参数决定是否将流式内容输出到GUI日志
-                    if log_func and log_stream:
-                        log_func(content, stream=True)
-                        
-                    cleaned_content = content.replace("```", "")
-                    yield cleaned_content
-            
+                    generated += content
+                    ticker_handle.add_chars(len(content))
+                    yield from _emit(content)
+
+            if trimmer:
+                content = trimmer.flush()
+                if content:
+                    generated += content
+                    yield from _emit(content)
+                if trimmer.trimmed:
+                    logging.info(f"续写结果与已生成内容重叠 {trimmer.trimmed} 字，已去除。")
+            if salvage:
+                salvage.discard(prompt)
+
             # if not first_chunk: # 确保即使流为空也打印结束符
             #     sys.__stdout__.write("\n" + "="*70 + "\n")
             #     sys.__stdout__.flush()
-            
-            return
-
-        except APIStatusError as e:
-            # 停止计时器
-            if timer_thread and timer_thread.is_alive():
-                stop_event.set()
-                timer_thread.join()
 
-            error_code = e.status_code
-            # 按照用户要求的格式构建错误信息
-            error_message = f"错误: 调用失败 ({retry_count + 1}/{max_retries}): Error code: {error_code}"
-            
-            # 同时记录到终端和GUI日志
-            # 注意：这里不再需要 llm_adapter 的配置名和模型名，因为上层 execute_with_polling 会记录
-            sys.__stdout__.write(f"\n{error_message}\n")
-            sys.__stdout__.flush()
-            if log_func:
-                # 将简化后的错误信息传递给上层日志函数
-                log_func(error_message)
+            sink.close()
+            return collector.build(llm_adapter, retries=retry_count)
 
-            retry_count += 1
-            if retry_count >= max_retries:
-                # 抛出简化的异常信息
-                raise Exception(f"LLM调用失败，已达最大重试次数: Error code: {error_code}")
-            time.sleep(2)
+        except LLMRequestCancelled:
+            # 被主动取消的调用（如对冲请求落败的一方）不再重试
+            raise
 
         except Exception as e:
-            # 停止计时器
-            if timer_thread and timer_thread.is_alive():
-                stop_event.set()
-                timer_thread.join()
+            # 停止读秒并先输出已缓存的内容，再打印错误信息
+            ticker_handle.close()
+            sink.flush()
+
+            if salvage and generated:
+                # 保存已生成部分，供本次重试或下一个配置续写
+                salvage.save(prompt, generated)
+                if log_func:
+                    log_func(f"  -> 流在已生成 {len(generated)} 字后中断，重试时将从断点续写。")
 
-            error_message = f"调用失败 ({retry_count + 1}/{max_retries}): {str(e)}"
+            classification = policy.classify(e)
+            # 有状态码时只显示状态码，保持日志简洁
+            error_detail = f"Error code: {classification.status_code}" if classification.status_code else str(e)
+            error_message = f"调用失败 ({retry_count + 1}/{max_retries}): {error_detail}"
             sys.__stdout__.write(f"\n错误: {error_message}\n")
             sys.__stdout__.flush()
             logging.error(error_message)
-            
+            if log_func:
+                # 注意：这里不再需要 llm_adapter 的配置名和模型名，因为上层 execute_with_polling 会记录
+                log_func(f"错误: {error_message}")
+
+            if not classification.retryable:
+                # 不可重试的错误直接抛出，由 execute_with_polling 立即切换到下一个配置
+                raise NonRetryableLLMError(f"LLM调用失败，错误不可重试（{classification.reason}）: {error_detail}") from e
+
             retry_count += 1
             if retry_count >= max_retries:
-                final_error = f"LLM调用失败，已达最大重试次数: {e}"
-                raise Exception(final_error)
-            time.sleep(2)
+                raise Exception(f"LLM调用失败，已达最大重试次数: {error_detail}")
+            retry_budget = getattr(llm_adapter, "retry_budget", None)
+            if retry_budget is not None and not retry_budget.try_consume():
+                raise Exception(f"LLM调用失败，步骤 '{retry_budget.step_name}' 的重试预算已用尽: {error_detail}")
+
+            delay = policy.next_delay(retry_count, classification)
+            if log_func:
+                log_func(f"  -> {classification.reason}，{delay:.1f} 秒后重试...")
+            sleep_with_interrupt(delay, check_interrupted)
         finally:
-            # 确保计时器线程在任何情况下都能停止，即使是被外部异常（如SystemExit）中断
-            if timer_thread and timer_thread.is_alive():
-                stop_event.set()
-                timer_thread.join()
-                # 强制停止后，在终端打印一个清晰的换行，避免日志混乱
-                sys.__stdout__.write("\n")
-                sys.__stdout__.flush()
+            # 即使被外部异常（如SystemExit）中断，也要从计时器注销
+            ticker_handle.close()
+            sink.flush()
 
 def invoke_llm(llm_adapter, prompt: str, max_retries: int = 3, log_func=None) -> str:
     """直接调用 LLM 并返回结果，包含重试机制。"""
@@ -255,46 +265,62 @@ def invoke_llm(llm_adapter, prompt: str, max_retries: int = 3, log_func=None) ->
 
 # 添加异步版本的LLM调用函数
 class AsyncLLMInvoker:
-    """异步LLM调用器，使用线程池和回调机制实现非阻塞调用"""
+    """异步LLM调用器，在单个后台事件循环中并发执行调用，并通过回调返回结果"""
     
     def __init__(self, max_workers=5):
         """初始化异步调用器
         
         Args:
-            max_workers: 最大工作线程数
+            max_workers: 最大并发调用数
         """
-        self.result_queues = {}
         self.max_workers = max_workers
-        self.workers = []
-        self.task_queue = queue.Queue()
-        self._start_workers()
+        self._loop = None
+        self._loop_thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
     
-    def _start_workers(self):
-        """启动工作线程"""
-        for _ in range(self.max_workers):
-            worker = threading.Thread(target=self._worker_loop, daemon=True)
-            worker.start()
-            self.workers.append(worker)
+    def _ensure_loop(self):
+        """首次使用时启动后台事件循环线程"""
+        if self._loop is not None:
+            return self._loop
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._semaphore = asyncio.Semaphore(self.max_workers)
+                self._loop_thread = threading.Thread(target=loop.run_forever, name="llm-async-invoker", daemon=True)
+                self._loop_thread.start()
+                self._loop = loop
+        return self._loop
     
-    def _worker_loop(self):
-        """工作线程循环，从任务队列获取任务并执行"""
-        while True:
+    async def _invoke_with_retry(self, llm_adapter, prompt, max_retries):
+        """在事件循环中执行带重试的流式调用，返回清理后的完整文本"""
+        for attempt in range(1, max_retries + 1):
             try:
-                task_id, llm_adapter, prompt, max_retries, callback = self.task_queue.get()
-                try:
-                    # 调用同步版本的invoke_llm函数
-                    result = invoke_llm(llm_adapter, prompt, max_retries)
-                    # 如果提供了回调函数，则调用回调
-                    if callback:
-                        callback(result)
-                except Exception as e:
-                    logging.error(f"Error in worker thread: {str(e)}")
-                    if callback:
-                        callback(None, str(e))
-                finally:
-                    self.task_queue.task_done()
+                parts = []
+                async for chunk in llm_adapter.ainvoke_stream(prompt):
+                    if chunk:
+                        parts.append(chunk.replace("```", ""))
+                return "".join(parts)
             except Exception as e:
-                logging.error(f"Worker loop error: {str(e)}")
+                logging.error(f"异步调用失败 ({attempt}/{max_retries}): {e}")
+                classification = default_retry_policy.classify(e)
+                if not classification.retryable:
+                    raise NonRetryableLLMError(f"LLM调用失败，错误不可重试（{classification.reason}）: {e}") from e
+                if attempt >= max_retries:
+                    raise Exception(f"LLM调用失败，已达最大重试次数: {e}")
+                await asyncio.sleep(default_retry_policy.next_delay(attempt, classification))
+    
+    async def _run_task(self, llm_adapter, prompt, max_retries, callback):
+        async with self._semaphore:
+            try:
+                result = await self._invoke_with_retry(llm_adapter, prompt, max_retries)
+            except Exception as e:
+                logging.error(f"Error in async invoker: {str(e)}")
+                if callback:
+                    callback(None, str(e))
+                return
+        if callback:
+            callback(result)
     
     def invoke_async(self, llm_adapter, prompt, callback=None, max_retries=3):
         """异步调用LLM
@@ -302,11 +328,12 @@ class AsyncLLMInvoker:
         Args:
             llm_adapter: LLM适配器
             prompt: 提示词
-            callback: 回调函数，接收结果和可选的错误信息
+            callback: 回调函数，接收结果和可选的错误信息（在事件循环线程中调用）
             max_retries: 最大重试次数
         """
         task_id = id(prompt)
-        self.task_queue.put((task_id, llm_adapter, prompt, max_retries, callback))
+        loop = self._ensure_loop()
+        asyncio.run_coroutine_threadsafe(self._run_task(llm_adapter, prompt, max_retries, callback), loop)
         return task_id
 
 # 创建全局异步调用器实例
@@ -391,6 +418,292 @@ def update_character_states_async(chapter_text, chapter_title, chap_num, filepat
     thread.start()
     return thread
 
+# 对冲中的一路尚未取得正文分片（请求出错或流为空）
+_NO_CHUNK = object()
+
+
+class _HedgedAttempt:
+    """
+    对冲中的一路请求：在独立线程中发出流式请求，读取到首个正文分片为止（ready）；
+    胜出后由调用线程接着读取同一个流，落败时取消请求或关闭流。
+    """
+    def __init__(self, config_name: str, llm_adapter, hedge: "_RequestHedge"):
+        self.config_name = config_name
+        self.llm_adapter = llm_adapter
+        self.stream = None
+        self.first_chunk = _NO_CHUNK
+        self.error = None
+        self.cancelled = False
+        self.ready = threading.Event()
+        self._hedge = hedge
+        self._lock = threading.Lock()
+
+    def start(self, prompt: str):
+        self.llm_adapter.on_first_chunk = lambda: self._hedge.output_started(self)
+
+        def run():
+            try:
+                self.stream = self.llm_adapter._logged_stream(prompt)
+                self.first_chunk = next(self.stream, _NO_CHUNK)
+            except BaseException as e:
+                self.error = e
+            with self._lock:
+                self.ready.set()
+                cancelled = self.cancelled
+            if cancelled:
+                # 取消时请求已返回了分片：关闭流，不再接收剩余输出
+                self._close_stream()
+                self._hedge.report_loser(self)
+            self._hedge.wake.set()
+        threading.Thread(target=run, name=f"hedge-{self.config_name}", daemon=True).start()
+
+    def _close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+
+    def discard(self):
+        """落败：仍在等待输出时取消请求（关闭其HTTP连接，不计入配置的失败），已取得分片时关闭流。"""
+        with self._lock:
+            pending = not self.ready.is_set()
+            if pending:
+                self.cancelled = True
+        if pending:
+            self.llm_adapter.cancel()
+        elif self.error is None:
+            self._close_stream()
+            self._hedge.report_loser(self)
+
+    @property
+    def answered(self) -> bool:
+        """请求已正常返回（取得了正文分片，或流正常结束但没有正文）。"""
+        return self.ready.is_set() and self.error is None
+
+
+class _RequestHedge:
+    """
+    请求级对冲，挂载在主适配器上（adapter.hedge），由 invoke_stream 调用：
+    流式请求在 delay 秒内没有任何输出（含思考内容）时，用轮询列表中的下一个配置发出相同的请求，
+    先输出的一路胜出，另一路被取消。只重复发出请求本身，步骤函数仍只在调用线程中执行一次，
+    文件写入等副作用不会重复；中断续写状态和流式日志也只由调用线程中的 invoke_stream_with_cleaning 处理。
+    胜负确定后，本次步骤尝试中的后续请求（重试、多轮请求）直接交给胜出的适配器。
+    对冲目标通过 peek_next_config_name 预选，不推进共享的轮询游标。
+    """
+    def __init__(self, polling_manager, step_name: str, final_step_name: str, config_name: str, delay: float,
+                 logger, context_prefix: str, check_interrupted=None, adapter_callback=None):
+        self.polling_manager = polling_manager
+        self.step_name = step_name
+        self.final_step_name = final_step_name
+        self.config_name = config_name
+        self.delay = delay
+        self.logger = logger
+        self.context_prefix = context_prefix
+        self.check_interrupted = check_interrupted
+        self.adapter_callback = adapter_callback
+        self.wake = threading.Event()
+        self.attempts = []
+        # 胜出的一路；为 None 时请求仍由主适配器直接发出
+        self.winner = None
+        self._leader = None
+        self._lock = threading.Lock()
+
+    def output_started(self, attempt: _HedgedAttempt):
+        """某一路收到首个分片（含思考内容）：最先输出的一路胜出。"""
+        with self._lock:
+            if self._leader is None:
+                self._leader = attempt
+        self.wake.set()
+
+    def report_loser(self, attempt: _HedgedAttempt):
+        wasted_input, wasted_output = attempt.llm_adapter.last_invocation_tokens
+        self.logger(f"{self.context_prefix}  -> 对冲落败配置 '{attempt.config_name}' 消耗约 {wasted_input} 输入 / {wasted_output} 输出 Token。")
+        logging.info(f"对冲请求 [{self.final_step_name}] 落败: {attempt.config_name}，浪费Token: 输入 {wasted_input} / 输出 {wasted_output}")
+
+    @property
+    def serving_config(self) -> str:
+        """实际提供服务的配置，调用结果记在它上面。"""
+        return self.winner.config_name if self.winner else self.config_name
+
+    def stream(self, primary, prompt: str):
+        if self.winner is not None:
+            return self._serve(primary, self.winner.llm_adapter, prompt)
+        return self._race(primary, prompt)
+
+    @staticmethod
+    def _sync_request(primary, adapter):
+        """请求相关的运行时属性（如结构化输出定义）由调用方设在主适配器上，发出请求前同步给实际请求的适配器。"""
+        adapter.response_schema = primary.response_schema
+        adapter.structured_output = primary.structured_output
+
+    @staticmethod
+    def _sync_result(primary, adapter):
+        """调用方从主适配器读取用量、结束原因和缓存键，请求结束后从实际请求的适配器同步回来。"""
+        primary.last_usage = adapter.last_usage
+        primary.last_finish_reason = adapter.last_finish_reason
+        primary.last_invocation_tokens = adapter.last_invocation_tokens
+        primary.last_call_stats = adapter.last_call_stats
+        primary.last_cache_key = adapter.last_cache_key
+
+    def _serve(self, primary, adapter, prompt: str):
+        if adapter is primary:
+            yield from primary._logged_stream(prompt)
+            return
+        self._sync_request(primary, adapter)
+        adapter.on_reasoning = primary.on_reasoning
+        try:
+            yield from adapter._logged_stream(prompt)
+        finally:
+            self._sync_result(primary, adapter)
+
+    def _relay_reasoning(self, attempt: _HedgedAttempt, callback):
+        """思考内容只转发胜出一路的，避免两路的输出混在一起。"""
+        def relay(text):
+            if callback and self._leader is attempt:
+                callback(text)
+        return relay
+
+    def _start_hedge(self, primary, prompt: str):
+        hedge_config = self.polling_manager.peek_next_config_name(self.step_name, exclude=(self.config_name,))
+        hedge_adapter = self.polling_manager.get_adapter_by_name(hedge_config) if hedge_config else None
+        if not hedge_adapter:
+            return None
+        hedge_adapter.step_name = self.final_step_name
+        hedge_adapter.cache_step = self.step_name
+        hedge_adapter.config_name = f"轮询-{hedge_config}"
+        self._sync_request(primary, hedge_adapter)
+        self.logger(f"{self.context_prefix}⏱️ 配置 '{self.config_name}' 在 {self.delay:g} 秒内未返回内容，对冲发起配置 '{hedge_config}' (模型: {hedge_adapter.model_name or '未知'})...")
+        hedge = _HedgedAttempt(hedge_config, hedge_adapter, self)
+        self.attempts.append(hedge)
+        return hedge
+
+    def _race(self, primary, prompt: str):
+        callback = primary.on_reasoning
+        self._leader = None
+        self.wake.clear()
+        main = _HedgedAttempt(self.config_name, primary, self)
+        self.attempts.append(main)
+        attempts = [main]
+        primary.on_reasoning = self._relay_reasoning(main, callback)
+        main.start(prompt)
+        deadline = time.time() + self.delay
+        winner = None
+        try:
+            while winner is None:
+                if self.check_interrupted and self.check_interrupted():
+                    raise InterruptedError(f"步骤 '{self.step_name}' 在对冲等待中被中断。")
+                if self._leader is not None:
+                    winner = self._leader
+                    break
+                answered = [a for a in attempts if a.answered]
+                if answered:
+                    winner = answered[0]
+                    break
+                if all(a.ready.is_set() for a in attempts):
+                    # 已发出的请求都失败了：交给 invoke_stream_with_cleaning 重试或外层轮询切换配置
+                    raise main.error
+                if len(attempts) == 1 and time.time() >= deadline:
+                    deadline = float("inf")
+                    hedge = self._start_hedge(primary, prompt)
+                    if hedge:
+                        attempts.append(hedge)
+                        hedge.llm_adapter.on_reasoning = self._relay_reasoning(hedge, callback)
+                        hedge.start(prompt)
+                self.wake.wait(0.2)
+                self.wake.clear()
+
+            self.winner = winner
+            losers = [a for a in attempts if a is not winner]
+            for loser in losers:
+                loser.llm_adapter.step_name = f"{loser.llm_adapter.step_name} [对冲取消]"
+                loser.discard()
+            if losers:
+                self.logger(f"{self.context_prefix}🏁 对冲结果：配置 '{winner.config_name}' 先返回内容胜出，已取消 {', '.join(repr(a.config_name) for a in losers)}。")
+                if winner is not main and self.adapter_callback:
+                    self.adapter_callback(winner.llm_adapter)
+
+            # 胜出的一路可能先输出了思考内容，等它取得首个正文分片
+            while not winner.ready.wait(0.2):
+                if self.check_interrupted and self.check_interrupted():
+                    raise InterruptedError(f"步骤 '{self.step_name}' 在对冲执行中被中断。")
+            if winner.error is not None:
+                raise winner.error
+            if winner.first_chunk is not _NO_CHUNK:
+                yield winner.first_chunk
+                yield from winner.stream
+        finally:
+            if winner is None:
+                for attempt in attempts:
+                    if not attempt.ready.is_set():
+                        attempt.discard()
+            elif not winner.ready.is_set():
+                # 等待胜出一路的正文时被中断
+                winner.discard()
+            elif winner.stream is not None:
+                # 调用方提前结束时关闭胜出一路的流
+                winner.stream.close()
+            primary.on_reasoning = callback
+            if winner is not None and winner is not main:
+                winner.llm_adapter.on_reasoning = callback
+                self._sync_result(primary, winner.llm_adapter)
+
+    def finish(self):
+        """步骤尝试结束：对冲各路自身的失败（非主动取消）记到各自的配置，归还对冲借出的适配器。"""
+        serving = self.serving_config
+        for attempt in self.attempts:
+            attempt.llm_adapter.on_first_chunk = None
+            if attempt.config_name != serving and not attempt.cancelled and attempt.error is not None:
+                self.polling_manager.record_call_result(attempt.config_name, False, error=str(attempt.error),
+                                                        status_code=error_status_code(attempt.error))
+        primary = self.attempts[0].llm_adapter if self.attempts else None
+        released = set()
+        for attempt in self.attempts:
+            adapter = attempt.llm_adapter
+            if adapter is not primary and id(adapter) not in released:
+                released.add(id(adapter))
+                self.polling_manager.release_adapter(adapter)
+
+
+def _annotate_result(result, config_name: str, step_name: str):
+    """在流式结果上记录实际使用的配置，并把调用统计写入日志。"""
+    if isinstance(result, StreamResult):
+        result.stats["config"] = config_name
+        result.stats["step"] = step_name
+        logging.info(f"步骤 '{step_name}' 调用统计（{config_name}）：{result.describe()}")
+
+
+def _get_hedge_delay(polling_manager, step_name: str) -> float:
+    """读取步骤的对冲等待秒数（步骤设置优先于全局设置），0 表示不启用对冲。"""
+    default_delay = polling_manager.settings.get("设置", {}).get("对冲等待秒数", 0)
+    try:
+        return float(polling_manager.step_configs.get(step_name, {}).get("对冲等待秒数", default_delay) or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _make_retry_budget(polling_manager, step_name: str) -> RetryBudget:
+    """
+    创建步骤的重试预算：优先使用步骤配置中的“重试预算”，否则使用“设置”中的“步骤重试预算”，
+    默认为“重试次数”的两倍；关闭“启用重试”时预算为 0。
+    """
+    settings = polling_manager.settings.get("设置", {})
+    if not settings.get("启用重试", True):
+        return RetryBudget(step_name, 0)
+    step_config = polling_manager.step_configs.get(step_name, {})
+    limit = step_config.get("重试预算", settings.get("步骤重试预算"))
+    try:
+        limit = int(limit) if limit is not None else int(settings.get("重试次数", 3)) * 2
+    except (TypeError, ValueError):
+        limit = 6
+    return RetryBudget(step_name, limit)
+
+
+def _is_structured_output_enabled(polling_manager, step_name: str) -> bool:
+    """步骤配置中的“结构化输出”优先，否则使用“设置”中的同名选项，默认关闭。"""
+    step_config = polling_manager.step_configs.get(step_name, {})
+    if "结构化输出" in step_config:
+        return bool(step_config["结构化输出"])
+    return bool(polling_manager.settings.get("设置", {}).get("结构化输出", False))
+
+
 def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, adapter_callback=None, check_interrupted=None, context_info: str = "", is_manual_call: bool = False, *args, **kwargs):
     """
     执行一个目标函数，根据UI设置决定是使用单一模型还是轮询。
@@ -400,6 +713,12 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
     polling_manager = PollingManager()
     logger = log_func if log_func else gui_app.safe_log
     context_prefix = f"[{context_info}] " if context_info else ""
+    general_settings = polling_manager.settings.get("设置", {})
+    configure_stream_sink(general_settings.get("流式刷新间隔毫秒"), general_settings.get("流式刷新字数"))
+    # 同一步骤内所有配置共享一份重试预算和中断续写状态
+    retry_budget = _make_retry_budget(polling_manager, step_name)
+    stream_salvage = make_stream_salvage(polling_manager.step_configs.get(step_name, {}), step_name)
+    structured_output = _is_structured_output_enabled(polling_manager, step_name)
 
     # --- 核心逻辑：从UI获取当前的LLM模式 ---
     use_polling_mode = gui_app.enable_polling_var.get()
@@ -422,7 +741,11 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
         call_prefix = "[手动] " if is_manual_call else "[自动] "
         final_step_name = f"{call_prefix}{step_name} {context_info}".strip()
         llm_adapter.step_name = final_step_name
+        llm_adapter.cache_step = step_name
         llm_adapter.config_name = f"单一模型-{config_name}" # 更新配置名以包含模式
+        llm_adapter.retry_budget = retry_budget
+        llm_adapter.stream_salvage = stream_salvage
+        llm_adapter.structured_output = structured_output
 
         ui_model_name = gui_app.main_model_name_var.get()
         if ui_model_name and ui_model_name != llm_adapter.model_name:
@@ -451,18 +774,27 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
             if not result or (isinstance(result, str) and not result.strip()):
                 raise ValueError("LLM返回内容为空或仅包含空白字符。")
 
+            _annotate_result(result, config_name, final_step_name)
             logger(f"{context_prefix}✅ 步骤 '{step_name}' 使用配置 '{config_name}' (模型: {model_name}) 成功。\n")
+            polling_manager.record_call_result(config_name, True, llm_adapter.last_call_stats)
             return result
         except InterruptedError:
             logger(f"{context_prefix}🟡 任务被用户中断。\n")
             raise
         except Exception as e:
+            if check_interrupted and check_interrupted():
+                # 强制停止时被取消的调用不计为该配置的失败
+                logger(f"{context_prefix}🟡 任务被用户中断。\n")
+                raise InterruptedError(f"步骤 '{step_name}' 在执行中被中断。") from e
             error_msg = f"{context_prefix}❌ 配置 '{config_name}' (模型: {model_name}) 在步骤 '{step_name}' 中失败: {str(e)}\n"
             logger(error_msg)
+            polling_manager.record_call_result(config_name, False, error=str(e), status_code=error_status_code(e))
             raise SingleProviderExecutionError(error_msg) from e
         finally:
             if adapter_callback:
                 adapter_callback(None)
+            # 归还适配器，使后续步骤复用同一连接
+            polling_manager.release_adapter(llm_adapter)
 
     else:
         # --- 轮询模式 ---
@@ -512,7 +844,11 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
                 call_prefix = "[手动] " if is_manual_call else "[自动] "
                 final_step_name = f"{call_prefix}{step_name} {context_info}".strip()
                 llm_adapter.step_name = final_step_name
+                llm_adapter.cache_step = step_name
                 llm_adapter.config_name = f"轮询-{config_name_to_use}" # 更新配置名以包含模式
+                llm_adapter.retry_budget = retry_budget
+                llm_adapter.stream_salvage = stream_salvage
+                llm_adapter.structured_output = structured_output
                 
                 model_name = llm_adapter.model_name or "未知"
                 
@@ -526,24 +862,46 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
 
                 if adapter_callback:
                     adapter_callback(llm_adapter)
+                hedge = None
                 try:
                     kwargs['llm_adapter'] = llm_adapter
                     if 'log_func' not in kwargs:
                         kwargs['log_func'] = logger
                     if 'check_interrupted' not in kwargs:
                         kwargs['check_interrupted'] = check_interrupted
-                    result = target_func(*args, **kwargs)
+
+                    used_adapter = llm_adapter
+                    hedge_delay = _get_hedge_delay(polling_manager, step_name)
+                    if hedge_delay > 0 and not is_specific_mode and max_attempts_per_round > 1:
+                        # 对冲挂在适配器上，只重复发出流式请求，步骤函数仍只执行一次
+                        hedge = _RequestHedge(polling_manager, step_name, final_step_name, config_name_to_use, hedge_delay,
+                                              logger, context_prefix, check_interrupted, adapter_callback)
+                        llm_adapter.hedge = hedge
+                    try:
+                        result = target_func(*args, **kwargs)
+                    finally:
+                        if hedge is not None and hedge.winner is not None:
+                            # 成功或失败都记在实际提供服务的配置上
+                            config_name_to_use = hedge.serving_config
+                            used_adapter = hedge.winner.llm_adapter
+                            model_name = used_adapter.model_name or "未知"
 
                     # 检查返回内容是否为空
                     if not result or (isinstance(result, str) and not result.strip()):
                         raise ValueError("LLM返回内容为空或仅包含空白字符。")
 
+                    _annotate_result(result, config_name_to_use, final_step_name)
                     logger(f"{context_prefix}✅ 步骤 '{step_name}' 使用配置 '{config_name_to_use}' (模型: {model_name}) 成功。\n")
+                    polling_manager.record_call_result(config_name_to_use, True, used_adapter.last_call_stats)
                     return result
                 except InterruptedError:
                     logger(f"{context_prefix}🟡 任务被用户中断。\n")
                     raise
                 except Exception as e:
+                    if check_interrupted and check_interrupted():
+                        # 强制停止时被取消的调用不计为该配置的失败，也不再切换配置
+                        logger(f"{context_prefix}🟡 任务被用户中断。\n")
+                        raise InterruptedError(f"步骤 '{step_name}' 在执行中被中断。") from e
                     # 现在，从 invoke_stream_with_cleaning 抛出的异常可能是简化的
                     # 我们需要将配置信息和简化后的错误信息组合起来
                     error_str = str(e)
@@ -553,9 +911,16 @@ def execute_with_polling(gui_app, step_name: str, target_func, log_func=None, ad
 
                     error_msg = f"{context_prefix}❌ 配置 '{config_name_to_use}' (模型: {model_name}) 在步骤 '{step_name}' 中失败: {error_str}\n"
                     logger(error_msg)
+                    if isinstance(e, NonRetryableLLMError):
+                        logger(f"{context_prefix}  -> 该错误不可重试，立即切换到下一个配置。")
+                    polling_manager.record_call_result(config_name_to_use, False, error=error_str, status_code=error_status_code(e))
                 finally:
                     if adapter_callback:
                         adapter_callback(None)
+                    if hedge is not None:
+                        llm_adapter.hedge = None
+                        hedge.finish()
+                    polling_manager.release_adapter(llm_adapter)
 
         logger(f"{context_prefix}❌ 错误：步骤 '{step_name}' 已完成 {total_rounds} 轮尝试，所有可用配置均失败。\n")
         return None
@@ -7,135 +7,175 @@
 import os
 import re
 import json
+import time
 import traceback
-import nltk
 import warnings
+from datetime import datetime
 from utils import read_file
 from novel_generator.json_utils import load_store, save_store, save_json_store
-from langchain.docstore.document import Document
+from novel_generator.structured_output import (
+    FORESHADOWING_CONTENT_SPEC, FORESHADOWING_FUSED_SPEC, FORESHADOWING_HISTORY_SPEC, FORESHADOWING_INTEGRATION_SPEC,
+    StructuredOutputError, entries_to_dict, invoke_structured, structured_output_enabled,
+)
 
 # 禁用特定的Torch警告
 warnings.filterwarnings('ignore', message='.*Torch was not compiled with flash attention.*')
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_adapter=None, log_func=None):
+def _invoke_structured_entries(llm_adapter, prompt, spec, content_field, log_func=None):
     """
-    从章节文本中提取伏笔内容，并存储到JSON文件
-    
-    Args:
-        chapter_text: 章节正文
-        chapter_info: 章节信息，包含伏笔条目等
-        filepath: JSON文件保存路径
-        llm_adapter: LLM适配器，从调用方传入
-        log_func: 日志记录函数
-    
-    Returns:
-        提取和存储的结果
+    结构化输出模式下调用LLM并返回 {伏笔编号: 内容}。
+    步骤未启用结构化输出，或多次校验失败时返回 None，由调用方按文本格式重新请求并解析。
     """
-    # 日志辅助函数
-    def _log(message, level="info"): # level is kept for compatibility but not used
+    if not structured_output_enabled(llm_adapter):
+        return None
+    try:
+        return entries_to_dict(invoke_structured(llm_adapter, prompt, spec, log_func=log_func), content_field)
+    except StructuredOutputError as e:
         if log_func:
-            log_func(message)
-        else:
-            # Fallback to standard print if no log_func is provided
-            print(message)
-            
+            log_func(f"    结构化输出失败（{e}），改用文本格式重新请求。")
+        return None
+
+def _entries_summary(entries):
+    return "\n".join(f"{fb_id}: {content.split('。')[0]}..." for fb_id, content in entries.items())
+
+class _CallRecorder:
+    """记录伏笔处理中每次LLM调用的耗时与Token数（取该次调用最后一个请求的计数），用于比较两种处理方式。"""
+    def __init__(self, llm_adapter):
+        self.llm_adapter = llm_adapter
+        self.steps = []
+
+    def record(self, name, started):
+        input_tokens, output_tokens = getattr(self.llm_adapter, "last_invocation_tokens", (0, 0))
+        self.steps.append({
+            "步骤": name,
+            "耗时秒": round(time.monotonic() - started, 2),
+            "输入Token": input_tokens,
+            "输出Token": output_tokens,
+        })
+
+    def totals(self):
+        return {
+            "耗时秒": round(sum(step["耗时秒"] for step in self.steps), 2),
+            "输入Token": sum(step["输入Token"] for step in self.steps),
+            "输出Token": sum(step["输出Token"] for step in self.steps),
+        }
+
+    def summary(self, mode):
+        totals = self.totals()
+        return (f"{mode}，{len(self.steps)} 次调用，共耗时 {totals['耗时秒']} 秒，"
+                f"输入 {totals['输入Token']} Token，输出 {totals['输出Token']} Token")
+
+def _save_processing_stats(filepath, chapter_number, mode, fused, recorder):
+    """把本次处理的各步骤耗时与Token追加到 定稿内容/伏笔处理统计.jsonl，便于比较单次调用与三步调用。"""
+    record = {
+        "时间": datetime.now().isoformat(timespec="seconds"),
+        "章节": chapter_number,
+        "处理方式": mode,
+        # 尝试了单次调用但校验失败、回退到三步调用
+        "单次调用回退": bool(fused) and mode != "单次调用",
+        "步骤": recorder.steps,
+        "合计": recorder.totals(),
+    }
     try:
-        # 获取章节编号和标题
-        chapter_number = chapter_info.get('novel_number', '0')
-        chapter_title = chapter_info.get('chapter_title', '')
-        _log(f"开始处理第{chapter_number}章《{chapter_title}》的伏笔内容")
-        
-        # 提取伏笔条目
-        foreshadowing_items = chapter_info.get("foreshadowing", "")
-        if not foreshadowing_items.strip():
-            _log(f"第{chapter_number}章没有伏笔条目，跳过处理")
-            return {"status": "no_foreshadowing"}
-        
-        # 解析伏笔编号
-        foreshadowing_ids = []
-        if chapter_info and 'foreshadowing' in chapter_info and chapter_info['foreshadowing']:
-            # 简化正则表达式，专注于提取伏笔ID
-            entries_pattern = r'([A-Z]F\d{3})\('  # 改为只匹配伏笔ID格式
-            foreshadowing_str = chapter_info['foreshadowing']
-            # 确保输入是字符串
-            if isinstance(foreshadowing_str, (list, tuple)):
-                foreshadowing_str = '\n'.join(map(str, foreshadowing_str))
-                
-            entries_matches = re.finditer(entries_pattern, foreshadowing_str)
-            
-            # 记录找到的所有伏笔ID
-            found_ids = set()
-            for match in entries_matches:
-                fb_id = match.group(1)
-                if fb_id not in found_ids:
-                    found_ids.add(fb_id)
-                    foreshadowing_ids.append(fb_id)
-                    _log(f"提取到伏笔编号: {fb_id}")
-            
-            if not foreshadowing_ids:
-                _log(f"第{chapter_info.get('novel_number', '未知')}章未找到有效的伏笔编号，跳过处理")
-                return {"status": "no_valid_foreshadowing"}
-            
-            _log(f"本章涉及伏笔编号列表：{', '.join(foreshadowing_ids)}")
+        stats_dir = os.path.join(filepath, "定稿内容")
+        os.makedirs(stats_dir, exist_ok=True)
+        with open(os.path.join(stats_dir, "伏笔处理统计.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"写入伏笔处理统计失败: {e}")
 
-        # 加载伏笔JSON存储
-        foreshadowing_store = load_store(filepath, "foreshadowing_collection")
-        
-        # 1. 获取伏笔历史内容
-        _log("  步骤1: 获取伏笔历史内容...")
-        from prompt_definitions import foreshadowing_history_processing_prompt
-        
-        # 使用传入的 LLM 适配器
-        if not llm_adapter:
-            _log("LLM适配器未传入，无法处理伏笔内容", level="warning")
-            return {"status": "llm_adapter_not_provided"}
-        
-        # 从JSON存储中检索原始伏笔历史内容
-        raw_foreshadowing_history = {}
-        if foreshadowing_store:
-            _log("    正在从JSON文件检索伏笔历史内容...")
-            for fb_id in foreshadowing_ids:
-                fb_data = foreshadowing_store.get(fb_id)
-                if fb_data and '内容' in fb_data:
-                    content = fb_data['内容']
-                    raw_foreshadowing_history[fb_id] = content
-                    summary = content.split('\n')[0]
-                    _log(f"      ✅ 成功检索到伏笔 {fb_id} 的历史: \"{summary}...\"")
-                else:
-                    _log(f"      ℹ️ 未找到伏笔 {fb_id} 的历史，可能是一个新伏笔。")
+def _chapter_foreshadowing_entries(chapter_info, foreshadowing_ids):
+    """章节信息中与本章伏笔编号相关的条目（每行一条）。"""
+    entries = []
+    for entry in (chapter_info.get('foreshadowing') or "").split('\n'):
+        if any(fb_id in entry for fb_id in foreshadowing_ids):
+            entries.append(entry.strip())
+    return "\n".join(entries)
+
+def _process_in_one_call(chapter_text, chapter_info, chapter_number, chapter_title, foreshadowing_ids,
+                         raw_foreshadowing_history, llm_adapter, recorder, log_func, _log):
+    """
+    单次调用流程：一次结构化调用同时完成本章内容提取与整合，章节正文和伏笔历史只发送一次。
+    校验失败或结果缺少伏笔时返回 None，由调用方回退到三步流程。
+    """
+    from prompt_definitions import foreshadowing_fused_processing_prompt
+
+    _log("  单次调用：提取并整合本章伏笔内容...")
+    history_text = "".join(f"{fb_id}:\n历史内容：{content}\n\n" for fb_id, content in raw_foreshadowing_history.items())
+    prompt = foreshadowing_fused_processing_prompt.format(
+        novel_number=chapter_number,
+        chapter_title=chapter_title,
+        foreshadowing_entries=_chapter_foreshadowing_entries(chapter_info, foreshadowing_ids),
+        foreshadowing_history=history_text or "无历史内容。\n",
+        chapter_text=chapter_text
+    )
+    started = time.monotonic()
+    try:
+        result = invoke_structured(llm_adapter, prompt, FORESHADOWING_FUSED_SPEC, log_func=log_func)
+    except StructuredOutputError as e:
+        _log(f"    单次调用的结构化输出校验失败: {e}")
+        return None
+    finally:
+        recorder.record("单次调用", started)
+
+    integrated = entries_to_dict(result, "内容")
+    missing = [fb_id for fb_id in foreshadowing_ids if fb_id not in integrated]
+    if missing:
+        _log(f"    单次调用结果缺少伏笔: {', '.join(missing)}")
+        return None
+    _log(f"    -> LLM返回的最终整合伏笔内容:\n---\n{_entries_summary(integrated)}\n---")
+    return {
+        fb_id: {"content": content, "metadata": {"id": fb_id, "伏笔最后章节": f"第{chapter_number}章"}}
+        for fb_id, content in integrated.items()
+    }
+
+def _process_in_three_steps(chapter_text, chapter_info, chapter_number, chapter_title, foreshadowing_ids,
+                             raw_foreshadowing_history, llm_adapter, recorder, log_func, _log):
+    """
+    原有的三步流程：分别调用LLM总结伏笔历史、提取本章伏笔内容、整合两者。
+    返回 {伏笔编号: {"content": ..., "metadata": {...}}}。
+    """
+    foreshadowing_items = chapter_info.get("foreshadowing", "")
+    # 1. 获取伏笔历史内容
+    _log("  步骤1: 获取伏笔历史内容...")
+    from prompt_definitions import foreshadowing_history_processing_prompt
+    
+    # 构建伏笔ID列表字符串
+    foreshadowing_ids_str = "\n".join([f"- {fb_id}" for fb_id in foreshadowing_ids])
+    
+    # 构建伏笔历史内容提示词
+    history_prompt = foreshadowing_history_processing_prompt.format(
+        novel_number=chapter_number,
+        chapter_title=chapter_title,
+        foreshadowing_ids=foreshadowing_ids_str,
+        chapter_text=chapter_text
+    )
+    
+    # 调用LLM处理伏笔历史内容
+    from novel_generator.common import invoke_llm
+    try:
+        # 将原始伏笔历史内容转换为文本格式
+        raw_history_text = ""
+        if raw_foreshadowing_history:
+            for fb_id, content in raw_foreshadowing_history.items():
+                raw_history_text += f"{fb_id}\n历史内容：{content}\n\n"
         else:
-            _log("    伏笔JSON文件不存在，跳过历史内容检索。")
-        
-        # 构建伏笔ID列表字符串
-        foreshadowing_ids_str = "\n".join([f"- {fb_id}" for fb_id in foreshadowing_ids])
+            raw_history_text = "无\n"
         
-        # 构建伏笔历史内容提示词
-        history_prompt = foreshadowing_history_processing_prompt.format(
-            novel_number=chapter_number,
-            chapter_title=chapter_title,
-            foreshadowing_ids=foreshadowing_ids_str,
-            chapter_text=chapter_text
-        )
+        # 将原始伏笔历史内容添加到提示词中
+        history_prompt_with_data = history_prompt + "\n\n已检索到的伏笔历史内容：\n" + raw_history_text
         
-        # 调用LLM处理伏笔历史内容
-        from novel_generator.common import invoke_llm
-        try:
-            # 将原始伏笔历史内容转换为文本格式
-            raw_history_text = ""
-            if raw_foreshadowing_history:
-                for fb_id, content in raw_foreshadowing_history.items():
-                    raw_history_text += f"{fb_id}\n历史内容：{content}\n\n"
-            else:
-                raw_history_text = "无\n"
-            
-            # 将原始伏笔历史内容添加到提示词中
-            history_prompt_with_data = history_prompt + "\n\n已检索到的伏笔历史内容：\n" + raw_history_text
-            
-            # 调用LLM处理
-            _log("    -> 正在调用LLM总结伏笔历史...")
+        # 调用LLM处理
+        _log("    -> 正在调用LLM总结伏笔历史...")
+        started = time.monotonic()
+        foreshadowing_history = _invoke_structured_entries(
+            llm_adapter, history_prompt_with_data, FORESHADOWING_HISTORY_SPEC, "历史内容", log_func)
+        if foreshadowing_history is not None:
+            _log(f"    -> LLM返回的伏笔历史总结:\n---\n{_entries_summary(foreshadowing_history)}\n---")
+        else:
             history_result = invoke_llm(llm_adapter, history_prompt_with_data, log_func=log_func)
-            
+
             # 解析LLM返回的普通文本结果
             foreshadowing_history = {}
             summary_log = []
@@ -144,7 +184,7 @@ def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_ad
             for fb_id, content in matches:
                 foreshadowing_history[fb_id] = content.strip()
                 summary_log.append(f"{fb_id}: {content.strip().split('。')[0]}...")
-            
+
             if summary_log:
                 _log(f"    -> LLM返回的伏笔历史总结:\n---\n" + "\n".join(summary_log) + "\n---")
             else:
@@ -155,52 +195,59 @@ def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_ad
             matches = re.findall(pattern, history_result)
             for fb_id, content in matches:
                 foreshadowing_history[fb_id] = content.strip()
-            _log(f"    成功处理伏笔历史内容: {len(foreshadowing_history)}个伏笔")
-        except Exception as e:
-            _log(f"    处理伏笔历史内容失败: {str(e)}，使用原始检索结果", level="warning")
-            # 失败时使用原始检索结果
-            foreshadowing_history = raw_foreshadowing_history
-        
-        # 2. 获取当前章节伏笔内容
-        _log("  步骤2: 获取当前章节伏笔内容...")
-        from prompt_definitions import foreshadowing_content_processing_prompt
-        
-        # 构建伏笔条目字符串，使用完整的伏笔条目信息
-        foreshadowing_entries = []
-        if chapter_info and 'foreshadowing' in chapter_info and chapter_info['foreshadowing']:
-            # 将伏笔条目按行分割
-            entries = chapter_info['foreshadowing'].split('\n')
-            for entry in entries:
-                # 只保留包含伏笔编号和明确是本章需要处理的伏笔条目
-                if any(fb_id in entry for fb_id in foreshadowing_ids):
-                    foreshadowing_entries.append(entry.strip())
-        
-        # 合并所有伏笔条目
-        foreshadowing_entries_str = "\n".join(foreshadowing_entries)
-        
-        # 将伏笔历史内容转换为文本格式，以便传递给提示
-        foreshadowing_history_text_for_content = ""
-        if foreshadowing_history:
-            for fb_id, content in foreshadowing_history.items():
-                foreshadowing_history_text_for_content += f"{fb_id}:\n历史内容：{content}\n\n"
+        recorder.record("伏笔历史", started)
+        _log(f"    成功处理伏笔历史内容: {len(foreshadowing_history)}个伏笔")
+    except Exception as e:
+        _log(f"    处理伏笔历史内容失败: {str(e)}，使用原始检索结果", level="warning")
+        # 失败时使用原始检索结果
+        foreshadowing_history = raw_foreshadowing_history
+    
+    # 2. 获取当前章节伏笔内容
+    _log("  步骤2: 获取当前章节伏笔内容...")
+    from prompt_definitions import foreshadowing_content_processing_prompt
+    
+    # 构建伏笔条目字符串，使用完整的伏笔条目信息
+    foreshadowing_entries = []
+    if chapter_info and 'foreshadowing' in chapter_info and chapter_info['foreshadowing']:
+        # 将伏笔条目按行分割
+        entries = chapter_info['foreshadowing'].split('\n')
+        for entry in entries:
+            # 只保留包含伏笔编号和明确是本章需要处理的伏笔条目
+            if any(fb_id in entry for fb_id in foreshadowing_ids):
+                foreshadowing_entries.append(entry.strip())
+    
+    # 合并所有伏笔条目
+    foreshadowing_entries_str = "\n".join(foreshadowing_entries)
+    
+    # 将伏笔历史内容转换为文本格式，以便传递给提示
+    foreshadowing_history_text_for_content = ""
+    if foreshadowing_history:
+        for fb_id, content in foreshadowing_history.items():
+            foreshadowing_history_text_for_content += f"{fb_id}:\n历史内容：{content}\n\n"
+    else:
+        foreshadowing_history_text_for_content = "无历史内容。\n"
+
+    # 构建当前章节伏笔内容提示词
+    content_prompt = foreshadowing_content_processing_prompt.format(
+        novel_number=chapter_number,
+        chapter_title=chapter_title,
+        foreshadowing_entries=foreshadowing_entries_str,
+        foreshadowing_history=foreshadowing_history_text_for_content,
+        chapter_text=chapter_text
+    )
+    
+    # 调用LLM提取当前章节伏笔内容
+    from novel_generator.common import invoke_llm
+    try:
+        _log("    -> 正在调用LLM提取本章伏笔内容...")
+        started = time.monotonic()
+        current_foreshadowing_content = _invoke_structured_entries(
+            llm_adapter, content_prompt, FORESHADOWING_CONTENT_SPEC, "本章内容", log_func)
+        if current_foreshadowing_content is not None:
+            _log(f"    -> LLM返回的本章伏笔内容:\n---\n{_entries_summary(current_foreshadowing_content)}\n---")
         else:
-            foreshadowing_history_text_for_content = "无历史内容。\n"
-
-        # 构建当前章节伏笔内容提示词
-        content_prompt = foreshadowing_content_processing_prompt.format(
-            novel_number=chapter_number,
-            chapter_title=chapter_title,
-            foreshadowing_entries=foreshadowing_entries_str,
-            foreshadowing_history=foreshadowing_history_text_for_content,
-            chapter_text=chapter_text
-        )
-        
-        # 调用LLM提取当前章节伏笔内容
-        from novel_generator.common import invoke_llm
-        try:
-            _log("    -> 正在调用LLM提取本章伏笔内容...")
             content_result = invoke_llm(llm_adapter, content_prompt, log_func=log_func)
-            
+
             # 解析LLM返回的普通文本结果
             current_foreshadowing_content = {}
             summary_log = []
@@ -220,72 +267,88 @@ def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_ad
             matches = re.findall(pattern, content_result)
             for fb_id, content in matches:
                 current_foreshadowing_content[fb_id] = content.strip()
-            _log(f"    成功提取当前章节伏笔内容: {len(current_foreshadowing_content)}个伏笔")
-        except Exception as e:
-            _log(f"    提取当前章节伏笔内容失败: {str(e)}，使用备用方案", level="warning")
-            # 备用方案：手动构建当前伏笔内容
-            current_foreshadowing_content = {}
-            for fb_id in foreshadowing_ids:
-                # 从章节信息中提取该伏笔的状态和标题
-                fb_state = "未知"
-                fb_title = ""
-                fb_due_chapter = ""
-                for line in foreshadowing_items.split('\n'):
-                    if fb_id in line:
-                        # 尝试提取状态 (埋设/触发/强化/回收/悬置)
-                        states = re.findall(r'-(埋设|触发|强化|回收|悬置)-', line)
-                        if states:
-                            fb_state = states[0]
-                        
-                        # 尝试提取标题
-                        title_match = re.search(fr'{fb_id}\([^)]+\)-([^-]+)-', line)
-                        if title_match:
-                            fb_title = title_match.group(1)
-                        
-                        # 尝试提取回收章节设定
-                        due_match = re.search(r'（第(\d+)章前必须回收）', line)
-                        if due_match:
-                            fb_due_chapter = f"第{due_match.group(1)}章"
-                
-                # 构建当前伏笔内容
-                content = f"伏笔ID: {fb_id}, 状态: {fb_state}, 标题: {fb_title}, 章节: 第{chapter_number}章"
-                current_foreshadowing_content[fb_id] = content
-        
-        # 3. 整合伏笔内容
-        _log("  步骤3: 整合伏笔内容...")
-        from prompt_definitions import foreshadowing_processing_prompt
-        
-        # 将伏笔历史内容转换为文本格式
-        foreshadowing_history_text = ""
-        for fb_id, content in foreshadowing_history.items():
-            foreshadowing_history_text += f"{fb_id}\n历史内容：{content}\n\n"
-        
-        # 将当前章节伏笔内容转换为文本格式
-        current_foreshadowing_content_text = ""
-        for fb_id, content in current_foreshadowing_content.items():
-            current_foreshadowing_content_text += f"{fb_id}\n本章内容：{content}\n\n"
-        
-        # 构建整合提示词
-        foreshadowing_prompt = foreshadowing_processing_prompt.format(
-            novel_number=chapter_number,
-            chapter_title=chapter_title,
-            foreshadowing_history=foreshadowing_history_text,
-            current_foreshadowing_content=current_foreshadowing_content_text
-        )
-        
-        # 调用LLM整合内容
-        from novel_generator.common import invoke_llm
-        _log("    -> 正在调用LLM整合伏笔历史与本章内容...")
+        recorder.record("本章内容", started)
+        _log(f"    成功提取当前章节伏笔内容: {len(current_foreshadowing_content)}个伏笔")
+    except Exception as e:
+        _log(f"    提取当前章节伏笔内容失败: {str(e)}，使用备用方案", level="warning")
+        # 备用方案：手动构建当前伏笔内容
+        current_foreshadowing_content = {}
+        for fb_id in foreshadowing_ids:
+            # 从章节信息中提取该伏笔的状态和标题
+            fb_state = "未知"
+            fb_title = ""
+            fb_due_chapter = ""
+            for line in foreshadowing_items.split('\n'):
+                if fb_id in line:
+                    # 尝试提取状态 (埋设/触发/强化/回收/悬置)
+                    states = re.findall(r'-(埋设|触发|强化|回收|悬置)-', line)
+                    if states:
+                        fb_state = states[0]
+                    
+                    # 尝试提取标题
+                    title_match = re.search(fr'{fb_id}\([^)]+\)-([^-]+)-', line)
+                    if title_match:
+                        fb_title = title_match.group(1)
+                    
+                    # 尝试提取回收章节设定
+                    due_match = re.search(r'（第(\d+)章前必须回收）', line)
+                    if due_match:
+                        fb_due_chapter = f"第{due_match.group(1)}章"
+            
+            # 构建当前伏笔内容
+            content = f"伏笔ID: {fb_id}, 状态: {fb_state}, 标题: {fb_title}, 章节: 第{chapter_number}章"
+            current_foreshadowing_content[fb_id] = content
+    
+    # 3. 整合伏笔内容
+    _log("  步骤3: 整合伏笔内容...")
+    from prompt_definitions import foreshadowing_processing_prompt
+    
+    # 将伏笔历史内容转换为文本格式
+    foreshadowing_history_text = ""
+    for fb_id, content in foreshadowing_history.items():
+        foreshadowing_history_text += f"{fb_id}\n历史内容：{content}\n\n"
+    
+    # 将当前章节伏笔内容转换为文本格式
+    current_foreshadowing_content_text = ""
+    for fb_id, content in current_foreshadowing_content.items():
+        current_foreshadowing_content_text += f"{fb_id}\n本章内容：{content}\n\n"
+    
+    # 构建整合提示词
+    foreshadowing_prompt = foreshadowing_processing_prompt.format(
+        novel_number=chapter_number,
+        chapter_title=chapter_title,
+        foreshadowing_history=foreshadowing_history_text,
+        current_foreshadowing_content=current_foreshadowing_content_text
+    )
+    
+    # 调用LLM整合内容
+    from novel_generator.common import invoke_llm
+    _log("    -> 正在调用LLM整合伏笔历史与本章内容...")
+    started = time.monotonic()
+    integrated_entries = _invoke_structured_entries(
+        llm_adapter, foreshadowing_prompt, FORESHADOWING_INTEGRATION_SPEC, "内容", log_func)
+    integrated_content = ""
+    if integrated_entries is None:
         integrated_content = invoke_llm(llm_adapter, foreshadowing_prompt, log_func=log_func)
-        
-        # 解析整合后的内容
-        summary_log = []
+    recorder.record("整合", started)
+    
+    # 解析整合后的内容
+    summary_log = []
+    if integrated_entries is not None:
+        # 结构化输出：直接使用解析出的对象
+        foreshadowing_data = {
+            fb_id: {"content": content, "metadata": {"id": fb_id, "伏笔最后章节": f"第{chapter_number}章"}}
+            for fb_id, content in integrated_entries.items()
+        }
+        _log(f"    -> LLM返回的最终整合伏笔内容:\n---\n{_entries_summary(integrated_entries)}\n---")
+        _log(f"    成功整合伏笔内容: {len(foreshadowing_data)}个伏笔")
+    else:
         try:
             foreshadowing_data = {}
             # 使用正则表达式解析文本格式，只提取伏笔ID和内容
             pattern = r'(\w+\d+):\n内容：([^\n]+)'
             matches = re.findall(pattern, integrated_content)
-            
+        
             for fb_id, content in matches:
                 # 简化伏笔数据结构，只保留ID、内容和伏笔最后章节
                 foreshadowing_data[fb_id] = {
@@ -317,7 +380,115 @@ def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_ad
                         "伏笔最后章节": f"第{chapter_number}章"
                     }
                 }
+
+    return foreshadowing_data
+
+
+def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_adapter=None, log_func=None, fused=None):
+    """
+    从章节文本中提取伏笔内容，并存储到JSON文件
+    
+    Args:
+        chapter_text: 章节正文
+        chapter_info: 章节信息，包含伏笔条目等
+        filepath: JSON文件保存路径
+        llm_adapter: LLM适配器，从调用方传入
+        log_func: 日志记录函数
+        fused: 是否先尝试单次结构化调用，校验失败时回退到三步调用；
+               为 None 时按步骤是否启用结构化输出决定
+    
+    Returns:
+        提取和存储的结果，timings 中为各次LLM调用的耗时与Token数
+    """
+    # 日志辅助函数
+    def _log(message, level="info"): # level is kept for compatibility but not used
+        if log_func:
+            log_func(message)
+        else:
+            # Fallback to standard print if no log_func is provided
+            print(message)
+            
+    try:
+        # 获取章节编号和标题
+        chapter_number = chapter_info.get('novel_number', '0')
+        chapter_title = chapter_info.get('chapter_title', '')
+        _log(f"开始处理第{chapter_number}章《{chapter_title}》的伏笔内容")
+        
+        # 提取伏笔条目
+        foreshadowing_items = chapter_info.get("foreshadowing", "")
+        if not foreshadowing_items.strip():
+            _log(f"第{chapter_number}章没有伏笔条目，跳过处理")
+            return {"status": "no_foreshadowing"}
+        
+        # 解析伏笔编号
+        foreshadowing_ids = []
+        if chapter_info and 'foreshadowing' in chapter_info and chapter_info['foreshadowing']:
+            # 简化正则表达式，专注于提取伏笔ID
+            entries_pattern = r'([A-Z]F\d{3})\('  # 改为只匹配伏笔ID格式
+            foreshadowing_str = chapter_info['foreshadowing']
+            # 确保输入是字符串
+            if isinstance(foreshadowing_str, (list, tuple)):
+                foreshadowing_str = '\n'.join(map(str, foreshadowing_str))
+                
+            entries_matches = re.finditer(entries_pattern, foreshadowing_str)
+            
+            # 记录找到的所有伏笔ID
+            found_ids = set()
+            for match in entries_matches:
+                fb_id = match.group(1)
+                if fb_id not in found_ids:
+                    found_ids.add(fb_id)
+                    foreshadowing_ids.append(fb_id)
+                    _log(f"提取到伏笔编号: {fb_id}")
+            
+            if not foreshadowing_ids:
+                _log(f"第{chapter_info.get('novel_number', '未知')}章未找到有效的伏笔编号，跳过处理")
+                return {"status": "no_valid_foreshadowing"}
+            
+            _log(f"本章涉及伏笔编号列表：{', '.join(foreshadowing_ids)}")
+
+        # 加载伏笔JSON存储
+        foreshadowing_store = load_store(filepath, "foreshadowing_collection")
+        
+        # 使用传入的 LLM 适配器
+        if not llm_adapter:
+            _log("LLM适配器未传入，无法处理伏笔内容", level="warning")
+            return {"status": "llm_adapter_not_provided"}
+        
+        # 从JSON存储中检索原始伏笔历史内容
+        raw_foreshadowing_history = {}
+        if foreshadowing_store:
+            _log("    正在从JSON文件检索伏笔历史内容...")
+            for fb_id in foreshadowing_ids:
+                fb_data = foreshadowing_store.get(fb_id)
+                if fb_data and '内容' in fb_data:
+                    content = fb_data['内容']
+                    raw_foreshadowing_history[fb_id] = content
+                    summary = content.split('\n')[0]
+                    _log(f"      ✅ 成功检索到伏笔 {fb_id} 的历史: \"{summary}...\"")
+                else:
+                    _log(f"      ℹ️ 未找到伏笔 {fb_id} 的历史，可能是一个新伏笔。")
+        else:
+            _log("    伏笔JSON文件不存在，跳过历史内容检索。")
         
+        # 单次调用：一次结构化调用完成全部伏笔的提取与整合，校验失败时回退到原有的三步调用
+        fused = structured_output_enabled(llm_adapter) if fused is None else fused
+        recorder = _CallRecorder(llm_adapter)
+        foreshadowing_data = None
+        mode = "三步调用"
+        if fused:
+            foreshadowing_data = _process_in_one_call(chapter_text, chapter_info, chapter_number, chapter_title, foreshadowing_ids,
+                                                      raw_foreshadowing_history, llm_adapter, recorder, log_func, _log)
+            if foreshadowing_data is not None:
+                mode = "单次调用"
+            else:
+                _log("  单次调用处理伏笔失败，回退到三步处理流程。")
+        if foreshadowing_data is None:
+            foreshadowing_data = _process_in_three_steps(chapter_text, chapter_info, chapter_number, chapter_title, foreshadowing_ids,
+                                                         raw_foreshadowing_history, llm_adapter, recorder, log_func, _log)
+        _log(f"  伏笔处理方式：{recorder.summary(mode)}")
+        _save_processing_stats(filepath, chapter_number, mode, fused, recorder)
+
         # 步骤4: 更新JSON文件
         _log("  步骤4: 更新伏笔状态MD文件...")
         
@@ -341,7 +512,9 @@ def process_and_store_foreshadowing(chapter_text, chapter_info, filepath, llm_ad
 
         return {
             "status": "success",
-            "foreshadowing_data": foreshadowing_data
+            "foreshadowing_data": foreshadowing_data,
+            "mode": mode,
+            "timings": recorder.steps
         }
     
     except Exception as e:
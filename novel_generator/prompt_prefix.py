@@ -0,0 +1,55 @@
+# novel_generator/prompt_prefix.py
+# -*- coding: utf-8 -*-
+"""
+章节提示词的“稳定前缀 + 可变尾部”组装。
+同一章的草稿 → 审校 → 改写 → 审校循环会反复发送相同的分卷大纲、前情摘要和章节目录。
+将这些内容按固定顺序提到提示词最前面，保证各次请求的前缀逐字节一致，
+使 OpenAI/DeepSeek 的自动前缀缓存和 Anthropic 的 cache_control 能够命中。
+"""
+from typing import Any, Dict
+
+# 共享上下文字段：(标题, 模板中可能使用的占位符名)，顺序按稳定程度从高到低排列
+SHARED_CONTEXT_FIELDS = [
+    ("分卷大纲", ("volume_outline",)),
+    ("用户指导", ("user_guidance",)),
+    ("前情摘要", ("global_summary",)),
+    ("当前章节目录", ("current_chapter_blueprint", "chapter_blueprint_content")),
+]
+
+SHARED_CONTEXT_TITLE = "【章节共享上下文】"
+
+
+class PrefixedPrompt(str):
+    """
+    带有可缓存前缀的提示词。作为普通字符串使用时内容为 prefix + tail，
+    适配器可通过 cache_prefix 属性识别前缀并为其设置缓存标记。
+    """
+    def __new__(cls, prefix: str, tail: str):
+        obj = super().__new__(cls, prefix + tail)
+        obj.cache_prefix = prefix
+        return obj
+
+
+def build_shared_context(**kwargs) -> str:
+    """按固定顺序渲染共享上下文，相同的输入总是得到逐字节相同的结果。"""
+    sections = [
+        f"{SHARED_CONTEXT_TITLE}\n以下资料在本章的创作、审校与改写中共用，后文中标注“见【章节共享上下文】”之处即指此处内容。\n"
+    ]
+    for title, keys in SHARED_CONTEXT_FIELDS:
+        value = next((kwargs[k] for k in keys if k in kwargs), None)
+        value = str(value).strip() if value else "无"
+        sections.append(f"【{title}】\n{value}\n")
+    return "\n".join(sections) + "\n"
+
+
+def build_prefixed_prompt(template: str, **kwargs: Any) -> PrefixedPrompt:
+    """
+    用 kwargs 渲染提示词模板：共享上下文字段移入前缀，模板中对应的占位符替换为引用说明，
+    其余字段照常填入尾部。
+    """
+    prefix = build_shared_context(**kwargs)
+    tail_kwargs: Dict[str, Any] = dict(kwargs)
+    for title, keys in SHARED_CONTEXT_FIELDS:
+        for key in keys:
+            tail_kwargs[key] = f"（见【章节共享上下文】中的【{title}】）"
+    return PrefixedPrompt(prefix, template.format(**tail_kwargs))
@@ -0,0 +1,157 @@
+# novel_generator/retry_policy.py
+# -*- coding: utf-8 -*-
+"""
+LLM调用的重试策略。
+- 将错误分为可重试（限流、超时、5xx、网络中断）与不可重试（400/401/403/404/422、主动取消）；
+- 可重试错误使用带随机抖动的指数退避，服务端返回 Retry-After 时以其为准；
+- 每个步骤共享一份重试预算，避免在轮询模式下对每个配置都耗尽重试次数。
+"""
+import random
+import re
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from llm_adapters import LLMRequestCancelled
+
+
+class NonRetryableLLMError(Exception):
+    """不可重试的LLM错误，上层应立即切换到下一个配置。"""
+    pass
+
+
+class ErrorClassification:
+    """错误分类结果。"""
+    def __init__(self, retryable: bool, reason: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        self.retryable = retryable
+        self.reason = reason
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class RetryBudget:
+    """
+    一个步骤内所有配置共享的重试预算。
+    execute_with_polling 为每次步骤执行创建一份，并挂在借出的适配器上。
+    """
+    def __init__(self, step_name: str, limit: int):
+        self.step_name = step_name
+        self.limit = max(0, int(limit))
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_consume(self) -> bool:
+        """消耗一次重试机会，预算用尽时返回 False。"""
+        with self._lock:
+            if self.used >= self.limit:
+                return False
+            self.used += 1
+            return True
+
+    @property
+    def remaining(self) -> int:
+        return max(0, self.limit - self.used)
+
+
+class RetryPolicy:
+    """
+    默认重试策略。可通过继承并覆盖 classify / next_delay 来定制。
+    """
+    NON_RETRYABLE_STATUS = {400, 401, 403, 404, 405, 413, 422}
+    RETRYABLE_STATUS = {408, 409, 425, 429}
+
+    def __init__(self, max_retries: int = 3, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def _status_code(error: Exception) -> Optional[int]:
+        status_code = getattr(error, "status_code", None)
+        if status_code is None:
+            status_code = getattr(getattr(error, "response", None), "status_code", None)
+        if status_code is None:
+            # 已被上层包装成字符串的错误，如 "Error code: 429"
+            match = re.search(r"Error code: (\d{3})", str(error))
+            if match:
+                status_code = int(match.group(1))
+        try:
+            return int(status_code) if status_code is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """从错误响应头中读取 retry-after-ms / retry-after（秒数或HTTP日期）。"""
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        if not headers:
+            return None
+        try:
+            retry_after_ms = headers.get("retry-after-ms")
+            if retry_after_ms:
+                return max(0.0, float(retry_after_ms) / 1000.0)
+            retry_after = headers.get("retry-after")
+            if not retry_after:
+                return None
+            try:
+                return max(0.0, float(retry_after))
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except Exception:
+            return None
+
+    def classify(self, error: Exception) -> ErrorClassification:
+        """判断错误是否值得重试。"""
+        if isinstance(error, (LLMRequestCancelled, NonRetryableLLMError)):
+            return ErrorClassification(False, "已取消或不可重试")
+
+        status_code = self._status_code(error)
+        if status_code is not None:
+            if status_code in self.NON_RETRYABLE_STATUS:
+                return ErrorClassification(False, f"请求被拒绝 (HTTP {status_code})", status_code)
+            if status_code in self.RETRYABLE_STATUS or status_code >= 500:
+                return ErrorClassification(True, f"HTTP {status_code}", status_code, self._retry_after(error))
+
+        error_type = type(error).__name__.lower()
+        if isinstance(error, (TimeoutError, ConnectionError)) or "timeout" in error_type or "connect" in error_type:
+            return ErrorClassification(True, "网络超时或连接中断", status_code)
+        if isinstance(error, (TypeError, NotImplementedError)):
+            # 本地参数或代码错误，重试不会改变结果
+            return ErrorClassification(False, f"本地错误 ({type(error).__name__})", status_code)
+        return ErrorClassification(True, "未知错误", status_code)
+
+    def next_delay(self, attempt: int, classification: ErrorClassification) -> float:
+        """第 attempt 次重试前的等待秒数：优先 Retry-After，否则为带全抖动的指数退避。"""
+        if classification.retry_after is not None:
+            return min(classification.retry_after, self.max_delay) + random.uniform(0, 0.5)
+        ceiling = min(self.max_delay, self.base_delay * (2 ** max(0, attempt - 1)))
+        return random.uniform(self.base_delay / 2, max(self.base_delay / 2, ceiling))
+
+
+def sleep_with_interrupt(seconds: float, check_interrupted=None, interval: float = 0.2):
+    """可被停止信号打断的等待。"""
+    deadline = time.time() + seconds
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return
+        if check_interrupted and check_interrupted():
+            raise InterruptedError("重试等待期间被中断。")
+        time.sleep(min(interval, remaining))
+
+
+# 默认策略实例，invoke_stream_with_cleaning 未指定 retry_policy 时使用
+default_retry_policy = RetryPolicy()
+
+
+def error_status_code(error: BaseException) -> Optional[int]:
+    """取出异常对应的HTTP状态码，沿 __cause__ 查找被上层包装前的原始异常；识别不出时返回 None。"""
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        status_code = RetryPolicy._status_code(error)
+        if status_code is not None:
+            return status_code
+        error = error.__cause__ or error.__context__
+    return None
@@ -0,0 +1,110 @@
+# novel_generator/stream_result.py
+# -*- coding: utf-8 -*-
+"""
+流式调用的结果对象。
+StreamResult 是 str 的子类，现有按字符串使用返回值的调用方无需修改；
+同时在 stats 中携带本次调用的首字延迟、总耗时、输出字数/Token、结束原因、重试次数、
+实际使用的配置和命中缓存的输入Token数，供统计和日志读取。
+"""
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+
+class StreamResult(str):
+    """带调用统计的字符串。对其做切片、拼接等字符串运算得到的是普通 str。"""
+    stats: Dict[str, Any]
+
+    def __new__(cls, text: str = "", stats: Optional[Dict[str, Any]] = None):
+        obj = super().__new__(cls, text)
+        obj.stats = dict(stats or {})
+        return obj
+
+    @property
+    def ttft(self) -> Optional[float]:
+        return self.stats.get("ttft")
+
+    @property
+    def total_time(self) -> Optional[float]:
+        return self.stats.get("total_time")
+
+    @property
+    def finish_reason(self) -> Optional[str]:
+        return self.stats.get("finish_reason")
+
+    @property
+    def config_name(self) -> Optional[str]:
+        return self.stats.get("config")
+
+    def describe(self) -> str:
+        """单行的统计摘要，用于日志。"""
+        parts = []
+        if self.stats.get("ttft") is not None:
+            parts.append(f"首字 {self.stats['ttft']:.2f} 秒")
+        if self.stats.get("total_time") is not None:
+            parts.append(f"总耗时 {self.stats['total_time']:.2f} 秒")
+        parts.append(f"{self.stats.get('output_chars', len(self))} 字")
+        if self.stats.get("output_tokens"):
+            parts.append(f"{self.stats['output_tokens']} Token")
+        if self.stats.get("cached_tokens"):
+            parts.append(f"缓存命中 {self.stats['cached_tokens']} Token")
+        if self.stats.get("retries"):
+            parts.append(f"重试 {self.stats['retries']} 次")
+        if self.stats.get("finish_reason"):
+            parts.append(f"结束原因 {self.stats['finish_reason']}")
+        return "，".join(parts)
+
+
+class StreamCollector:
+    """按列表缓存分片，结束时一次性拼接，避免对长文本反复 += 的二次开销。"""
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_chunk_at: Optional[float] = None
+        self._parts: List[str] = []
+        self.chars = 0
+
+    def add(self, chunk: str):
+        if not chunk:
+            return
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.monotonic()
+        self._parts.append(chunk)
+        self.chars += len(chunk)
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def build(self, llm_adapter=None, retries: int = 0, **extra) -> StreamResult:
+        """生成 StreamResult；llm_adapter 提供Token用量、结束原因和配置名。"""
+        now = time.monotonic()
+        stats: Dict[str, Any] = {
+            "ttft": self.first_chunk_at - self.started if self.first_chunk_at is not None else None,
+            "total_time": now - self.started,
+            "output_chars": self.chars,
+            "retries": retries,
+        }
+        if llm_adapter is not None:
+            usage = getattr(llm_adapter, "last_usage", None) or {}
+            _, output_tokens = getattr(llm_adapter, "last_invocation_tokens", (0, 0))
+            stats["output_tokens"] = usage.get("completion_tokens") or output_tokens
+            stats["cached_tokens"] = usage.get("cached_tokens") or 0
+            stats["finish_reason"] = getattr(llm_adapter, "last_finish_reason", None)
+            stats["config"] = getattr(llm_adapter, "config_name", None)
+            stats["model"] = getattr(llm_adapter, "model_name", None)
+        stats.update(extra)
+        return StreamResult(self.text(), stats)
+
+
+def collect_stream(stream: Iterator[str]) -> StreamResult:
+    """
+    消费 invoke_stream_with_cleaning 返回的生成器，返回其携带统计的 StreamResult。
+    对没有返回值的普通迭代器，退化为按列表拼接的结果。
+    """
+    collector = StreamCollector()
+    iterator = iter(stream)
+    while True:
+        try:
+            collector.add(next(iterator))
+        except StopIteration as stop:
+            if isinstance(stop.value, StreamResult):
+                return stop.value
+            return collector.build()
@@ -0,0 +1,129 @@
+# novel_generator/stream_salvage.py
+# -*- coding: utf-8 -*-
+"""
+长文本流式生成的中断续写。
+草稿、改写等自由文本步骤的输出很长，流在中途断开时若整段重来，已生成部分的输出Token要付两次费用。
+这里保存已生成的部分，重试或切换配置时改为发送“从中断处继续”的续写请求，
+并在拼接时去掉续写开头与已有内容重叠的部分。
+"""
+import hashlib
+import threading
+from typing import Dict, Optional
+
+from novel_generator.prompt_prefix import PrefixedPrompt
+
+# 未在步骤配置中单独设置“续写恢复”的步骤中，以下步骤默认启用。
+# 只列出生成章节正文的步骤（工作流与手动操作中的草稿、改写）；按完整名称匹配，
+# 避免把同前缀的结构化步骤（如 生成草稿_生成角色信息）的残缺输出拼上续写内容
+DEFAULT_SALVAGE_STEPS = frozenset({
+    "生成草稿_生成章节草稿",
+    "改写章节_重写或改写章节",
+    "生成草稿",
+    "改写章节",
+})
+
+CONTINUATION_TEMPLATE = """
+
+【已输出的内容】
+以下是你此前按上述要求已经输出的内容，输出在此处意外中断：
+{partial}
+
+【续写要求】
+请从上文最后一个字之后紧接着继续输出，直到完成全部要求。不要重复已经输出的内容，不要添加任何说明、标题或前言。
+"""
+
+
+class StreamSalvage:
+    """
+    一个步骤内共享的中断续写状态。
+    execute_with_polling 为每次步骤执行创建一份并挂在借出的适配器上，
+    因此切换到下一个配置时仍能接着上一个配置中断处继续。
+    """
+    def __init__(self, step_name: str, enabled: bool = True):
+        self.step_name = step_name
+        self.enabled = enabled
+        self._partials: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(prompt: str) -> str:
+        return hashlib.sha1(prompt.encode('utf-8')).hexdigest()
+
+    def get(self, prompt: str) -> str:
+        """返回该提示词此前中断时已生成的内容。"""
+        with self._lock:
+            return self._partials.get(self._key(prompt), "")
+
+    def save(self, prompt: str, partial: str):
+        """记录中断时已生成的内容，只保留最长的一份。"""
+        if not partial:
+            return
+        key = self._key(prompt)
+        with self._lock:
+            if len(partial) > len(self._partials.get(key, "")):
+                self._partials[key] = partial
+
+    def discard(self, prompt: str):
+        with self._lock:
+            self._partials.pop(self._key(prompt), None)
+
+
+def is_salvage_enabled(step_config: dict, step_name: str) -> bool:
+    """按步骤配置中的“续写恢复”判断是否启用，未设置时只对生成章节正文的步骤启用。"""
+    if "续写恢复" in step_config:
+        return bool(step_config["续写恢复"])
+    return step_name in DEFAULT_SALVAGE_STEPS
+
+
+def build_continuation_prompt(prompt: str, partial: str) -> str:
+    """在原提示词后附上已输出内容和续写要求；原提示词的可缓存前缀保持不变。"""
+    continuation = CONTINUATION_TEMPLATE.format(partial=partial)
+    if isinstance(prompt, PrefixedPrompt):
+        return PrefixedPrompt(prompt.cache_prefix, str(prompt)[len(prompt.cache_prefix):] + continuation)
+    return prompt + continuation
+
+
+def find_overlap(existing: str, continuation: str, max_overlap: int = 500, min_overlap: int = 4) -> int:
+    """返回 continuation 开头与 existing 结尾重叠的字符数（取最长的重叠）。"""
+    upper = min(len(existing), len(continuation), max_overlap)
+    for size in range(upper, min_overlap - 1, -1):
+        if existing.endswith(continuation[:size]):
+            return size
+    return 0
+
+
+class OverlapTrimmer:
+    """
+    流式去重：先缓存续写开头的 max_overlap 个字符，确定与已有内容的重叠长度后
+    去掉重叠部分，之后的分片直接放行。
+    """
+    def __init__(self, existing: str, max_overlap: int = 500):
+        self.existing = existing
+        self.max_overlap = max_overlap
+        self._buffer = ""
+        self._resolved = False
+        self.trimmed = 0
+
+    def feed(self, chunk: str) -> str:
+        if self._resolved:
+            return chunk
+        self._buffer += chunk
+        if len(self._buffer) < self.max_overlap:
+            return ""
+        return self._resolve()
+
+    def flush(self) -> str:
+        """流结束时放行缓存中剩余的内容。"""
+        if self._resolved:
+            return ""
+        return self._resolve()
+
+    def _resolve(self) -> str:
+        self._resolved = True
+        self.trimmed = find_overlap(self.existing, self._buffer, self.max_overlap)
+        text, self._buffer = self._buffer[self.trimmed:], ""
+        return text
+
+
+def make_stream_salvage(step_config: Optional[dict], step_name: str) -> StreamSalvage:
+    return StreamSalvage(step_name, is_salvage_enabled(step_config or {}, step_name))
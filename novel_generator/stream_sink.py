@@ -0,0 +1,86 @@
+# novel_generator/stream_sink.py
+# -*- coding: utf-8 -*-
+"""
+流式输出的合并刷新。
+LLM 的流式分片通常只有几个字，逐片写终端并调用 log_func 会让界面为每个分片安排一次
+Tk 回调，长章节生成时界面明显卡顿。StreamSink 先缓存分片，按时间间隔或累计字数
+批量刷新到终端和 GUI，流结束时立即刷新剩余内容。
+"""
+import sys
+import threading
+import time
+from typing import Callable, Optional
+
+# 默认刷新参数，可通过 configure_stream_sink 按轮询设定调整
+_defaults = {"interval": 0.08, "max_chars": 256}
+
+
+def configure_stream_sink(interval_ms: Optional[float] = None, max_chars: Optional[int] = None):
+    """更新之后创建的 StreamSink 的默认刷新间隔（毫秒）和字数阈值。"""
+    if interval_ms is not None:
+        _defaults["interval"] = max(0.0, float(interval_ms) / 1000.0)
+    if max_chars is not None:
+        _defaults["max_chars"] = max(1, int(max_chars))
+
+
+class StreamSink:
+    """
+    缓存流式分片，满足以下任一条件时刷新一次：距上次刷新超过 interval 秒，或缓存超过 max_chars 字。
+    GUI 端的回调次数因此与刷新次数而非分片数成正比。可作为上下文管理器使用，退出时自动 close()。
+    """
+    def __init__(self, log_func: Optional[Callable] = None, console: bool = True,
+                 interval: Optional[float] = None, max_chars: Optional[int] = None):
+        self.log_func = log_func
+        self.console = console
+        self.interval = _defaults["interval"] if interval is None else interval
+        self.max_chars = _defaults["max_chars"] if max_chars is None else max_chars
+        self._parts = []
+        self._size = 0
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        # 计时器线程也会调用 flush，输出锁保证各批内容按顺序写出
+        self._flush_lock = threading.Lock()
+
+    def write(self, text: str):
+        if not text:
+            return
+        with self._lock:
+            self._parts.append(text)
+            self._size += len(text)
+            due = self._size >= self.max_chars or time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush_if_due(self):
+        """供定时器调用：分片长时间未到达时，把已缓存的内容按间隔刷新出去。"""
+        with self._lock:
+            due = self._parts and time.monotonic() - self._last_flush >= self.interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                if not self._parts:
+                    self._last_flush = time.monotonic()
+                    return
+                text = "".join(self._parts)
+                self._parts.clear()
+                self._size = 0
+                self._last_flush = time.monotonic()
+            if self.console:
+                sys.__stdout__.write(text)
+                sys.__stdout__.flush()
+            if self.log_func:
+                self.log_func(text, stream=True)
+
+    def close(self):
+        """立即刷新剩余内容。"""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
@@ -0,0 +1,190 @@
+# novel_generator/stream_ticker.py
+# -*- coding: utf-8 -*-
+"""
+进程内共享的流式调用计时器。
+以前每个流式调用都启动一个每 0.1 秒唤醒一次的计时线程来刷新“LLM 正在思考”提示，
+并发生成时线程数随调用数增长。这里由一个后台线程统一跟踪所有活动的流（已等待时间、
+已输出字数、生成速度），每个周期按日志函数合并为一条更新推送到 GUI，
+并顺带刷新到期的 StreamSink 缓存。没有活动的流时后台线程自动退出。
+"""
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+class StreamHandle:
+    """一个活动流在计时器中的登记项，由流的调用方更新状态。"""
+    def __init__(self, ticker: "StreamTicker", label: str, log_func: Optional[Callable], sink=None):
+        self._ticker = ticker
+        self.label = label
+        self.log_func = log_func
+        self.sink = sink
+        self.started = time.monotonic()
+        self.first_chunk_at: Optional[float] = None
+        self.chars = 0
+        # 推理模型在正文前输出的思考内容字数（不计入 chars）
+        self.reasoning_chars = 0
+        self.closed = False
+
+    @property
+    def waiting(self) -> bool:
+        """尚未收到第一个分片。"""
+        return self.first_chunk_at is None
+
+    def first_chunk(self):
+        """收到第一个分片：输出思考耗时，之后该流不再显示读秒。"""
+        if self.first_chunk_at is not None:
+            return
+        self.first_chunk_at = time.monotonic()
+        self._ticker._report_finished(self, self.first_chunk_at - self.started)
+
+    def add_chars(self, count: int):
+        self.chars += count
+
+    def add_reasoning(self, count: int):
+        self.reasoning_chars += count
+
+    def close(self):
+        """流结束或出错时注销；仍在等待首个分片时同样输出最终耗时。"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.first_chunk_at is None:
+            self._ticker._report_finished(self, time.monotonic() - self.started)
+        self._ticker._unregister(self)
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        generating = now - self.first_chunk_at if self.first_chunk_at is not None else 0.0
+        return {
+            "label": self.label,
+            "elapsed": now - self.started,
+            "waiting": self.waiting,
+            "chars": self.chars,
+            "reasoning_chars": self.reasoning_chars,
+            "chars_per_sec": self.chars / generating if generating > 0 else 0.0,
+        }
+
+
+class StreamTicker:
+    """所有流共用的计时器（单例）。"""
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._instance_lock:
+                if not cls._instance:
+                    cls._instance = super(StreamTicker, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, interval: float = 0.1):
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._streams: List[StreamHandle] = []
+        self._listeners: List[Callable[[List[Dict[str, Any]]], None]] = []
+        self._thread: Optional[threading.Thread] = None
+        self._initialized = True
+
+    def register(self, label: str = "", log_func: Optional[Callable] = None, sink=None) -> StreamHandle:
+        """登记一个即将开始的流。sink 为该流的 StreamSink，计时器会定期刷新其中到期的内容。"""
+        handle = StreamHandle(self, label, log_func, sink)
+        with self._lock:
+            self._streams.append(handle)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stream-ticker", daemon=True)
+                self._thread.start()
+        return handle
+
+    def _unregister(self, handle: StreamHandle):
+        with self._lock:
+            if handle in self._streams:
+                self._streams.remove(handle)
+
+    def add_listener(self, callback: Callable[[List[Dict[str, Any]]], None]):
+        """注册每个周期接收全部活动流统计的回调（例如界面状态栏）。"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            streams = list(self._streams)
+        return [handle.stats() for handle in streams]
+
+    @staticmethod
+    def _format_elapsed(handle: StreamHandle, now: float) -> str:
+        text = f"{now - handle.started:.1f} 秒"
+        if handle.reasoning_chars:
+            text += f"，已推理 {handle.reasoning_chars} 字"
+        return text
+
+    @classmethod
+    def _format_waiting(cls, handles: List[StreamHandle], now: float) -> str:
+        if len(handles) == 1:
+            return f"LLM 正在思考...  （{cls._format_elapsed(handles[0], now)}）"
+        parts = " | ".join(f"{h.label or '调用'} {cls._format_elapsed(h, now)}" for h in handles)
+        return f"LLM 正在思考...  （{len(handles)} 个调用：{parts}）"
+
+    def _report_finished(self, handle: StreamHandle, elapsed: float):
+        final_message = f"LLM 思考完毕，共耗时 {elapsed:.2f} 秒"
+        sys.__stdout__.write(f"\r{final_message}\n")
+        sys.__stdout__.flush()
+        if handle.log_func:
+            handle.log_func(final_message, replace_last_line=True)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._streams:
+                    # 没有活动的流，线程退出；下次 register 时重新启动
+                    self._thread = None
+                    return
+                streams = list(self._streams)
+                listeners = list(self._listeners)
+
+            now = time.monotonic()
+            waiting = [h for h in streams if h.waiting and not h.closed]
+            # 按日志函数分组，每个日志目标每个周期只收到一条合并后的更新
+            groups: Dict[int, List[StreamHandle]] = {}
+            for handle in waiting:
+                if handle.log_func:
+                    groups.setdefault(id(handle.log_func), []).append(handle)
+            for handles in groups.values():
+                # 本周期内可能已收到首个分片，此时不再覆盖“思考完毕”的提示
+                handles = [h for h in handles if h.waiting and not h.closed]
+                if not handles:
+                    continue
+                try:
+                    handles[0].log_func(self._format_waiting(handles, now), replace_last_line=True)
+                except Exception:
+                    pass
+            # 有流正在输出正文时不在终端打印读秒，避免与正文交错
+            if waiting and all(h.waiting for h in streams):
+                sys.__stdout__.write(f"\r{self._format_waiting(waiting, now)}")
+                sys.__stdout__.flush()
+
+            for handle in streams:
+                if handle.sink is not None and not handle.waiting:
+                    handle.sink.flush_if_due()
+
+            if listeners:
+                stats = [handle.stats() for handle in streams]
+                for listener in listeners:
+                    try:
+                        listener(stats)
+                    except Exception:
+                        pass
+
+            time.sleep(self.interval)
+
+
+# 全局共享实例
+stream_ticker = StreamTicker()
@@ -0,0 +1,523 @@
+# novel_generator/structured_output.py
+# -*- coding: utf-8 -*-
+"""
+结构化（JSON）输出模式。
+伏笔整合、角色状态更新、角色生成和剧情要点提取原本让模型输出自由格式的文本，再用正则解析，
+格式稍有偏差就解析失败，只能把很长的提示词整段重发。启用“结构化输出”的步骤改为：
+- 按 OutputSpec 的 JSON Schema 要求模型输出 JSON：OpenAI 兼容接口使用 response_format，
+  Claude 使用强制调用的工具（tool-use），Gemini 使用 response_mime_type，其余接口只在提示词中说明；
+- IncrementalJSONValidator 在流式接收时逐字符检查语法，出现非法内容立即中止该次请求并重试；
+- 流结束后按 Schema 校验，调用方直接用解析出的对象更新存储。
+多次校验失败时抛出 StructuredOutputError，调用方回退到原有的文本解析流程。
+"""
+import json
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+from novel_generator.prompt_prefix import PrefixedPrompt
+
+JSON_INSTRUCTION_TEMPLATE = """
+
+【输出格式（优先于上文的格式要求）】
+请把上文要求输出的全部内容按以下 JSON Schema 组织为一个 JSON 对象后输出。
+只输出 JSON 本身，不要输出代码块标记、解释或任何其他文字；字段值中的换行使用 \\n 表示。
+{schema}
+"""
+
+# 开头允许出现的说明文字上限（如代码块标记被清理后残留的 "json"），超出仍未见到 JSON 即判定格式错误
+MAX_PREAMBLE_CHARS = 200
+
+
+class StructuredOutputError(ValueError):
+    """模型输出不是合法的 JSON，或不符合要求的 Schema。"""
+
+
+@dataclass(frozen=True)
+class OutputSpec:
+    """一个结构化输出的定义：name 用作 response_format/工具的名称，schema 为 JSON Schema。"""
+    name: str
+    description: str
+    schema: Dict[str, Any]
+
+    def instruction(self) -> str:
+        return JSON_INSTRUCTION_TEMPLATE.format(schema=json.dumps(self.schema, ensure_ascii=False, indent=1))
+
+
+def structured_output_enabled(llm_adapter) -> bool:
+    """当前步骤是否启用了结构化输出（由 execute_with_polling 按步骤配置挂载到适配器上）。"""
+    return bool(getattr(llm_adapter, "structured_output", False))
+
+
+# ---------------------------------------------------------------------------
+# 流式语法校验
+# ---------------------------------------------------------------------------
+
+_NUMBER_PREFIX = re.compile(r"-?(0|[1-9]\d*)?(\.\d*)?([eE][+-]?\d*)?$")
+_NUMBER_FULL = re.compile(r"-?(0|[1-9]\d*)(\.\d+)?([eE][+-]?\d+)?$")
+_LITERALS = ("true", "false", "null")
+_WHITESPACE = " \t\r\n"
+
+# 解析状态：期待值 / 期待键或结束 / 期待键 / 期待冒号 / 期待逗号或结束 / 期待值或结束
+_VALUE, _KEY_OR_END, _KEY, _COLON, _COMMA_OR_END, _VALUE_OR_END = range(6)
+
+
+class IncrementalJSONValidator:
+    """
+    逐片接收模型输出并检查其是否仍可能构成合法 JSON，出错时立即抛出 StructuredOutputError。
+    容忍开头少量的说明文字（如清理代码块标记后残留的 "json"）和字符串中未转义的换行；
+    顶层值结束后的内容被忽略。
+    finish() 解析完整文本并按 Schema 校验。
+    """
+    def __init__(self, spec: Optional[OutputSpec] = None):
+        self.spec = spec
+        self._parts: List[str] = []
+        self._started = False
+        self._done = False
+        self._preamble = 0
+        self._stack: List[str] = []   # "{" 或 "["
+        self._expect = _VALUE
+        self._in_string = False
+        self._escape = False
+        self._unicode_left = 0
+        self._token = ""              # 正在读取的数字或 true/false/null
+        self._position = 0
+
+    @property
+    def complete(self) -> bool:
+        """顶层 JSON 值已经结束。"""
+        return self._done
+
+    def feed(self, chunk: str):
+        if not chunk or self._done:
+            return
+        start = 0
+        if not self._started:
+            start = self._skip_preamble(chunk)
+            if start is None:
+                return
+        for index in range(start, len(chunk)):
+            self._position += 1
+            self._step(chunk[index])
+            if self._done:
+                self._parts.append(chunk[start:index + 1])
+                return
+        self._parts.append(chunk[start:])
+
+    def _skip_preamble(self, chunk: str) -> Optional[int]:
+        """跳过顶层 JSON 之前的内容，返回 JSON 开始的位置；本分片中尚未开始时返回 None。"""
+        for index, char in enumerate(chunk):
+            if char in "{[":
+                expected = (self.spec.schema.get("type") if self.spec else None)
+                if expected == "object" and char != "{" or expected == "array" and char != "[":
+                    raise StructuredOutputError(f"顶层应为 {expected}，输出以 '{char}' 开始。")
+                self._started = True
+                return index
+            if char not in _WHITESPACE:
+                self._preamble += 1
+                if self._preamble > MAX_PREAMBLE_CHARS:
+                    raise StructuredOutputError(f"输出的前 {MAX_PREAMBLE_CHARS} 个字符中没有出现 JSON。")
+        return None
+
+    def _fail(self, char: str, expectation: str):
+        raise StructuredOutputError(f"JSON 格式错误：第 {self._position} 个字符 {char!r} 处应为{expectation}。")
+
+    def _step(self, char: str):
+        if self._in_string:
+            self._string_char(char)
+            return
+        if self._token:
+            if self._token_char(char):
+                return
+        if char in _WHITESPACE:
+            return
+
+        expect = self._expect
+        if expect == _COLON:
+            if char != ":":
+                self._fail(char, "冒号")
+            self._expect = _VALUE
+        elif expect in (_KEY_OR_END, _KEY):
+            if char == '"':
+                self._in_string = True
+                self._expect = _COLON
+            elif char == "}" and expect == _KEY_OR_END:
+                self._close("{")
+            else:
+                self._fail(char, "字符串形式的键")
+        elif expect == _COMMA_OR_END:
+            container = self._stack[-1]
+            if char == ",":
+                self._expect = _KEY if container == "{" else _VALUE
+            elif char == ("}" if container == "{" else "]"):
+                self._close(container)
+            else:
+                self._fail(char, "逗号或结束括号")
+        else:  # _VALUE / _VALUE_OR_END
+            if char == "]" and expect == _VALUE_OR_END:
+                self._close("[")
+            else:
+                self._start_value(char)
+
+    def _start_value(self, char: str):
+        if char == "{":
+            self._stack.append("{")
+            self._expect = _KEY_OR_END
+        elif char == "[":
+            self._stack.append("[")
+            self._expect = _VALUE_OR_END
+        elif char == '"':
+            self._in_string = True
+            self._expect = _COMMA_OR_END
+        elif char == "-" or char.isdigit() or char in "tfn":
+            self._token = char
+            self._check_token()
+        else:
+            self._fail(char, "JSON 值")
+
+    def _string_char(self, char: str):
+        if self._unicode_left:
+            if char not in "0123456789abcdefABCDEF":
+                self._fail(char, "十六进制字符")
+            self._unicode_left -= 1
+        elif self._escape:
+            if char == "u":
+                self._unicode_left = 4
+            elif char not in '"\\/bfnrt':
+                self._fail(char, "合法的转义字符")
+            self._escape = False
+        elif char == "\\":
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if not self._stack:
+                self._done = True
+
+    def _token_char(self, char: str) -> bool:
+        """读取数字或字面量；返回 True 表示该字符属于当前记号。"""
+        candidate = self._token + char
+        if char.isalnum() or char in ".+-":
+            self._token = candidate
+            self._check_token()
+            return True
+        self._end_token()
+        return False
+
+    def _check_token(self):
+        token = self._token
+        if token[0] in "tfn":
+            if not any(literal.startswith(token) for literal in _LITERALS):
+                self._fail(token[-1], "true、false 或 null")
+        elif not _NUMBER_PREFIX.match(token):
+            self._fail(token[-1], "数字")
+
+    def _end_token(self):
+        token, self._token = self._token, ""
+        if token not in _LITERALS and not _NUMBER_FULL.match(token):
+            self._fail(token, "完整的 JSON 值")
+        self._expect = _COMMA_OR_END
+        if not self._stack:
+            self._done = True
+
+    def _close(self, container: str):
+        if not self._stack or self._stack[-1] != container:
+            self._fail("}" if container == "{" else "]", "匹配的括号")
+        self._stack.pop()
+        self._expect = _COMMA_OR_END
+        if not self._stack:
+            self._done = True
+
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    def finish(self) -> Any:
+        """流结束：解析并按 Schema 校验，返回解析出的对象。"""
+        if self._token and not self._stack:
+            self._end_token()
+        if not self._started:
+            raise StructuredOutputError("输出中没有 JSON。")
+        if not self._done:
+            raise StructuredOutputError("JSON 不完整，输出可能被截断。")
+        try:
+            # strict=False：容忍字符串中未转义的换行等控制字符
+            value = json.loads(self.text(), strict=False)
+        except json.JSONDecodeError as e:
+            raise StructuredOutputError(f"JSON 解析失败: {e}") from e
+        if self.spec is not None:
+            validate_schema(value, self.spec.schema)
+        return value
+
+
+def parse_structured(text: str, spec: Optional[OutputSpec] = None) -> Any:
+    """一次性校验并解析完整文本（如非流式调用的结果）。"""
+    validator = IncrementalJSONValidator(spec)
+    validator.feed(text)
+    return validator.finish()
+
+
+# ---------------------------------------------------------------------------
+# Schema 校验（只支持本模块定义的 Schema 用到的子集）
+# ---------------------------------------------------------------------------
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def validate_schema(value: Any, schema: Dict[str, Any], path: str = "$"):
+    """校验 type、enum、required、properties、additionalProperties 与 items，不符合时抛出 StructuredOutputError。"""
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPE_CHECKS[t](value) for t in types):
+            raise StructuredOutputError(f"{path} 应为 {'/'.join(types)}，实际为 {type(value).__name__}。")
+    if "enum" in schema and value not in schema["enum"]:
+        raise StructuredOutputError(f"{path} 的取值 {value!r} 不在 {schema['enum']} 中。")
+    if isinstance(value, dict):
+        for key in schema.get("required", []):
+            if key not in value:
+                raise StructuredOutputError(f"{path} 缺少字段 '{key}'。")
+        properties = schema.get("properties", {})
+        extra = schema.get("additionalProperties")
+        for key, item in value.items():
+            if key in properties:
+                validate_schema(item, properties[key], f"{path}.{key}")
+            elif isinstance(extra, dict):
+                validate_schema(item, extra, f"{path}.{key}")
+    elif isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for index, item in enumerate(value):
+            validate_schema(item, schema["items"], f"{path}[{index}]")
+
+
+# ---------------------------------------------------------------------------
+# 调用
+# ---------------------------------------------------------------------------
+
+def _with_instruction(prompt: str, spec: OutputSpec) -> str:
+    """附加 JSON 输出说明；提示词的可缓存前缀保持不变。"""
+    if isinstance(prompt, PrefixedPrompt):
+        return PrefixedPrompt(prompt.cache_prefix, str(prompt)[len(prompt.cache_prefix):] + spec.instruction())
+    return prompt + spec.instruction()
+
+
+def invoke_structured(llm_adapter, prompt: str, spec: OutputSpec, max_attempts: int = 2,
+                      check_interrupted=None, log_func=None) -> Any:
+    """
+    以结构化输出模式调用 LLM，返回按 spec 校验后的对象。
+    流式接收时逐片校验语法，出错立即关闭该次请求（不再为剩余输出付费）并重新请求；
+    校验通过时照常读完整个流，使适配器记录用量与结束原因、写入响应缓存，并让连接正常归还连接池。
+    max_attempts 次均失败时抛出 StructuredOutputError。网络等调用错误按原有重试逻辑处理并向上抛出。
+    """
+    from novel_generator.common import invoke_stream_with_cleaning
+
+    previous_schema = getattr(llm_adapter, "response_schema", None)
+    previous_salvage = getattr(llm_adapter, "stream_salvage", None)
+    llm_adapter.response_schema = spec
+    # JSON 无法从断点可靠地续写
+    llm_adapter.stream_salvage = None
+    request_prompt = _with_instruction(prompt, spec)
+    last_error: Optional[StructuredOutputError] = None
+    try:
+        for attempt in range(1, max_attempts + 1):
+            validator = IncrementalJSONValidator(spec)
+            stream = invoke_stream_with_cleaning(llm_adapter, request_prompt, check_interrupted=check_interrupted,
+                                                 log_func=log_func, log_stream=False)
+            try:
+                # JSON 结束后的剩余分片（通常只有用量信息）由校验器忽略
+                for chunk in stream:
+                    validator.feed(chunk)
+                return validator.finish()
+            except StructuredOutputError as e:
+                last_error = e
+                # 无效结果若来自响应缓存，删除该条目，使下一次尝试重新请求服务端
+                llm_adapter.reject_cached_response()
+                message = f"  -> 结构化输出校验失败 ({attempt}/{max_attempts}): {e}"
+                logging.warning(message)
+                if log_func:
+                    log_func(message)
+            finally:
+                # 流已读完时为空操作；校验失败时提前关闭，中断该次请求
+                stream.close()
+    finally:
+        llm_adapter.response_schema = previous_schema
+        llm_adapter.stream_salvage = previous_salvage
+    raise last_error
+
+
+# ---------------------------------------------------------------------------
+# 各步骤的输出定义
+# ---------------------------------------------------------------------------
+
+_STRING = {"type": "string"}
+_STRING_MAP = {"type": "object", "additionalProperties": _STRING}
+
+
+def _entries_spec(name: str, description: str, content_field: str) -> OutputSpec:
+    return OutputSpec(name, description, {
+        "type": "object",
+        "properties": {
+            "伏笔": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"编号": _STRING, content_field: _STRING},
+                    "required": ["编号", content_field],
+                },
+            },
+        },
+        "required": ["伏笔"],
+    })
+
+
+FORESHADOWING_HISTORY_SPEC = _entries_spec(
+    "foreshadowing_history", "本章涉及的每个伏笔的历史内容，没有历史内容时填写“无历史内容”。", "历史内容")
+FORESHADOWING_CONTENT_SPEC = _entries_spec(
+    "foreshadowing_content", "本章涉及的每个伏笔在本章的最新进展。", "本章内容")
+FORESHADOWING_INTEGRATION_SPEC = _entries_spec(
+    "foreshadowing_integration", "整合历史内容与本章内容后的每个伏笔的最新描述。", "内容")
+FORESHADOWING_FUSED_SPEC = OutputSpec("foreshadowing_updates", "本章涉及的每个伏笔在本章的进展，以及整合历史内容后的最新描述。", {
+    "type": "object",
+    "properties": {
+        "伏笔": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"编号": _STRING, "本章内容": _STRING, "内容": _STRING},
+                "required": ["编号", "内容"],
+            },
+        },
+    },
+    "required": ["伏笔"],
+})
+
+# 与 json_utils._final_perfect_parser 解析出的角色结构一致，可直接写入角色状态存储
+CHARACTER_OBJECT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "ID": _STRING,
+        "名称": _STRING,
+        "基础信息": _STRING_MAP,
+        "位置轨迹": {"type": "array", "items": {
+            "type": "object", "properties": {"场景名称": _STRING}, "additionalProperties": _STRING,
+            "required": ["场景名称"]}},
+        "势力特征": {"type": "object", "additionalProperties": {"type": ["string", "object"]}},
+        "关键事件记录": {"type": "array", "items": {
+            "type": "object", "properties": {"章节": _STRING, "类型": _STRING, "摘要": _STRING},
+            "required": ["章节", "摘要"]}},
+        "生命状态": _STRING_MAP,
+        "持有物品": {"type": "array", "items": _STRING_MAP},
+        "技术能力": {"type": "array", "items": _STRING_MAP},
+        "关系网": {"type": "array", "items": {
+            "type": "object",
+            "properties": {"对象": _STRING, "关系": _STRING, "关系强度": _STRING, "互动频率": _STRING},
+            "required": ["对象", "关系"]}},
+        "行为模式/决策偏好": _STRING_MAP,
+        "语言风格/对话关键词": _STRING_MAP,
+        "情感线状态": _STRING_MAP,
+    },
+    "required": ["ID", "名称", "基础信息"],
+}
+
+CHARACTER_STATE_SPEC = OutputSpec("character_states", "每个被更新角色的完整状态，字段含义与角色状态格式中的同名字段一致。", {
+    "type": "object",
+    "properties": {"角色": {"type": "array", "items": CHARACTER_OBJECT_SCHEMA}},
+    "required": ["角色"],
+})
+
+CHARACTER_DRAFT_SPEC = OutputSpec("draft_characters", "本章使用的已有角色ID编号与需要新生成的角色。", {
+    "type": "object",
+    "properties": {
+        "角色ID编号": {"type": "array", "items": _STRING},
+        "新角色": {"type": "array", "items": {
+            "type": "object",
+            "properties": {
+                "角色名": _STRING,
+                "其他称谓": _STRING,
+                "角色权重": _STRING,
+                "籍贯/家乡": _STRING,
+                "所属势力": _STRING,
+                "身份定位": _STRING,
+                "外貌特征": _STRING,
+                "性格关键词": _STRING,
+                "基本简介": _STRING,
+            },
+            "required": ["角色名", "角色权重", "基本简介"],
+        }},
+    },
+    "required": ["角色ID编号", "新角色"],
+})
+
+# 剧情要点各模块及其条目，顺序与 plot_points_extraction_prompt 的输出格式一致
+PLOT_POINT_SECTIONS = (
+    ("环境锚点", ("主场景", "氛围特征", "时间坐标", "场景细节")),
+    ("冲突演进", ("主冲突", "次冲突", "潜冲突")),
+    ("状态变更", ("角色层", "物品层", "关系层", "情绪层")),
+    ("推进指标", ("时间跨度", "空间坐标", "矛盾烈度", "节奏倾向")),
+    ("章节结尾触发点", ("场景残留", "时间标记", "事件余波")),
+)
+
+PLOT_POINTS_SPEC = OutputSpec("plot_points", "本章剧情要点，按模块组织。", {
+    "type": "object",
+    "properties": {
+        section: {
+            "type": "object",
+            "properties": {field: _STRING for field in fields},
+            "required": list(fields),
+        }
+        for section, fields in PLOT_POINT_SECTIONS
+    },
+    "required": [section for section, _ in PLOT_POINT_SECTIONS],
+})
+
+
+def entries_to_dict(data: Dict[str, Any], content_field: str) -> Dict[str, str]:
+    """把伏笔条目列表转换为 {编号: 内容}。"""
+    result = {}
+    for entry in data.get("伏笔", []):
+        fb_id = entry.get("编号", "").strip()
+        content = entry.get(content_field, "").strip()
+        if fb_id and content:
+            result[fb_id] = content
+    return result
+
+
+def render_plot_points(data: Dict[str, Any], chap_num, chapter_title: str) -> str:
+    """按 plot_points_extraction_prompt 的文本格式渲染剧情要点，与文本模式写入的内容格式相同。"""
+    lines = [f"第{chap_num}章《{chapter_title}》剧情要点："]
+    for section, fields in PLOT_POINT_SECTIONS:
+        values = data.get(section) or {}
+        lines.append(f"【{section}】")
+        for field in fields:
+            lines.append(f"- {field}：{values.get(field, '')}")
+        lines.append("")
+    return "\n".join(lines).rstrip()
+
+
+def render_draft_characters(data: Dict[str, Any]) -> str:
+    """按 create_character_prompt 的返回格式渲染角色生成结果，写入 待用角色.txt。"""
+    lines = ["提取角色ID编号："]
+    lines.extend(data.get("角色ID编号", []))
+    lines.append("")
+    lines.append("新生成角色：")
+    for character in data.get("新角色", []):
+        lines.append("")
+        lines.append(f"{character.get('角色名', '')}：")
+        lines.append("基础信息：")
+        lines.append(f"- 其他称谓：{character.get('其他称谓', '无')}")
+        lines.append(f"- 角色权重：{character.get('角色权重', '')}")
+        lines.append("势力特征：")
+        lines.append("- 势力归属：")
+        lines.append(f"  籍贯/家乡：{character.get('籍贯/家乡', '')}")
+        lines.append(f"  所属势力：{character.get('所属势力', '')}")
+        lines.append(f"- 身份定位： {character.get('身份定位', '')}")
+        lines.append(f"- 外貌特征： {character.get('外貌特征', '')}")
+        lines.append(f"- 性格关键词： {character.get('性格关键词', '')}")
+        lines.append(f"基本简介：{character.get('基本简介', '')}")
+    return "\n".join(lines)
@@ -0,0 +1,306 @@
+# novel_generator/task_graph.py
+# -*- coding: utf-8 -*-
+"""
+小型任务依赖图。
+每个节点声明所依赖的节点，或声明读取（inputs）和产出（outputs）的产物，由产物推导出依赖；
+依赖全部成功后才会开始，相互独立的节点在有限的线程池中并发执行。
+节点可以声明资源类别（如 "llm"、"disk"），同一类别同时运行的节点数受 resource_limits 限制。
+依赖失败的节点不再执行，记为跳过。节点内部的重试与配置切换由节点函数自行负责
+（LLM 步骤通过 execute_with_polling 完成），图只负责调度和记录每个节点的耗时与结果。
+设置 stop_event 后不再启动新节点；正在运行的节点需自行响应同一事件（如作为 check_interrupted），
+run() 在所有已启动的节点结束后才返回，调度线程被中断时也是如此。
+指定 state_file 时，每个节点完成后都会写入该文件；再次运行同名节点时直接沿用，从而按节点粒度续跑。
+节点的返回值（需可序列化为 JSON）一并保存，沿用时恢复到 node.result，供下游节点读取。
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PENDING = "pending"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class TaskNode:
+    """
+    图中的一个节点：func 不接收参数，返回值记入 result，抛出异常即视为失败。
+    done_check 用于续跑：上次记录已完成、且 done_check() 仍为真（例如产物文件还在）时才沿用。
+    """
+    def __init__(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (),
+                 inputs: Iterable[str] = (), outputs: Iterable[str] = (), resource: Optional[str] = None,
+                 done_check: Optional[Callable[[], bool]] = None):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.resource = resource
+        self.done_check = done_check
+        self.status = PENDING
+        self.resumed = False
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def elapsed(self) -> Optional[float]:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+def load_graph_state(state_file: str) -> Dict[str, Any]:
+    """读取任务图的持久化状态，文件不存在或损坏时返回空状态。"""
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            state = json.load(f)
+        if isinstance(state, dict) and isinstance(state.get("已完成"), dict):
+            return state
+    except (OSError, ValueError):
+        pass
+    return {"已完成": {}}
+
+
+def clear_graph_state(state_file: str):
+    try:
+        os.remove(state_file)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logging.warning(f"删除任务状态文件失败: {e}")
+
+
+class TaskGraph:
+    """按依赖关系并发执行节点，最多同时运行 max_workers 个，各资源类别另受 resource_limits 限制。"""
+    def __init__(self, max_workers: int = 4, log_func: Optional[Callable[[str], None]] = None, name: str = "task",
+                 resource_limits: Optional[Dict[str, int]] = None, state_file: Optional[str] = None,
+                 resume: bool = True, fail_fast: bool = False, stop_event: Optional[threading.Event] = None):
+        self.max_workers = max(1, int(max_workers))
+        self.log_func = log_func
+        self.name = name
+        self.resource_limits = {key: max(1, int(value)) for key, value in (resource_limits or {}).items()}
+        self.state_file = state_file
+        self.resume = resume
+        self.fail_fast = fail_fast
+        # 可与调用方共享（例如引擎的强制停止信号），置位后不再启动新节点
+        self.stop_event = stop_event or threading.Event()
+        self.nodes: Dict[str, TaskNode] = {}
+        # 随状态一起保存的附加信息（例如每章的最后一个节点），供下次续跑时规划
+        self.meta: Dict[str, Any] = {}
+        self._completed: Dict[str, Any] = {}
+        self._order: List[str] = []
+
+    def add(self, name: str, func: Callable[[], Any], deps: Iterable[str] = (), inputs: Iterable[str] = (),
+            outputs: Iterable[str] = (), resource: Optional[str] = None,
+            done_check: Optional[Callable[[], bool]] = None) -> TaskNode:
+        if name in self.nodes:
+            raise ValueError(f"任务节点重复: {name}")
+        node = TaskNode(name, func, deps, inputs, outputs, resource, done_check)
+        self.nodes[name] = node
+        return node
+
+    def mark_done(self, name: str):
+        """把节点标记为已完成而不执行（例如用户指定从后面的步骤开始）。"""
+        node = self.nodes[name]
+        node.status = SUCCEEDED
+        node.resumed = True
+
+    def _log(self, message: str):
+        if self.log_func:
+            self.log_func(message)
+        else:
+            logging.info(message)
+
+    def _resolve_deps(self):
+        """由 inputs/outputs 推导依赖，并检查依赖是否存在且无环。"""
+        producers = {}
+        for node in self.nodes.values():
+            for artifact in node.outputs:
+                if artifact in producers:
+                    raise ValueError(f"产物 '{artifact}' 同时由 '{producers[artifact]}' 和 '{node.name}' 产出。")
+                producers[artifact] = node.name
+        for node in self.nodes.values():
+            for artifact in node.inputs:
+                # 没有节点产出的输入视为外部已有的文件
+                producer = producers.get(artifact)
+                if producer and producer != node.name and producer not in node.deps:
+                    node.deps.append(producer)
+
+        for node in self.nodes.values():
+            for dep in node.deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"任务节点 '{node.name}' 依赖的 '{dep}' 不存在。")
+        visiting, visited = set(), set()
+        self._order = []
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"任务依赖存在环: {name}")
+            visiting.add(name)
+            for dep in self.nodes[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            visited.add(name)
+            self._order.append(name)
+
+        for name in self.nodes:
+            visit(name)
+
+    def _descendants(self, name: str) -> List[str]:
+        result, stack = [], [name]
+        while stack:
+            current = stack.pop()
+            for node in self.nodes.values():
+                if current in node.deps and node.name not in result:
+                    result.append(node.name)
+                    stack.append(node.name)
+        return result
+
+    def _save_state(self):
+        if not self.state_file:
+            return
+        state = {"已完成": self._completed, **self.meta}
+        tmp_path = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_file)
+        except OSError as e:
+            logging.warning(f"保存任务状态失败: {e}")
+
+    def _restore_completed(self):
+        """沿用上次运行中已完成、且产物仍然有效的节点；依赖需要重新执行的节点不沿用。"""
+        if not self.state_file:
+            return
+        self._completed = load_graph_state(self.state_file)["已完成"] if self.resume else {}
+        for name in self._order:
+            node = self.nodes[name]
+            if node.status != PENDING or node.name not in self._completed:
+                continue
+            if any(self.nodes[dep].status != SUCCEEDED for dep in node.deps):
+                continue
+            try:
+                still_done = node.done_check() if node.done_check else True
+            except Exception:
+                still_done = False
+            if still_done:
+                node.status = SUCCEEDED
+                node.resumed = True
+                node.result = self.recorded_result(node.name)
+                self._log(f"  -> 沿用上次已完成的任务 '{node.name}'。")
+            else:
+                self._completed.pop(node.name, None)
+
+    def recorded_result(self, name: str) -> Any:
+        """上次运行中该节点完成时保存的返回值；没有记录时为 None。可在 done_check 中使用。"""
+        return self._completed.get(name, {}).get("结果")
+
+    def stop(self):
+        """请求停止：不再启动新节点，run() 等待正在运行的节点结束后返回。"""
+        self.stop_event.set()
+
+    def _run_node(self, node: TaskNode):
+        if self.stop_event.is_set():
+            # 已提交但尚未开始执行时收到停止请求
+            node.status = SKIPPED
+            return
+        node.started = time.monotonic()
+        try:
+            node.result = node.func()
+            node.status = SUCCEEDED
+        except BaseException as e:
+            node.error = e
+            node.status = FAILED
+        finally:
+            node.finished = time.monotonic()
+
+    def run(self) -> Dict[str, TaskNode]:
+        """执行全部节点直到完成，返回 {名称: 节点}。"""
+        self._resolve_deps()
+        self._restore_completed()
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        in_use: Dict[str, int] = {}
+        try:
+            running = {}
+            while True:
+                if self.stop_event.is_set():
+                    stopped = [node for node in self.nodes.values() if node.status == PENDING]
+                    for node in stopped:
+                        node.status = SKIPPED
+                    if stopped:
+                        self._log(f"  -> 已请求停止，取消其余 {len(stopped)} 个未开始的任务。")
+                # 按添加顺序检查，先添加的节点优先占用资源
+                for node in self.nodes.values():
+                    if node.status != PENDING:
+                        continue
+                    dep_states = [self.nodes[dep].status for dep in node.deps]
+                    if any(state in (FAILED, SKIPPED) for state in dep_states):
+                        node.status = SKIPPED
+                        self._log(f"  -> 跳过 '{node.name}'：依赖的任务未成功。")
+                    elif all(state == SUCCEEDED for state in dep_states):
+                        limit = self.resource_limits.get(node.resource)
+                        if limit is not None and in_use.get(node.resource, 0) >= limit:
+                            continue
+                        in_use[node.resource] = in_use.get(node.resource, 0) + 1
+                        node.status = RUNNING
+                        # 节点重新执行后，下游上次的完成记录随之失效
+                        stale = [name for name in [node.name, *self._descendants(node.name)] if name in self._completed]
+                        if stale:
+                            for name in stale:
+                                self._completed.pop(name, None)
+                            self._save_state()
+                        running[executor.submit(self._run_node, node)] = node
+                if not running:
+                    break
+                # 定时醒来检查停止请求；调度线程阻塞在无超时的等待中时也收不到注入的异常
+                done, _ = wait(list(running), timeout=0.5, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node = running.pop(future)
+                    in_use[node.resource] -= 1
+                    if node.status == SKIPPED:
+                        continue
+                    if node.status == FAILED:
+                        self._log(f"  -> '{node.name}' 失败（{node.elapsed:.1f} 秒）: {node.error}")
+                        if self.fail_fast:
+                            cancelled = [other for other in self.nodes.values() if other.status == PENDING]
+                            for other in cancelled:
+                                other.status = SKIPPED
+                            if cancelled:
+                                self._log(f"  -> 因任务失败，取消其余 {len(cancelled)} 个未开始的任务。")
+                    else:
+                        logging.info(f"任务 '{node.name}' 完成，耗时 {node.elapsed:.1f} 秒。")
+                        if self.state_file:
+                            record = {
+                                "完成时间": datetime.now().isoformat(timespec="seconds"),
+                                "耗时秒": round(node.elapsed, 1),
+                            }
+                            if node.result is not None:
+                                record["结果"] = node.result
+                            self._completed[node.name] = record
+                            self._save_state()
+        except BaseException:
+            # 调度线程被中断（如强制停止注入的 SystemExit）：通知节点停止，并在下面等待它们结束，
+            # 避免调用方认为已经停止后，仍有节点在后台调用 LLM 或写入文件
+            self.stop_event.set()
+            raise
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        wall = time.monotonic() - started
+        serial = sum(node.elapsed or 0.0 for node in self.nodes.values())
+        self._log(f"  -> 任务图执行完毕（共 {len(self.nodes)} 个任务），总耗时 {wall:.1f} 秒（各任务耗时合计 {serial:.1f} 秒）。")
+        return self.nodes
+
+    def failures(self) -> List[TaskNode]:
+        return [node for node in self.nodes.values() if node.status == FAILED]
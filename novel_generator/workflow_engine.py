@@ -6,6 +6,7 @@ import os
 import ctypes
 import re
 import glob
+from functools import partial
 from utils import read_file, save_string_to_txt
 # 移除对 generation_logic 的依赖
 # from novel_generator.generation_logic import (
@@ -20,14 +21,30 @@ from novel_generator.chapter_blueprint import Chapter_blueprint_generate, analyz
 from novel_generator.consistency_checker import do_consistency_check as cc_do_consistency_check
 from novel_generator.rewrite import rewrite_chapter
 # from novel_generator.generation_logic import generate_chapter_draft_logic # 不再需要
-from novel_generator.character_generator import generate_characters_for_draft
+from novel_generator.character_generator import (
+    assemble_draft_characters, generate_characters_for_draft, read_character_index, select_draft_characters,
+)
+from novel_generator.chapter_prefetch import (
+    ChapterPrefetch, extract_foreshadowing_ids, lookup_chapter_blueprints, prefetch_log_func,
+    retrieve_foreshadowing_context, store_signature,
+)
 from novel_generator.json_utils import load_store # Replace vectorstore with json_utils
 from novel_generator.volume import extract_volume_outline, find_volume_for_chapter
 from prompt_definitions import chapter_draft_prompt, Chapter_Review_prompt
 from llm_adapters import BaseLLMAdapter
 from .common import execute_with_polling, SingleProviderExecutionError
+from .task_graph import TaskGraph, clear_graph_state, load_graph_state
+from .prompt_prefix import build_prefixed_prompt
 from config_manager import get_project_continue_state, save_project_continue_state, clear_project_continue_state
 
+# 工作流任务图的节点完成记录，用于按节点续跑
+WORKFLOW_STATE_FILE = "工作流节点状态.json"
+
+
+class WorkflowStepError(Exception):
+    """工作流节点失败（原因已写入日志），任务图据此中止后续节点。"""
+
+
 class WorkflowEngine:
     """
     小说生成引擎核心。
@@ -42,8 +59,12 @@ class WorkflowEngine:
         self.finish_callback = finish_callback
         
         self._is_running = False
+        self._stop_event = threading.Event() # 强制停止信号，由任务图和各 LLM 调用的 check_interrupted 共享
         self.thread: threading.Thread | None = None
         self.active_llm_adapter: BaseLLMAdapter | None = None
+        self.concurrent_adapters: dict[str, BaseLLMAdapter] = {} # 并发子步骤各自使用的适配器
+        self._adapter_lock = threading.Lock()
+        self._prefetch: ChapterPrefetch | None = None # 流水线模式下提前准备的下一章输入
         self.rewrite_counts = {} # 用于跟踪每个章节的改写次数
         self.step_display_map = {
             "generate_volume": "生成分卷",
@@ -54,16 +75,69 @@ class WorkflowEngine:
         }
 
     def set_active_adapter(self, adapter):
-        """回调函数，用于设置当前活动的LLM适配器。"""
+        """回调函数，用于设置当前活动的LLM适配器。工作流节点并发执行时另按线程记录，强制停止时全部关闭。"""
         self.active_llm_adapter = adapter
+        self._adapter_slot(threading.current_thread().name)(adapter)
+
+    def _adapter_slot(self, slot):
+        """返回并发子步骤使用的适配器回调，按槽位记录，以便强制停止时全部关闭。"""
+        def callback(adapter):
+            with self._adapter_lock:
+                if adapter is None:
+                    self.concurrent_adapters.pop(slot, None)
+                else:
+                    self.concurrent_adapters[slot] = adapter
+        return callback
+
+    def _release_adapter_slots(self, slots):
+        with self._adapter_lock:
+            for slot in slots:
+                self.concurrent_adapters.pop(slot, None)
+
+    def _close_concurrent_adapters(self):
+        """取消各槽位上仍在进行的调用：共享连接池中的客户端不会随 close() 关闭，需用 cancel() 中断当前响应。"""
+        with self._adapter_lock:
+            adapters = list(self.concurrent_adapters.values())
+            self.concurrent_adapters.clear()
+        for adapter in adapters:
+            try:
+                adapter.cancel()
+            except Exception as close_e:
+                self._log(f"⚠️ 关闭LLM连接时出错: {close_e}")
+
+    def _general_setting(self, key, default):
+        """读取轮询设置中 设置 下的引擎选项。"""
+        from llm_adapters import PollingManager
+        return PollingManager().settings.get("设置", {}).get(key, default)
+
+    def _int_setting(self, key, default):
+        """读取正整数类型的引擎选项，无效时使用默认值。"""
+        try:
+            return max(1, int(self._general_setting(key, default)))
+        except (TypeError, ValueError):
+            return default
+
+    def _finalize_concurrency(self):
+        """定稿子步骤的最大并发数，取自轮询设置 设置.定稿并发数（默认 4，设为 1 即恢复串行）。"""
+        return self._int_setting("定稿并发数", 4)
 
     def is_running(self):
         return self._is_running
 
+    def _stop_requested(self):
+        return self._stop_event.is_set()
+
+    def _raise_if_stopped(self, what):
+        """写入文件前检查停止信号，避免强制停止后仍有工作线程改写项目文件。"""
+        if self._stop_event.is_set():
+            raise InterruptedError(f"已请求停止，放弃{what}。")
+
     def force_stop(self):
         """
         强制终止工作流线程。
-        这是一种激进的方法，通过向线程注入一个异常来立即停止它。
+        先置位停止信号（任务图不再启动新节点，各 LLM 调用的 check_interrupted 随之返回真），
+        再向引擎线程注入异常，最后取消所有仍在进行的 LLM 调用。
+        任务图的工作线程由 _main_loop 等待结束后才会通知界面。
         """
         if not self.thread or not self.thread.is_alive():
             self._log("引擎线程未运行，无需停止。")
@@ -75,6 +149,7 @@ class WorkflowEngine:
             return
 
         self._log("正在发送强制停止信号...")
+        self._stop_event.set()
         try:
             # 向指定线程ID注入SystemExit异常
             res = ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id), ctypes.py_object(SystemExit))
@@ -93,9 +168,10 @@ class WorkflowEngine:
             if self.active_llm_adapter:
                 self._log("正在尝试关闭活动的LLM连接...")
                 try:
-                    self.active_llm_adapter.close()
+                    self.active_llm_adapter.cancel()
                 except Exception as close_e:
                     self._log(f"⚠️ 关闭LLM连接时出错: {close_e}")
+            self._close_concurrent_adapters()
 
     def _log(self, message, stream=False, replace_last_line=False):
         """安全地记录日志到UI"""
@@ -114,6 +190,7 @@ class WorkflowEngine:
             return
 
         self._is_running = True
+        self._stop_event.clear()
         
         self.gui_app.master.after(0, self.start_callback)
         self._log("工作流引擎启动...")
@@ -129,21 +206,12 @@ class WorkflowEngine:
     def _main_loop(self, workflow_params, workflow_steps):
         """引擎的主工作循环"""
         self.rewrite_counts = {} # 每次运行工作流时重置计数器
+        self._prefetch = None
         
         try:
             # 从 workflow_params 获取所有需要的参数
             num_chapters_to_generate = workflow_params.get("num_chapters_to_generate", 1)
-            volume_char_weight = workflow_params.get("volume_char_weight", 91)
-            blueprint_num_chapters = workflow_params.get("blueprint_num_chapters", 20)
             start_chapter_override = workflow_params.get("start_chapter")
-            
-            # 新增参数
-            review_pass_finalize = workflow_params.get("review_pass_finalize", False)
-            rewrite_then_review = workflow_params.get("rewrite_then_review", False)
-            word_count_min = workflow_params.get("word_count_min", 2500)
-            word_count_max = workflow_params.get("word_count_max", 3500)
-            force_finalize_after_rewrite = workflow_params.get("force_finalize_after_rewrite", False)
-            force_finalize_count = workflow_params.get("force_finalize_count", 3)
             continue_from_last_run = workflow_params.get("continue_from_last_run", False)
 
             project_path = workflow_params.get("project_path")
@@ -157,7 +225,6 @@ class WorkflowEngine:
             total_chapters = workflow_params.get("num_chapters_total", 0)
             
             # --- 重构后的启动逻辑 (需求 3 & 4) ---
-            auto_history_chapters = workflow_params.get("auto_history_chapters", 2)
             start_chapter_param = workflow_params.get("start_chapter")
             start_step_param = workflow_params.get("start_step")
             force_regenerate_draft_from_ui = workflow_params.get("force_regenerate_draft", False)
@@ -165,7 +232,6 @@ class WorkflowEngine:
             chap_num = 1
             start_step_index = 0
             force_regenerate = False
-            generated_count = 0
 
             # 模式判断
             if start_chapter_param is not None:
@@ -204,177 +270,37 @@ class WorkflowEngine:
                 self._log(f"  -> 分析完成，将从第 {chap_num} 章开始。")
                 self._update_status(f"分析完成，将从第 {chap_num} 章开始处理。")
 
-            time.sleep(2)
+            # 自动模式下，上次运行中途停止的章节按节点续跑
+            if start_chapter_param is None:
+                unfinished = self._first_unfinished_chapter(project_path)
+                if unfinished is not None and unfinished < chap_num:
+                    self._log(f"  -> 上次运行的第 {unfinished} 章尚有未完成的步骤，将从该章继续。")
+                    chap_num = unfinished
 
-            while True:
+            time.sleep(2)
 
-                if chap_num > total_chapters:
+            last_chap = min(total_chapters, chap_num + num_chapters_to_generate - 1)
+            workflow_failed = False
+            if chap_num <= last_chap:
+                graph = self._build_workflow_graph(
+                    project_path, chap_num, last_chap, workflow_params, workflow_steps,
+                    start_step_index, force_regenerate, resume=start_chapter_param is None
+                )
+                graph.run()
+                if self._stop_requested():
+                    # 注入的异常可能落在工作线程已结束、调度线程即将返回的间隙而未生效，按强制停止处理
+                    raise SystemExit
+                workflow_failed = bool(graph.failures())
+
+            if workflow_failed:
+                self._log("  -> 因步骤失败，工作流已中止。")
+            else:
+                if last_chap >= total_chapters:
                     self._log(f"已达到项目设定的总章节数 ({total_chapters})，工作流完成。")
-                    break
-                
-                if generated_count >= num_chapters_to_generate:
+                else:
                     self._log(f"已完成本次设定的生成任务 ({num_chapters_to_generate}章)。")
-                    break
-
-                self._log("\n" + "-"*20 + f" 开始处理第 {chap_num} 章 " + "-"*20)
-                self._update_status(f"准备处理第 {chap_num} 章...")
+                clear_graph_state(os.path.join(project_path, WORKFLOW_STATE_FILE))
 
-                # --- 新增逻辑：同步UI编辑框内容 ---
-                # 仅在工作流从用户指定的章节启动时，才检查UI编辑框
-                start_chapter_param = workflow_params.get("start_chapter")
-                if start_chapter_param is not None and start_chapter_param == chap_num:
-                    self._log(f"  -> 正在检查主界面编辑框内容（目标章节: {chap_num}）...")
-                    try:
-                        # 从 self.gui_app 访问主编辑框 chapter_result
-                        ui_text = self.gui_app.chapter_result.get("1.0", "end-1c").strip()
-                        if ui_text:
-                            draft_path, title = self._get_draft_path(project_path, chap_num)
-                            os.makedirs(os.path.dirname(draft_path), exist_ok=True)
-                            
-                            # 从UI获取的纯文本不包含标题，需要从文件或蓝图获取标题并组合
-                            # _get_draft_path 已经返回了标题
-                            full_content = f"第{chap_num}章 {title}\n\n{ui_text}"
-                            
-                            existing_content = ""
-                            if os.path.exists(draft_path):
-                                existing_content = read_file(draft_path)
-                            
-                            # 只有当内容不同时才保存，避免不必要的文件写入
-                            if full_content.strip() != existing_content.strip():
-                                self._log(f"  -> 检测到编辑框有已修改内容，将覆盖保存文件: {os.path.basename(draft_path)}")
-                                save_string_to_txt(full_content, draft_path)
-                            else:
-                                self._log("  -> 编辑框内容与文件一致，无需保存。")
-                        else:
-                            self._log("  -> 主界面编辑框为空，将使用文件内容。")
-                    except Exception as e:
-                        self._log(f"  -> ⚠️ 检查UI编辑框时出错: {e}")
-                # --- 同步逻辑结束 ---
-
-                # 2. 检查并生成大纲和目录
-                blueprints_ok = True
-                if "generate_volume" in workflow_steps or "generate_blueprint" in workflow_steps:
-                    try:
-                        self._ensure_blueprints_exist(
-                            project_path, chap_num,
-                            "generate_volume" in workflow_steps, "generate_blueprint" in workflow_steps,
-                            volume_char_weight, blueprint_num_chapters, workflow_params
-                        )
-                        # --- 新增检查：确认蓝图是否真的已生成 ---
-                        directory_content_after = read_file(os.path.join(project_path, "章节目录.txt"))
-                        chapter_info_after = get_chapter_info_from_blueprint(directory_content_after, chap_num)
-                        if not chapter_info_after:
-                            self._log(f"❌ 验证失败：第 {chap_num} 章的蓝图未能成功生成。")
-                            blueprints_ok = False
-                            
-                    except Exception as e:
-                        self._log(f"❌ 准备大纲或目录时出错: {e}，跳过此章节。")
-                        logging.error(f"准备蓝图时出错: {e}", exc_info=True)
-                        blueprints_ok = False
-                
-                if not blueprints_ok:
-                    self._log(f"  -> 因蓝图准备失败，中止工作流。")
-                    break # 中止整个工作流
-
-                # 3. 检查草稿是否存在，如果不存在则生成
-                draft_path, title = self._ensure_draft_exists(project_path, chap_num, workflow_params, auto_history_chapters, force_regenerate=force_regenerate)
-                if force_regenerate:
-                    force_regenerate = False
-                if not draft_path:
-                    self._log(f"无法为第 {chap_num} 章生成草稿，中止工作流。")
-                    break # 中止整个工作流
-                
-                # 4. 按顺序执行工作流步骤 (使用动态列表)
-                current_steps = list(workflow_steps) # 创建副本以便动态修改
-                step_index = start_step_index # 从计算出的起始步骤开始
-                start_step_index = 0 # 重置，确保下一章从头开始
-                any_step_failed = False
-
-                while step_index < len(current_steps):
-                    step = current_steps[step_index]
-                    
-                    # --- 关键修复：在步骤开始前就保存当前状态 ---
-                    display_step_name = self.step_display_map.get(step, step)
-                    save_project_continue_state(project_path, chap_num, step)
-                    self._log(f"\n--- 步骤: {display_step_name} (状态已保存) ---")
-                    
-                    success = False
-                    result_data = None # 用于从步骤函数接收返回数据
-
-                    try:
-                        if step in ["generate_volume", "generate_blueprint"]:
-                            success = True
-                            display_step_name = self.step_display_map.get(step, step)
-                            self._log(f"步骤 '{display_step_name}' 已在蓝图准备阶段完成。")
-                        elif step == "consistency_check":
-                            success, review_decision = self._run_consistency_check(project_path, chap_num, title, workflow_params, word_count_min, word_count_max)
-                            if success and review_pass_finalize:
-                                if review_decision == "通过":
-                                    self._log("✅ 审校判定为“通过”，且已启用“审校通过直接定稿”，将跳过改写并直接进入定稿。")
-                                    # 从当前步骤之后，移除所有 'rewrite' 和 'consistency_check'
-                                    remaining_steps = current_steps[step_index + 1:]
-                                    new_remaining = [s for s in remaining_steps if s not in ['rewrite', 'consistency_check']]
-                                    
-                                    # 确保 'finalize' 在流程中
-                                    if 'finalize' not in new_remaining:
-                                        new_remaining.append('finalize')
-                                        
-                                    current_steps = current_steps[:step_index + 1] + new_remaining
-                                else: # 审校未通过
-                                    self._log("ℹ️ 审校未通过，将安排再次改写。")
-                                    # 检查后续步骤中是否已有“改写”，如果没有，则插入一个
-                                    # 这确保了在“改写后重新审校”的循环中，失败后能再次改写
-                                    if "rewrite" not in current_steps[step_index + 1:]:
-                                        current_steps.insert(step_index + 1, "rewrite")
-                        elif step == "rewrite":
-                            success = self._run_rewrite(project_path, chap_num, title, workflow_params, word_count_min, word_count_max)
-                            if success:
-                                # 成功改写后，更新计数器
-                                self.rewrite_counts[chap_num] = self.rewrite_counts.get(chap_num, 0) + 1
-                                self._log(f"  -> 第 {chap_num} 章已成功改写 {self.rewrite_counts[chap_num]} 次。")
-
-                                # 检查是否达到强制定稿条件
-                                if force_finalize_after_rewrite and self.rewrite_counts[chap_num] >= force_finalize_count:
-                                    self._log(f"ℹ️ 已达到 {force_finalize_count} 次改写上限，将跳过后续审校，直接定稿。")
-                                    # 从当前步骤之后，移除所有 'rewrite' 和 'consistency_check'
-                                    remaining_steps = current_steps[step_index + 1:]
-                                    new_remaining = [s for s in remaining_steps if s not in ['rewrite', 'consistency_check']]
-                                    current_steps = current_steps[:step_index + 1] + new_remaining
-                                elif rewrite_then_review:
-                                    self._log("ℹ️ 已启用“改写完成后重新审校”，将在下一步重新执行一致性检查。")
-                                    current_steps.insert(step_index + 1, "consistency_check")
-                        elif step == "finalize":
-                            success = self._run_finalize(project_path, chap_num, title, workflow_params)
-                        
-                        if not success:
-                            display_step_name = self.step_display_map.get(step, step)
-                            self._log(f"❌ 第 {chap_num} 章在步骤 '{display_step_name}' 中失败，中止工作流。")
-                            # 失败时，状态已在步骤开始前保存，无需额外操作
-                            any_step_failed = True
-                            break
-                        else:
-                            display_step_name = self.step_display_map.get(step, step)
-                            self._log(f"✅ 步骤 '{display_step_name}' 完成。")
-                            # --- 状态保存逻辑已移至步骤开始前 ---
-
-                    except Exception as e:
-                        self._log(f"❌ 在执行步骤 '{step}' 时发生意外错误: {e}", level="error")
-                        logging.error(f"执行步骤 '{step}' 时出错:", exc_info=True)
-                        any_step_failed = True
-                        break
-                    
-                    step_index += 1 # 移动到下一个步骤
-                
-                if any_step_failed:
-                    self._log("  -> 因步骤失败，工作流已中止。")
-                    break
-                
-                # 暂停一下，给UI和其他线程响应时间
-                time.sleep(1)
-                
-                generated_count += 1
-                chap_num += 1 # 处理完当前章节后，移至下一章
-            
             self._log("所有章节处理完毕。")
             self._update_status("工作流完成。")
             # 正常完成后，清除继续状态
@@ -394,15 +320,272 @@ class WorkflowEngine:
             if self.active_llm_adapter:
                 self._log("工作流结束，正在关闭活动的LLM连接...")
                 try:
-                    self.active_llm_adapter.close()
+                    self.active_llm_adapter.cancel()
                 except Exception as close_e:
                     self._log(f"⚠️ 关闭LLM连接时出错: {close_e}")
                 self.active_llm_adapter = None # 清理活动的适配器
+            self._close_concurrent_adapters()
             
             self.gui_app.master.after(0, self.finish_callback)
             # 如果不是用户请求停止（例如，发生错误），也保留状态
             self._log("引擎已停止。")
 
+    def _first_unfinished_chapter(self, project_path):
+        """上次运行记录的章节中，第一个最后一步尚未完成的章节；没有记录时返回 None。"""
+        state = load_graph_state(os.path.join(project_path, WORKFLOW_STATE_FILE))
+        chapter_tails = state.get("章节末节点", {})
+        for chap, tail in sorted(chapter_tails.items(), key=lambda item: int(item[0])):
+            if tail not in state["已完成"]:
+                return int(chap)
+        return None
+
+    def _build_workflow_graph(self, project_path, first_chap, last_chap, workflow_params, workflow_steps, start_step_index, force_regenerate, resume):
+        """
+        把本次要处理的章节展开为任务图，每个节点声明读取和产出的产物以及资源类别：
+        - 第N章:分卷（llm）：仅在该章所属分卷的大纲尚不存在时加入；生成时读取角色数据库，须等上一章完成；
+        - 第N章:目录（llm）：只依赖上一章的目录，可以在前面章节写作的同时提前生成；
+        - 第N章:同步编辑框（disk）：仅用户指定的起始章节；
+        - 第N章:草稿 → 第N章:审校（一致性审校与改写）→ 第N章:定稿（llm）：草稿依赖上一章的最后一步。
+        并发上限取自 设置.工作流并发数 / LLM并发数 / 磁盘并发数；节点完成情况写入项目目录下的 工作流节点状态.json。
+        """
+        generate_volume = "generate_volume" in workflow_steps
+        generate_blueprint = "generate_blueprint" in workflow_steps
+        can_finalize = "finalize" in workflow_steps or (
+            workflow_params.get("review_pass_finalize", False) and "consistency_check" in workflow_steps
+        )
+        start_chapter_param = workflow_params.get("start_chapter")
+        volume_ranges = analyze_volume_range(project_path) if generate_volume else []
+        known_volumes = {v['volume'] for v in volume_ranges}
+
+        graph = TaskGraph(
+            max_workers=self._int_setting("工作流并发数", 3), log_func=self._log, name="workflow",
+            resource_limits={"llm": self._int_setting("LLM并发数", 2), "disk": self._int_setting("磁盘并发数", 1)},
+            state_file=os.path.join(project_path, WORKFLOW_STATE_FILE), resume=resume, fail_fast=True,
+            stop_event=self._stop_event,
+        )
+        chapter_tails = {}
+        previous_tail = None # 上一章最后一步的产物
+        for chap_num in range(first_chap, last_chap + 1):
+            steps = workflow_steps[start_step_index:] if chap_num == first_chap else workflow_steps
+            draft_inputs = [previous_tail] if previous_tail else []
+
+            if generate_volume or generate_blueprint:
+                blueprint_inputs = [f"目录:{chap_num - 1}"] if chap_num > first_chap else []
+                target_volume, _ = find_current_volume(chap_num, volume_ranges)
+                if generate_volume and target_volume not in known_volumes:
+                    graph.add(f"第{chap_num}章:分卷", partial(self._volume_node, project_path, chap_num, workflow_params),
+                              inputs=list(draft_inputs), outputs=[f"分卷:{chap_num}"], resource="llm")
+                    blueprint_inputs.append(f"分卷:{chap_num}")
+                graph.add(f"第{chap_num}章:目录", partial(self._blueprint_node, project_path, chap_num, generate_blueprint, workflow_params),
+                          inputs=blueprint_inputs, outputs=[f"目录:{chap_num}"], resource="llm")
+                draft_inputs.append(f"目录:{chap_num}")
+
+            if start_chapter_param is not None and start_chapter_param == chap_num:
+                graph.add(f"第{chap_num}章:同步编辑框", partial(self._sync_editor_node, project_path, chap_num),
+                          outputs=[f"编辑框:{chap_num}"], resource="disk")
+                draft_inputs.append(f"编辑框:{chap_num}")
+
+            graph.add(f"第{chap_num}章:草稿",
+                      partial(self._draft_node, project_path, chap_num, workflow_params, force_regenerate and chap_num == first_chap),
+                      inputs=draft_inputs, outputs=[f"草稿:{chap_num}"], resource="llm",
+                      done_check=partial(self._draft_exists, project_path, chap_num))
+            review_name = f"第{chap_num}章:审校"
+            # 审校结论（是否定稿）作为节点结果保存；旧的状态文件中没有结论时重新审校，避免续跑时漏掉定稿
+            review = graph.add(review_name, partial(self._review_node, project_path, chap_num, steps, workflow_params),
+                               inputs=[f"草稿:{chap_num}"], outputs=[f"审校:{chap_num}"], resource="llm",
+                               done_check=partial(self._review_recorded, graph, review_name))
+            tail = f"审校:{chap_num}"
+            chapter_tails[str(chap_num)] = f"第{chap_num}章:审校"
+            if can_finalize:
+                graph.add(f"第{chap_num}章:定稿", partial(self._finalize_node, project_path, chap_num, workflow_params, review, last_chap),
+                          inputs=[tail], outputs=[f"定稿:{chap_num}"], resource="llm")
+                tail = f"定稿:{chap_num}"
+                chapter_tails[str(chap_num)] = f"第{chap_num}章:定稿"
+            previous_tail = tail
+
+        graph.meta["章节末节点"] = chapter_tails
+        return graph
+
+    def _volume_node(self, project_path, chap_num, workflow_params):
+        try:
+            self._ensure_blueprints_exist(
+                project_path, chap_num, True, False,
+                workflow_params.get("volume_char_weight", 91), workflow_params.get("blueprint_num_chapters", 20), workflow_params
+            )
+        except Exception as e:
+            self._log(f"❌ 准备分卷大纲时出错: {e}，中止工作流。")
+            logging.error(f"准备分卷大纲时出错: {e}", exc_info=True)
+            raise WorkflowStepError(f"第 {chap_num} 章的分卷大纲准备失败") from e
+
+    def _blueprint_node(self, project_path, chap_num, generate_blueprint, workflow_params):
+        try:
+            self._ensure_blueprints_exist(
+                project_path, chap_num, False, generate_blueprint,
+                workflow_params.get("volume_char_weight", 91), workflow_params.get("blueprint_num_chapters", 20), workflow_params
+            )
+        except Exception as e:
+            self._log(f"❌ 准备大纲或目录时出错: {e}，中止工作流。")
+            logging.error(f"准备蓝图时出错: {e}", exc_info=True)
+            raise WorkflowStepError(f"第 {chap_num} 章的蓝图准备失败") from e
+        # --- 新增检查：确认蓝图是否真的已生成 ---
+        directory_content_after = read_file(os.path.join(project_path, "章节目录.txt"))
+        if not get_chapter_info_from_blueprint(directory_content_after, chap_num):
+            self._log(f"❌ 验证失败：第 {chap_num} 章的蓝图未能成功生成。")
+            self._log(f"  -> 因蓝图准备失败，中止工作流。")
+            raise WorkflowStepError(f"第 {chap_num} 章的蓝图未能成功生成")
+
+    def _sync_editor_node(self, project_path, chap_num):
+        """工作流从用户指定的章节启动时，把主界面编辑框中修改过的内容写回草稿文件。"""
+        self._log(f"  -> 正在检查主界面编辑框内容（目标章节: {chap_num}）...")
+        try:
+            # 从 self.gui_app 访问主编辑框 chapter_result
+            ui_text = self.gui_app.chapter_result.get("1.0", "end-1c").strip()
+            if ui_text:
+                draft_path, title = self._get_draft_path(project_path, chap_num)
+                os.makedirs(os.path.dirname(draft_path), exist_ok=True)
+                
+                # 从UI获取的纯文本不包含标题，需要从文件或蓝图获取标题并组合
+                # _get_draft_path 已经返回了标题
+                full_content = f"第{chap_num}章 {title}\n\n{ui_text}"
+                
+                existing_content = ""
+                if os.path.exists(draft_path):
+                    existing_content = read_file(draft_path)
+                
+                # 只有当内容不同时才保存，避免不必要的文件写入
+                if full_content.strip() != existing_content.strip():
+                    self._log(f"  -> 检测到编辑框有已修改内容，将覆盖保存文件: {os.path.basename(draft_path)}")
+                    save_string_to_txt(full_content, draft_path)
+                else:
+                    self._log("  -> 编辑框内容与文件一致，无需保存。")
+            else:
+                self._log("  -> 主界面编辑框为空，将使用文件内容。")
+        except Exception as e:
+            self._log(f"  -> ⚠️ 检查UI编辑框时出错: {e}")
+
+    def _draft_exists(self, project_path, chap_num):
+        draft_path, _ = self._get_draft_path(project_path, chap_num)
+        return os.path.exists(draft_path)
+
+    def _draft_node(self, project_path, chap_num, workflow_params, force_regenerate):
+        self._log("\n" + "-"*20 + f" 开始处理第 {chap_num} 章 " + "-"*20)
+        self._update_status(f"准备处理第 {chap_num} 章...")
+        # 检查草稿是否存在，如果不存在则生成
+        draft_path, _ = self._ensure_draft_exists(
+            project_path, chap_num, workflow_params, workflow_params.get("auto_history_chapters", 2), force_regenerate=force_regenerate
+        )
+        if not draft_path:
+            self._log(f"无法为第 {chap_num} 章生成草稿，中止工作流。")
+            raise WorkflowStepError(f"第 {chap_num} 章草稿生成失败")
+
+    def _review_recorded(self, graph, name):
+        return isinstance(graph.recorded_result(name), dict)
+
+    def _review_node(self, project_path, chap_num, steps, workflow_params):
+        """
+        按顺序执行一致性审校与改写（使用动态列表），审校结论可能追加改写、审校或定稿。
+        返回 {"定稿": 是否需要定稿}，由任务图保存，续跑时定稿节点据此决定是否执行。
+        """
+        review_pass_finalize = workflow_params.get("review_pass_finalize", False)
+        rewrite_then_review = workflow_params.get("rewrite_then_review", False)
+        word_count_min = workflow_params.get("word_count_min", 2500)
+        word_count_max = workflow_params.get("word_count_max", 3500)
+        force_finalize_after_rewrite = workflow_params.get("force_finalize_after_rewrite", False)
+        force_finalize_count = workflow_params.get("force_finalize_count", 3)
+        _, title = self._get_draft_path(project_path, chap_num)
+
+        # 分卷与目录已由各自的节点完成，定稿由定稿节点执行
+        current_steps = [step for step in steps if step not in ("generate_volume", "generate_blueprint")]
+        step_index = 0
+        while step_index < len(current_steps):
+            step = current_steps[step_index]
+            if step == "finalize":
+                step_index += 1
+                continue
+
+            # --- 关键修复：在步骤开始前就保存当前状态 ---
+            display_step_name = self.step_display_map.get(step, step)
+            save_project_continue_state(project_path, chap_num, step)
+            self._log(f"\n--- 步骤: {display_step_name} (状态已保存) ---")
+
+            success = False
+            try:
+                if step == "consistency_check":
+                    success, review_decision = self._run_consistency_check(project_path, chap_num, title, workflow_params, word_count_min, word_count_max)
+                    if success and review_pass_finalize:
+                        if review_decision == "通过":
+                            self._log("✅ 审校判定为“通过”，且已启用“审校通过直接定稿”，将跳过改写并直接进入定稿。")
+                            # 从当前步骤之后，移除所有 'rewrite' 和 'consistency_check'
+                            remaining_steps = current_steps[step_index + 1:]
+                            new_remaining = [s for s in remaining_steps if s not in ['rewrite', 'consistency_check']]
+
+                            # 确保 'finalize' 在流程中
+                            if 'finalize' not in new_remaining:
+                                new_remaining.append('finalize')
+
+                            current_steps = current_steps[:step_index + 1] + new_remaining
+                        else: # 审校未通过
+                            self._log("ℹ️ 审校未通过，将安排再次改写。")
+                            # 检查后续步骤中是否已有“改写”，如果没有，则插入一个
+                            # 这确保了在“改写后重新审校”的循环中，失败后能再次改写
+                            if "rewrite" not in current_steps[step_index + 1:]:
+                                current_steps.insert(step_index + 1, "rewrite")
+                elif step == "rewrite":
+                    success = self._run_rewrite(project_path, chap_num, title, workflow_params, word_count_min, word_count_max)
+                    if success:
+                        # 成功改写后，更新计数器
+                        self.rewrite_counts[chap_num] = self.rewrite_counts.get(chap_num, 0) + 1
+                        self._log(f"  -> 第 {chap_num} 章已成功改写 {self.rewrite_counts[chap_num]} 次。")
+
+                        # 检查是否达到强制定稿条件
+                        if force_finalize_after_rewrite and self.rewrite_counts[chap_num] >= force_finalize_count:
+                            self._log(f"ℹ️ 已达到 {force_finalize_count} 次改写上限，将跳过后续审校，直接定稿。")
+                            # 从当前步骤之后，移除所有 'rewrite' 和 'consistency_check'
+                            remaining_steps = current_steps[step_index + 1:]
+                            new_remaining = [s for s in remaining_steps if s not in ['rewrite', 'consistency_check']]
+                            current_steps = current_steps[:step_index + 1] + new_remaining
+                        elif rewrite_then_review:
+                            self._log("ℹ️ 已启用“改写完成后重新审校”，将在下一步重新执行一致性检查。")
+                            current_steps.insert(step_index + 1, "consistency_check")
+            except Exception as e:
+                self._log(f"❌ 在执行步骤 '{step}' 时发生意外错误: {e}")
+                logging.error(f"执行步骤 '{step}' 时出错:", exc_info=True)
+                raise WorkflowStepError(f"第 {chap_num} 章在步骤 '{display_step_name}' 中出错") from e
+
+            if not success:
+                self._log(f"❌ 第 {chap_num} 章在步骤 '{display_step_name}' 中失败，中止工作流。")
+                # 失败时，状态已在步骤开始前保存，无需额外操作
+                raise WorkflowStepError(f"第 {chap_num} 章在步骤 '{display_step_name}' 中失败")
+            self._log(f"✅ 步骤 '{display_step_name}' 完成。")
+            step_index += 1 # 移动到下一个步骤
+
+        return {"定稿": "finalize" in current_steps}
+
+    def _finalize_node(self, project_path, chap_num, workflow_params, review, last_chap):
+        if not (review.result or {}).get("定稿"):
+            return
+        display_step_name = self.step_display_map["finalize"]
+        save_project_continue_state(project_path, chap_num, "finalize")
+        self._log(f"\n--- 步骤: {display_step_name} (状态已保存) ---")
+
+        # 流水线模式：定稿期间提前准备下一章不依赖定稿结果的输入
+        if (self._general_setting("预取下一章", False)
+                and chap_num < last_chap
+                and (self._prefetch is None or self._prefetch.chap_num != chap_num + 1)):
+            self._prefetch = self._start_prefetch(project_path, chap_num + 1, workflow_params)
+
+        _, title = self._get_draft_path(project_path, chap_num)
+        try:
+            success = self._run_finalize(project_path, chap_num, title, workflow_params)
+        except Exception as e:
+            self._log(f"❌ 在执行步骤 'finalize' 时发生意外错误: {e}")
+            logging.error("执行步骤 'finalize' 时出错:", exc_info=True)
+            raise WorkflowStepError(f"第 {chap_num} 章在步骤 '{display_step_name}' 中出错") from e
+        if not success:
+            self._log(f"❌ 第 {chap_num} 章在步骤 '{display_step_name}' 中失败，中止工作流。")
+            raise WorkflowStepError(f"第 {chap_num} 章在步骤 '{display_step_name}' 中失败")
+        self._log(f"✅ 步骤 '{display_step_name}' 完成。")
+
     def _get_draft_path(self, project_path, chap_num):
         """辅助函数，用于获取给定章节号的草稿文件路径和标题。"""
         draft_dir = os.path.join(project_path, "章节正文")
@@ -451,6 +634,7 @@ class WorkflowEngine:
         os.makedirs(draft_dir, exist_ok=True)
 
         draft_path, title = self._get_draft_path(project_path, chap_num)
+        prefetch = self._take_prefetch(chap_num)
 
         if force_regenerate and os.path.exists(draft_path):
             self._log(f"ℹ️ 强制重新生成第 {chap_num} 章，将删除现有草稿。")
@@ -492,43 +676,42 @@ class WorkflowEngine:
             global_summary_file = os.path.join(project_path, "前情摘要.txt")
             global_summary = read_file(global_summary_file) if os.path.exists(global_summary_file) else ""
 
-            current_chapter_blueprint_match = re.search(rf"^第{chap_num}章.*?(?=^第\d+章|\Z)", directory_content, re.MULTILINE | re.DOTALL)
-            current_chapter_blueprint = current_chapter_blueprint_match.group(0).strip() if current_chapter_blueprint_match else ""
-            next_chapter_blueprint_match = re.search(rf"^第{chap_num + 1}章.*?(?=^第\d+章|\Z)", directory_content, re.MULTILINE | re.DOTALL)
-            next_chapter_blueprint = next_chapter_blueprint_match.group(0).strip() if next_chapter_blueprint_match else ""
+            current_chapter_blueprint, next_chapter_blueprint = lookup_chapter_blueprints(directory_content, chap_num)
 
-            actual_volume_number = find_volume_for_chapter(volume_content, chap_num)
-            volume_outline = extract_volume_outline(volume_content, actual_volume_number)
+            chapter_info_for_char_gen = self._character_generation_info(chap_num, title, workflow_params, volume_content, global_summary, current_chapter_blueprint)
+            volume_outline = chapter_info_for_char_gen['volume_outline']
+
+            # 流水线模式：沿用上一章定稿期间提前准备、且在定稿后仍然有效的结果
+            prefetched_characters, prefetched_knowledge = None, None
+            if prefetch is not None:
+                self._log("正在校验提前准备的结果...")
+                prefetch.wait()
+                prefetched_characters, prefetched_knowledge = prefetch.validate(
+                    project_path, current_chapter_blueprint, read_character_index(project_path)
+                )
+                self._log(f"  -> 角色挑选: {'沿用' if prefetched_characters else '重新生成'}；伏笔检索: {'沿用' if prefetched_knowledge is not None else '重新检索'}。")
 
             # --- 2. 准备角色信息 ---
             self._log("正在准备角色信息...")
             embedding_adapter = None # 禁用嵌入模型
 
-            chapter_info_for_char_gen = {
-                'novel_number': chap_num, 'chapter_title': title,
-                'genre': workflow_params.get("genre"),
-                'volume_count': workflow_params.get("volume_count"),
-                'num_chapters': workflow_params.get("num_chapters_total"),
-                'volume_number': actual_volume_number,
-                'word_number': workflow_params.get("word_number"),
-                'topic': workflow_params.get("topic"),
-                'user_guidance': workflow_params.get("user_guidance"),
-                'global_summary': global_summary, 'volume_outline': volume_outline,
-                'current_chapter_blueprint': current_chapter_blueprint
-            }
-            
-            setting_characters = execute_with_polling(
-                gui_app=self.gui_app,
-                step_name="生成草稿_生成角色信息",
-                target_func=generate_characters_for_draft,
-                log_func=self._log,
-                adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
-                context_info=f"第 {chap_num} 章",
-                is_manual_call=False,
-                chapter_info=chapter_info_for_char_gen,
-                filepath=project_path
-            )
+            if prefetched_characters:
+                # 角色挑选沿用提前的 LLM 结果，角色详情按定稿后的最新状态重新检索
+                character_result, character_ids = prefetched_characters
+                setting_characters = assemble_draft_characters(character_result, character_ids, chap_num, project_path, log_func=self._log)
+            else:
+                setting_characters = execute_with_polling(
+                    gui_app=self.gui_app,
+                    step_name="生成草稿_生成角色信息",
+                    target_func=generate_characters_for_draft,
+                    log_func=self._log,
+                    adapter_callback=self.set_active_adapter,
+                    check_interrupted=self._stop_requested,
+                    context_info=f"第 {chap_num} 章",
+                    is_manual_call=False,
+                    chapter_info=chapter_info_for_char_gen,
+                    filepath=project_path
+                )
 
             if setting_characters is None:
                 self._log("❌ 生成角色信息失败，已尝试所有可用配置。")
@@ -536,48 +719,12 @@ class WorkflowEngine:
 
             # --- 3. 检索伏笔历史 ---
             self._log("正在检索伏笔历史...")
-            knowledge_context = ""
-            foreshadowing_ids = []
-            # --- 修复：在伏笔块中查找所有ID，然后去重 ---
-            if current_chapter_blueprint:
-                # 1. 定位伏笔条目块
-                foreshadowing_block_match = re.search(r'├─伏笔条目：([\s\S]*?)(?=\n[├└]─[\u4e00-\u9fa5]|\Z)', current_chapter_blueprint)
-                if foreshadowing_block_match:
-                    foreshadowing_block = foreshadowing_block_match.group(1)
-                    # 2. 在块内查找所有ID
-                    all_ids_in_block = re.findall(r'([A-Z]{1,2}F\d+)', foreshadowing_block)
-                    # 3. 去重
-                    if all_ids_in_block:
-                        foreshadowing_ids = sorted(list(set(all_ids_in_block)))
-                else:
-                    # 保险措施：如果找不到区块，则全局搜索
-                    foreshadowing_ids = sorted(list(set(re.findall(r'([A-Z]{1,2}F\d+)', current_chapter_blueprint))))
-
-            if foreshadowing_ids:
-                self._log(f"  -> 本章涉及伏笔: {', '.join(foreshadowing_ids)}")
-                foreshadowing_store = load_store(project_path, "foreshadowing_collection")
-                if foreshadowing_store:
-                    retrieved_foreshadows = []
-                    for fb_id in foreshadowing_ids:
-                        self._log(f"    -> 正在检索伏笔 {fb_id}...")
-                        fs_data = foreshadowing_store.get(fb_id)
-                        if fs_data and '内容' in fs_data:
-                            content = fs_data['内容']
-                            retrieved_foreshadows.append(f"伏笔 {fb_id} 的历史内容:\n{content}")
-                            self._log(f"      ✅ 成功检索到伏笔 {fb_id}。")
-                        else:
-                            self._log(f"      ℹ️ 未找到伏笔 {fb_id} 的历史记录。")
-                    
-                    if retrieved_foreshadows:
-                        knowledge_context = "\n\n".join(retrieved_foreshadows)
-                    else:
-                        knowledge_context = "(未检索到任何相关伏笔历史记录)"
-                else:
-                    self._log("  -> ⚠️ `伏笔状态.md` 不存在或加载失败，无法检索历史。")
-                    knowledge_context = "(伏笔JSON文件不可用)"
+            if prefetched_knowledge is not None:
+                self._log("  -> 伏笔存储在定稿期间未变化，沿用提前检索的结果。")
+                knowledge_context = prefetched_knowledge
             else:
-                self._log("  -> 本章蓝图不涉及任何伏笔。")
-                knowledge_context = "(无相关伏笔历史记录)"
+                foreshadowing_ids = extract_foreshadowing_ids(current_chapter_blueprint)
+                knowledge_context = retrieve_foreshadowing_context(project_path, foreshadowing_ids, self._log)
 
             # --- 4. 构建提示词 ---
             self._log("正在构建最终提示词...")
@@ -585,7 +732,9 @@ class WorkflowEngine:
             word_number = workflow_params.get("word_number", 3000)
             word_count_min = workflow_params.get("word_count_min", int(word_number * 0.8))
             word_count_max = workflow_params.get("word_count_max", int(word_number * 1.2))
-            prompt = chapter_draft_prompt.format(
+            # 分卷大纲、前情摘要等共享上下文放在稳定前缀中，便于服务端前缀缓存命中
+            prompt = build_prefixed_prompt(
+                chapter_draft_prompt,
                 novel_number=chap_num, chapter_title=title,
                 word_number=word_number,
                 genre=workflow_params.get("genre"),
@@ -609,13 +758,10 @@ class WorkflowEngine:
 
             def draft_generation_task(llm_adapter, **kwargs):
                 """包装流式调用以在execute_with_polling中使用"""
-                text = ""
-                from novel_generator.common import invoke_stream_with_cleaning
+                from novel_generator.common import invoke_stream_with_cleaning, collect_stream
                 logger = kwargs.get('log_func', self._log)
                 check_interrupted = kwargs.get('check_interrupted')
-                for chunk in invoke_stream_with_cleaning(llm_adapter, prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted):
-                    text += chunk
-                return text
+                return collect_stream(invoke_stream_with_cleaning(llm_adapter, prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted))
 
             draft_text = execute_with_polling(
                 gui_app=self.gui_app,
@@ -623,7 +769,7 @@ class WorkflowEngine:
                 target_func=draft_generation_task,
                 log_func=self._log,
                 adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
+                check_interrupted=self._stop_requested,
                 context_info=f"第 {chap_num} 章",
                 is_manual_call=False
             )
@@ -638,6 +784,7 @@ class WorkflowEngine:
 
             # --- 6. 返回结果 ---
             final_text = f"第{chap_num}章 {title}\n\n{draft_text}"
+            self._raise_if_stopped("保存草稿")
             save_string_to_txt(final_text, draft_path)
             self._log(f"✅ 第 {chap_num} 章草稿已生成并保存。")
             return draft_path, title
@@ -647,6 +794,95 @@ class WorkflowEngine:
             self._log(f"❌ 生成第 {chap_num} 章草稿时发生严重错误: {e}")
             return None, None
 
+    def _character_generation_info(self, chap_num, title, workflow_params, volume_content, global_summary, current_chapter_blueprint):
+        """组装 generate_characters_for_draft 所需的章节信息。"""
+        actual_volume_number = find_volume_for_chapter(volume_content, chap_num)
+        volume_outline = extract_volume_outline(volume_content, actual_volume_number)
+        return {
+            'novel_number': chap_num, 'chapter_title': title,
+            'genre': workflow_params.get("genre"),
+            'volume_count': workflow_params.get("volume_count"),
+            'num_chapters': workflow_params.get("num_chapters_total"),
+            'volume_number': actual_volume_number,
+            'word_number': workflow_params.get("word_number"),
+            'topic': workflow_params.get("topic"),
+            'user_guidance': workflow_params.get("user_guidance"),
+            'global_summary': global_summary, 'volume_outline': volume_outline,
+            'current_chapter_blueprint': current_chapter_blueprint
+        }
+
+    def _start_prefetch(self, project_path, chap_num, workflow_params):
+        """
+        在上一章定稿期间，于后台线程提前准备第 chap_num 章的草稿输入（蓝图、角色挑选、伏笔检索）。
+        草稿已存在或蓝图尚未生成时不预取，返回 None。
+        """
+        draft_path, title = self._get_draft_path(project_path, chap_num)
+        if os.path.exists(draft_path):
+            return None
+        directory_file = os.path.join(project_path, "章节目录.txt")
+        volume_file = os.path.join(project_path, "分卷大纲.txt")
+        directory_content = read_file(directory_file) if os.path.exists(directory_file) else ""
+        volume_content = read_file(volume_file) if os.path.exists(volume_file) else ""
+        current_chapter_blueprint, _ = lookup_chapter_blueprints(directory_content, chap_num)
+        if not current_chapter_blueprint or not volume_content:
+            return None
+
+        # 前情摘要在定稿开始前读取，此时停留在上一章之前
+        summary_file = os.path.join(project_path, "前情摘要.txt")
+        global_summary = read_file(summary_file) if os.path.exists(summary_file) else ""
+        chapter_info = self._character_generation_info(chap_num, title, workflow_params, volume_content, global_summary, current_chapter_blueprint)
+
+        prefetch = ChapterPrefetch(chap_num)
+        prefetch.current_chapter_blueprint = current_chapter_blueprint
+        self._log(f"  -> 流水线模式：定稿期间提前准备第 {chap_num} 章的输入。")
+        threading.Thread(target=self._run_prefetch, args=(prefetch, project_path, chapter_info),
+                         daemon=True, name=f"prefetch-{chap_num}").start()
+        return prefetch
+
+    def _run_prefetch(self, prefetch, project_path, chapter_info):
+        log = prefetch_log_func(self._log, prefetch.chap_num)
+        slot = "预取_生成角色信息"
+        started = time.monotonic()
+        try:
+            # 先记录伏笔存储的签名再检索，定稿期间若被改写，校验时即可发现
+            prefetch.foreshadowing_ids = extract_foreshadowing_ids(prefetch.current_chapter_blueprint)
+            prefetch.foreshadowing_signature = store_signature(project_path, "foreshadowing_collection")
+            prefetch.knowledge_context = retrieve_foreshadowing_context(project_path, prefetch.foreshadowing_ids, log)
+
+            def select_characters_task(llm_adapter, **kwargs):
+                result = select_draft_characters(
+                    chapter_info, project_path, llm_adapter,
+                    log_func=kwargs.get('log_func', log), check_interrupted=kwargs.get('check_interrupted')
+                )
+                return result if result[0] else None
+
+            selected = execute_with_polling(
+                gui_app=self.gui_app,
+                step_name="生成草稿_生成角色信息",
+                target_func=select_characters_task,
+                log_func=log,
+                adapter_callback=self._adapter_slot(slot),
+                check_interrupted=self._stop_requested,
+                context_info=f"第 {prefetch.chap_num} 章",
+                is_manual_call=False
+            )
+            if selected:
+                prefetch.character_result, prefetch.character_ids, prefetch.character_index = selected
+            log(f"提前准备完成，耗时 {time.monotonic() - started:.1f} 秒。")
+        except Exception as e:
+            prefetch.error = e
+            log(f"⚠️ 提前准备失败，将在定稿后按常规流程准备: {e}")
+        finally:
+            self._release_adapter_slots([slot])
+            prefetch.finish()
+
+    def _take_prefetch(self, chap_num):
+        """取出属于本章的提前准备结果（只使用一次）。"""
+        prefetch, self._prefetch = self._prefetch, None
+        if prefetch is not None and prefetch.chap_num == chap_num:
+            return prefetch
+        return None
+
     def _ensure_blueprints_exist(self, project_path, chap_num, generate_volume, generate_blueprint, volume_char_weight, blueprint_num_chapters, workflow_params):
         """确保分卷大纲和章节目录存在，如果不存在则生成。"""
         directory_file = os.path.join(project_path, "章节目录.txt")
@@ -678,7 +914,7 @@ class WorkflowEngine:
                 step_name="生成分卷大纲",
                 log_func=self._log,
                 adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
+                check_interrupted=self._stop_requested,
                 context_info=f"第 {target_volume_num} 卷",
                 is_manual_call=False,
                 target_func=lambda llm_adapter, **kwargs: Novel_volume_generate(
@@ -717,7 +953,7 @@ class WorkflowEngine:
                 step_name="生成章节目录",
                 log_func=self._log,
                 adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
+                check_interrupted=self._stop_requested,
                 context_info=context_range,
                 is_manual_call=False,
                 target_func=lambda llm_adapter, **kwargs: Chapter_blueprint_generate(
@@ -862,7 +1098,8 @@ class WorkflowEngine:
 
             # --- 2. 构建完整的提示词 ---
             self._log("  -> 正在构建完整的审校提示词...")
-            prompt = Chapter_Review_prompt.format(
+            prompt = build_prefixed_prompt(
+                Chapter_Review_prompt,
                 novel_number=chap_num,
                 word_number=workflow_params.get("word_number", 3000),
                 genre=workflow_params.get("genre", "未知"),
@@ -895,13 +1132,14 @@ class WorkflowEngine:
                 target_func=consistency_check_task,
                 log_func=self._log,
                 adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
+                check_interrupted=self._stop_requested,
                 context_info=f"第 {chap_num} 章",
                 is_manual_call=False
             )
             
             if report and report.strip():
                 report_path = os.path.join(project_path, "一致性审校.txt")
+                self._raise_if_stopped("保存审校报告")
                 with open(report_path, 'w', encoding='utf-8') as f:
                     f.write(f"# 第{chap_num}章 一致性审校报告\n\n{report}")
                 self._log(f"✅ 第 {chap_num} 章的一致性报告已保存。")
@@ -968,7 +1206,8 @@ class WorkflowEngine:
                 self._log(f"ℹ️ 工作流：使用全局设定的字数范围进行改写: {final_word_min} - {final_word_max} 字。")
             # --- 动态获取字数范围结束 ---
 
-            prompt = chapter_rewrite_prompt.format(
+            prompt = build_prefixed_prompt(
+                chapter_rewrite_prompt,
                 novel_number=chap_num,
                 chapter_title=title,
                 word_number=word_number,
@@ -1009,7 +1248,7 @@ class WorkflowEngine:
                 target_func=rewrite_task,
                 log_func=self._log,
                 adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
+                check_interrupted=self._stop_requested,
                 context_info=f"第 {chap_num} 章",
                 is_manual_call=False
             )
@@ -1017,6 +1256,7 @@ class WorkflowEngine:
             # 4. 保存结果
             if rewritten_content and rewritten_content.strip() and "❌" not in rewritten_content:
                 final_content = rewritten_content
+                self._raise_if_stopped("保存改写结果")
                 # 确保保存为UTF-8
                 with open(draft_path, 'w', encoding='utf-8') as f:
                     f.write(final_content)
@@ -1071,42 +1311,46 @@ class WorkflowEngine:
             from prompt_definitions import summary_prompt, plot_points_extraction_prompt
             from novel_generator.knowledge import process_and_store_foreshadowing
 
-            embedding_adapter = None
+            from novel_generator.character_state_updater import update_character_states
+
+            finalize_steps = ["章节定稿_生成章节摘要", "章节定稿_更新角色状态", "章节定稿_整合伏笔", "章节定稿_提取剧情要点"]
+
+            def run_step(step_name, target_func):
+                # 并发节点各自占用一个适配器槽位，强制停止时一并关闭
+                return execute_with_polling(
+                    gui_app=self.gui_app,
+                    step_name=step_name,
+                    target_func=target_func,
+                    log_func=self._log,
+                    adapter_callback=self._adapter_slot(step_name),
+                    check_interrupted=self._stop_requested,
+                    context_info=f"第 {chap_num} 章",
+                    is_manual_call=False
+                )
+
+            # 以下四个子步骤都只读取定稿前的文件、各自写入不同的文件，彼此独立，作为任务图的节点并发执行。
+            # 剧情要点沿用定稿前的前情摘要，与原先的串行顺序保持一致。
 
             # --- 步骤 1: 更新前情摘要 ---
-            self._log("  [1/4] 正在更新前情摘要...")
             summary_update_prompt = summary_prompt.format(chapter_text=chapter_text, global_summary=global_summary)
 
             def summary_task(llm_adapter, **kwargs):
-                text = ""
-                from novel_generator.common import invoke_stream_with_cleaning
+                from novel_generator.common import invoke_stream_with_cleaning, collect_stream
                 logger = kwargs.get('log_func', self._log)
                 check_interrupted = kwargs.get('check_interrupted')
-                for chunk in invoke_stream_with_cleaning(llm_adapter, summary_update_prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted):
-                    text += chunk
-                return text
-
-            new_summary = execute_with_polling(
-                gui_app=self.gui_app,
-                step_name="章节定稿_生成章节摘要",
-                target_func=summary_task,
-                log_func=self._log,
-                adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
-                context_info=f"第 {chap_num} 章",
-                is_manual_call=False
-            )
-
-            if new_summary and new_summary.strip() and "❌" not in new_summary:
-                save_string_to_txt(new_summary, summary_file)
-                self._log("    ✅ 前情摘要已更新。")
-            else:
-                self._log("    ⚠️ 更新前情摘要失败。")
+                return collect_stream(invoke_stream_with_cleaning(llm_adapter, summary_update_prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted))
+
+            def summary_node():
+                self._log("  [1/4] 正在更新前情摘要...")
+                new_summary = run_step("章节定稿_生成章节摘要", summary_task)
+                if new_summary and new_summary.strip() and "❌" not in new_summary:
+                    self._raise_if_stopped("写入前情摘要")
+                    save_string_to_txt(new_summary, summary_file)
+                    self._log("    ✅ 前情摘要已更新。")
+                else:
+                    self._log("    ⚠️ 更新前情摘要失败。")
 
             # --- 步骤 2: 更新角色状态 ---
-            self._log("  [2/4] 正在更新角色状态...")
-            from novel_generator.character_state_updater import update_character_states
-
             def update_character_states_task(llm_adapter, **kwargs):
                 # This wrapper ensures llm_adapter is passed correctly
                 logger = kwargs.get('log_func', self._log)
@@ -1121,64 +1365,45 @@ class WorkflowEngine:
                     log_func=logger # Pass the log function here
                 )
 
-            result = execute_with_polling(
-                gui_app=self.gui_app,
-                step_name="章节定稿_更新角色状态",
-                target_func=update_character_states_task,
-                log_func=self._log,
-                adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
-                context_info=f"第 {chap_num} 章",
-                is_manual_call=False
-            )
-
-            if result and result.get("status") == "success":
-                self._log("    ✅ 角色状态更新成功。")
-            else:
-                self._log(f"    ❌ 角色状态更新失败: {result.get('message', '未知错误') if result else '已尝试所有配置'}")
+            def character_state_node():
+                self._log("  [2/4] 正在更新角色状态...")
+                result = run_step("章节定稿_更新角色状态", update_character_states_task)
+                if result and result.get("status") == "success":
+                    self._log("    ✅ 角色状态更新成功。")
+                else:
+                    self._log(f"    ❌ 角色状态更新失败: {result.get('message', '未知错误') if result else '已尝试所有配置'}")
 
             # --- 步骤 3: 整合伏笔内容 ---
-            self._log("  [3/4] 正在处理和整合伏笔内容...")
             foreshadowing_str = chapter_info.get('foreshadowing', "")
-            if foreshadowing_str: # 修复：移除对 embedding_adapter 的错误依赖
-                chapter_info_fs = {'novel_number': chap_num, 'chapter_title': chapter_title_full, 'foreshadowing': foreshadowing_str}
-                
-                def process_foreshadowing_task(llm_adapter, **kwargs):
-                    logger = kwargs.get('log_func', self._log)
-                    return process_and_store_foreshadowing(
-                        chapter_text=chapter_text,
-                        chapter_info=chapter_info_fs,
-                        filepath=project_path,
-                        llm_adapter=llm_adapter, # Pass the adapter here
-                        log_func=logger # Pass the log function here
-                    )
-
-                result = execute_with_polling(
-                    gui_app=self.gui_app,
-                    step_name="章节定稿_整合伏笔",
-                    target_func=process_foreshadowing_task,
-                    log_func=self._log,
-                    adapter_callback=self.set_active_adapter,
-                    check_interrupted=lambda: False,
-                    context_info=f"第 {chap_num} 章",
-                    is_manual_call=False
+            chapter_info_fs = {'novel_number': chap_num, 'chapter_title': chapter_title_full, 'foreshadowing': foreshadowing_str}
+
+            def process_foreshadowing_task(llm_adapter, **kwargs):
+                logger = kwargs.get('log_func', self._log)
+                return process_and_store_foreshadowing(
+                    chapter_text=chapter_text,
+                    chapter_info=chapter_info_fs,
+                    filepath=project_path,
+                    llm_adapter=llm_adapter, # Pass the adapter here
+                    log_func=logger # Pass the log function here
                 )
 
+            def foreshadowing_node():
+                self._log("  [3/4] 正在处理和整合伏笔内容...")
+                if not foreshadowing_str: # 修复：移除对 embedding_adapter 的错误依赖
+                    self._log("    ℹ️ 本章蓝图无伏笔信息，跳过。")
+                    return
+                run_step("章节定稿_整合伏笔", process_foreshadowing_task)
                 # 注意：process_and_store_foreshadowing 内部会自行处理日志，这里不再需要复杂的成功/失败判断
                 # 简化逻辑，只要执行过即可认为完成
                 self._log("    ✅ 伏笔内容处理完成。")
 
-            else:
-                self._log("    ℹ️ 本章蓝图无伏笔信息，跳过。")
-
             # --- 步骤 4: 提取剧情要点 ---
-            self._log("  [4/4] 正在提取剧情要点...")
             previous_plot_points = ""
             if chap_num > 1 and os.path.exists(plot_points_file):
                 content = read_file(plot_points_file)
                 match = re.search(rf"(##\s*第\s*{chap_num-1}\s*章[\s\S]*?)(?=\n##\s*第|$)", content)
                 if match: previous_plot_points = match.group(1).strip()
-            
+
             plot_points_prompt = plot_points_extraction_prompt.format(
                 novel_number=chap_num, chapter_title=chapter_title_full, chapter_text=chapter_text,
                 current_chapter_blueprint=current_chapter_blueprint, global_summary=global_summary,
@@ -1186,36 +1411,59 @@ class WorkflowEngine:
             )
 
             def plot_points_task(llm_adapter, **kwargs):
-                text = ""
-                from novel_generator.common import invoke_stream_with_cleaning
+                from novel_generator.common import invoke_stream_with_cleaning, collect_stream
+                from novel_generator.structured_output import (
+                    PLOT_POINTS_SPEC, StructuredOutputError, invoke_structured, render_plot_points, structured_output_enabled,
+                )
                 logger = kwargs.get('log_func', self._log)
                 check_interrupted = kwargs.get('check_interrupted')
-                for chunk in invoke_stream_with_cleaning(llm_adapter, plot_points_prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted):
-                    text += chunk
-                return text
-
-            plot_points = execute_with_polling(
-                gui_app=self.gui_app,
-                step_name="章节定稿_提取剧情要点",
-                target_func=plot_points_task,
-                log_func=self._log,
-                adapter_callback=self.set_active_adapter,
-                check_interrupted=lambda: False,
-                context_info=f"第 {chap_num} 章",
-                is_manual_call=False
-            )
-
-            if plot_points and "❌" not in plot_points:
-                existing_content = read_file(plot_points_file) if os.path.exists(plot_points_file) else ""
-                chapter_header = f"## 第 {chap_num} 章 《{title}》"
-                chapter_pattern = re.compile(f"\n\n## 第 {chap_num} 章.*?(?=\n\n## 第|$)", re.DOTALL)
-                if chapter_pattern.search(existing_content):
-                    existing_content = chapter_pattern.sub("", existing_content)
-                new_content = existing_content.rstrip() + f"\n\n{chapter_header}\n{plot_points}"
-                save_string_to_txt(new_content, plot_points_file)
-                self._log("    ✅ 剧情要点已提取并更新到文件。")
-            else:
-                self._log("    ⚠️ 提取剧情要点失败。")
+                if structured_output_enabled(llm_adapter):
+                    try:
+                        data = invoke_structured(llm_adapter, plot_points_prompt, PLOT_POINTS_SPEC,
+                                                 check_interrupted=check_interrupted, log_func=logger)
+                        # 渲染为与文本模式相同的格式后写入 剧情要点.txt
+                        return render_plot_points(data, chap_num, chapter_title_full)
+                    except StructuredOutputError as e:
+                        logger(f"    结构化输出失败（{e}），改用文本格式重新请求。")
+                return collect_stream(invoke_stream_with_cleaning(llm_adapter, plot_points_prompt, log_func=logger, log_stream=False, check_interrupted=check_interrupted))
+
+            def plot_points_node():
+                self._log("  [4/4] 正在提取剧情要点...")
+                plot_points = run_step("章节定稿_提取剧情要点", plot_points_task)
+                if plot_points and "❌" not in plot_points:
+                    existing_content = read_file(plot_points_file) if os.path.exists(plot_points_file) else ""
+                    chapter_header = f"## 第 {chap_num} 章 《{title}》"
+                    chapter_pattern = re.compile(f"\n\n## 第 {chap_num} 章.*?(?=\n\n## 第|$)", re.DOTALL)
+                    if chapter_pattern.search(existing_content):
+                        existing_content = chapter_pattern.sub("", existing_content)
+                    new_content = existing_content.rstrip() + f"\n\n{chapter_header}\n{plot_points}"
+                    self._raise_if_stopped("写入剧情要点")
+                    save_string_to_txt(new_content, plot_points_file)
+                    self._log("    ✅ 剧情要点已提取并更新到文件。")
+                else:
+                    self._log("    ⚠️ 提取剧情要点失败。")
+
+            # 每个节点内部的 execute_with_polling 负责重试与切换配置；图只负责并发调度
+            # 与引擎共享停止信号：强制停止后不再启动新的子步骤，graph.run() 等待已启动的子步骤结束后才返回
+            graph = TaskGraph(max_workers=self._finalize_concurrency(), log_func=self._log, name=f"finalize-{chap_num}",
+                              stop_event=self._stop_event)
+            graph.add("前情摘要", summary_node)
+            graph.add("角色状态", character_state_node)
+            graph.add("伏笔整合", foreshadowing_node)
+            graph.add("剧情要点", plot_points_node)
+            try:
+                graph.run()
+            finally:
+                self._release_adapter_slots(finalize_steps)
+
+            failures = graph.failures()
+            if failures:
+                # 与串行执行时一致：任一子步骤抛出异常即视为定稿失败（其余子步骤已完成的写入保留）
+                for node in failures[1:]:
+                    logging.error(f"定稿子步骤 '{node.name}' 出错: {node.error}", exc_info=node.error)
+                raise failures[0].error
+            # 停止后未启动的子步骤记为跳过而非失败，不能当作定稿完成
+            self._raise_if_stopped("定稿")
 
             self._log(f"✅ 第 {chap_num} 章定稿流程全部完成！")
             return True
@@ -1386,6 +1386,33 @@ CF001:
   - 不要包含任何解释或额外文本。
 """
 
+# 9.5 伏笔内容单次处理（合并 9.3、9.4 与 9.1，配合结构化输出使用）
+foreshadowing_fused_processing_prompt = """\
+【伏笔内容处理任务】
+
+◆ 输入数据：
+  - 章节编号：第{novel_number}章《{chapter_title}》
+  - 本章涉及伏笔编号列表：
+{foreshadowing_entries}
+
+  - 伏笔历史内容（从伏笔状态文件检索）：
+{foreshadowing_history}
+
+【章节正文】
+{chapter_text}
+
+◆ 处理流程：
+  1. 仔细阅读【章节正文】，为【本章涉及伏笔编号列表】中的每一个伏笔ID提取其在本章的最新进展（不超过500字），
+     本章没有相关内容时注明"本章无相关内容"。
+  2. 整合该伏笔的【伏笔历史内容】与本章进展，生成最新的完整伏笔描述，要求内容完整不可缺失，
+     后期可通过整合内容全面了解伏笔的所有信息；考虑伏笔状态（埋设/触发/强化/回收），确保内容连贯。
+     没有历史内容的伏笔视为新伏笔，直接根据本章内容描述。
+
+◆ 输出要求：
+  - 每个伏笔输出一条：编号、本章内容（第1步结果）、内容（第2步整合后的最新描述）。
+  - 不要遗漏列表中的伏笔，不要包含任何解释或额外文本。
+"""
+
 
 # =============== 10、小说分卷设计（分卷提示词） ===================
 volume_design_format = """\
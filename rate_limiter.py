@@ -0,0 +1,175 @@
+# rate_limiter.py
+# -*- coding: utf-8 -*-
+"""
+按服务商（base_url + api_key）共享的客户端限流器。
+- 同时限制每分钟请求数（RPM）和每分钟Token数（TPM），采用令牌桶算法；
+- 等待中的调用按先来后到排队，避免多个线程同时被唤醒后一起打到服务端触发 429；
+- 调用结束后按实际用量修正Token桶，并提供排队深度和等待时间统计供界面显示。
+"""
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+class RateLimitCancelled(Exception):
+    """排队等待期间调用被取消。"""
+    pass
+
+
+class ProviderRateLimiter:
+    """
+    单个服务商的限流器。rpm/tpm 为 0 表示不限制对应维度。
+    令牌桶容量为一分钟的配额，按秒匀速补充。
+    """
+    def __init__(self, name: str, rpm: int = 0, tpm: int = 0):
+        self.name = name
+        self._cond = threading.Condition()
+        self._waiters = deque()
+        self._tickets = itertools.count()
+        self.rpm = 0
+        self.tpm = 0
+        self._request_tokens = 0.0
+        self._token_tokens = 0.0
+        self._last_refill = time.monotonic()
+        self.total_wait_seconds = 0.0
+        self.last_wait_seconds = 0.0
+        self.acquired_count = 0
+        self.configure(rpm, tpm)
+
+    def configure(self, rpm: int = 0, tpm: int = 0):
+        """更新限额；新的桶从满额开始。"""
+        with self._cond:
+            rpm, tpm = int(rpm or 0), int(tpm or 0)
+            if rpm != self.rpm:
+                self.rpm = rpm
+                self._request_tokens = float(rpm)
+            if tpm != self.tpm:
+                self.tpm = tpm
+                self._token_tokens = float(tpm)
+            self._cond.notify_all()
+
+    def _refill_locked(self):
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._last_refill = now
+        if self.rpm:
+            self._request_tokens = min(float(self.rpm), self._request_tokens + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self._token_tokens = min(float(self.tpm), self._token_tokens + elapsed * self.tpm / 60.0)
+
+    def _seconds_until_available_locked(self, tokens: int) -> float:
+        """返回距离同时满足请求数与Token数配额还需等待的秒数。"""
+        wait = 0.0
+        if self.rpm and self._request_tokens < 1:
+            wait = max(wait, (1 - self._request_tokens) * 60.0 / self.rpm)
+        if self.tpm:
+            # 单次请求超过整桶容量时，只要求桶满即可放行，避免永久阻塞
+            needed = min(float(tokens), float(self.tpm))
+            if self._token_tokens < needed:
+                wait = max(wait, (needed - self._token_tokens) * 60.0 / self.tpm)
+        return wait
+
+    def acquire(self, tokens: int = 0, cancel_event: Optional[threading.Event] = None) -> float:
+        """
+        阻塞直到配额可用并扣除一次请求和 tokens 个Token，返回实际等待的秒数。
+        cancel_event 被设置时抛出 RateLimitCancelled。
+        """
+        start = time.monotonic()
+        with self._cond:
+            ticket = next(self._tickets)
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise RateLimitCancelled(f"在 '{self.name}' 的限流队列中等待时被取消。")
+                    self._refill_locked()
+                    if self._waiters[0] == ticket:
+                        wait = self._seconds_until_available_locked(tokens)
+                        if wait <= 0:
+                            break
+                    else:
+                        wait = 0.5
+                    # 定期醒来检查取消信号，配额更新或队首变化时会被提前唤醒
+                    self._cond.wait(min(wait, 0.5))
+                if self.rpm:
+                    self._request_tokens -= 1
+                if self.tpm:
+                    self._token_tokens -= min(float(tokens), float(self.tpm))
+            finally:
+                self._waiters.remove(ticket)
+                self._cond.notify_all()
+
+            waited = time.monotonic() - start
+            self.last_wait_seconds = waited
+            self.total_wait_seconds += waited
+            self.acquired_count += 1
+        if waited >= 1:
+            logging.info(f"限流器 '{self.name}' 排队等待 {waited:.1f} 秒后放行。")
+        return waited
+
+    def adjust(self, delta_tokens: int):
+        """按实际用量修正Token桶：正数表示补扣，负数表示退还（例如请求被服务端拒绝）。"""
+        if not self.tpm or not delta_tokens:
+            return
+        with self._cond:
+            self._refill_locked()
+            self._token_tokens = min(float(self.tpm), self._token_tokens - delta_tokens)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            self._refill_locked()
+            return {
+                "rpm": self.rpm,
+                "tpm": self.tpm,
+                "queue_depth": len(self._waiters),
+                "last_wait_seconds": round(self.last_wait_seconds, 2),
+                "avg_wait_seconds": round(self.total_wait_seconds / self.acquired_count, 2) if self.acquired_count else 0.0,
+                "available_requests": round(self._request_tokens, 2) if self.rpm else None,
+                "available_tokens": int(self._token_tokens) if self.tpm else None,
+            }
+
+
+class RateLimiterRegistry:
+    """按 base_url + api_key 共享限流器，同一服务商的所有适配器和线程共用一个实例。"""
+    def __init__(self):
+        self._limiters: Dict[str, ProviderRateLimiter] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(base_url: str, api_key: str) -> str:
+        digest = hashlib.sha1(f"{base_url}\0{api_key}".encode('utf-8')).hexdigest()[:12]
+        return f"{base_url or 'default'}#{digest}"
+
+    def get(self, base_url: str, api_key: str, rpm: int = 0, tpm: int = 0) -> Optional[ProviderRateLimiter]:
+        """
+        获取服务商的限流器。rpm 和 tpm 都为 0 且该服务商尚无限流器时返回 None（不限流）；
+        已有限流器时同样受其约束，因为服务端配额是按账号计算的。
+        多个配置指向同一服务商时，以最近创建的适配器所带的限额为准。
+        """
+        rpm, tpm = int(rpm or 0), int(tpm or 0)
+        key = self.make_key(base_url, api_key)
+        with self._lock:
+            limiter = self._limiters.get(key)
+            if not rpm and not tpm:
+                return limiter
+            if limiter is None:
+                limiter = ProviderRateLimiter(key.split("#")[0], rpm, tpm)
+                self._limiters[key] = limiter
+            elif (limiter.rpm, limiter.tpm) != (rpm, tpm):
+                limiter.configure(rpm, tpm)
+        return limiter
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回所有限流器的排队深度、等待时间和剩余配额，供界面显示。"""
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {key: limiter.stats() for key, limiter in limiters.items()}
+
+
+# 全局共享实例
+rate_limiters = RateLimiterRegistry()
@@ -0,0 +1,134 @@
+# startup_profiler.py
+# -*- coding: utf-8 -*-
+"""
+启动耗时统计。
+- 阶段计时：main.py 在关键节点调用 mark()，启动完成后输出各阶段耗时；
+- 模块导入计时（类似 python -X importtime）：在 sys.meta_path 最前面插入一个查找器，
+  记录每个模块执行的总耗时与自身耗时（扣除其导入的子模块），用于定位拖慢冷启动的依赖。
+模块导入计时设置环境变量 NOVEL_IMPORT_PROFILE=1 或使用 --import-profile 参数启动时开启。
+"""
+import importlib.abc
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+_start = time.perf_counter()
+_marks: List[Tuple[str, float]] = []
+
+
+def mark(phase: str):
+    """记录一个启动阶段完成的时间点。"""
+    _marks.append((phase, time.perf_counter()))
+
+
+def import_profile_requested(argv: Optional[List[str]] = None) -> bool:
+    argv = sys.argv if argv is None else argv
+    return os.environ.get("NOVEL_IMPORT_PROFILE", "") not in ("", "0") or "--import-profile" in argv
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """包装原加载器，统计 exec_module 的耗时。"""
+    def __init__(self, timer: "ImportTimer", loader):
+        self._timer = timer
+        self._loader = loader
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        self._timer._enter()
+        started = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            self._timer._leave(module.__name__, time.perf_counter() - started)
+
+    def __getattr__(self, name):
+        # get_resource_reader、is_package 等其他接口交给原加载器
+        return getattr(self._loader, name)
+
+
+class ImportTimer(importlib.abc.MetaPathFinder):
+    """记录模块导入耗时：总耗时包含其导入的子模块，自身耗时不包含。"""
+    def __init__(self):
+        self.records: Dict[str, Tuple[float, float]] = {}
+        self._local = threading.local()
+        self._finding = threading.local()
+
+    def install(self):
+        if self not in sys.meta_path:
+            sys.meta_path.insert(0, self)
+
+    def uninstall(self):
+        if self in sys.meta_path:
+            sys.meta_path.remove(self)
+
+    def find_spec(self, fullname, path, target=None):
+        if getattr(self._finding, "active", False):
+            return None
+        self._finding.active = True
+        try:
+            for finder in sys.meta_path:
+                if finder is self or not hasattr(finder, "find_spec"):
+                    continue
+                spec = finder.find_spec(fullname, path, target)
+                if spec is not None:
+                    if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                        spec.loader = _TimingLoader(self, spec.loader)
+                    return spec
+            return None
+        finally:
+            self._finding.active = False
+
+    def _stack(self) -> List[float]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _enter(self):
+        self._stack().append(0.0)
+
+    def _leave(self, name: str, elapsed: float):
+        stack = self._stack()
+        children = stack.pop() if stack else 0.0
+        if stack:
+            stack[-1] += elapsed
+        self.records[name] = (elapsed, max(0.0, elapsed - children))
+
+    def top(self, limit: int = 25) -> List[Tuple[str, float, float]]:
+        """按总耗时排序的 (模块名, 总耗时, 自身耗时)。"""
+        rows = [(name, total, own) for name, (total, own) in self.records.items()]
+        rows.sort(key=lambda row: row[1], reverse=True)
+        return rows[:limit]
+
+
+import_timer: Optional[ImportTimer] = None
+
+
+def enable_import_timing() -> ImportTimer:
+    global import_timer
+    if import_timer is None:
+        import_timer = ImportTimer()
+        import_timer.install()
+    return import_timer
+
+
+def report(limit: int = 25) -> str:
+    """生成启动耗时报告并写入日志。"""
+    lines = ["启动耗时统计："]
+    previous = _start
+    for phase, at in _marks:
+        lines.append(f"  {phase:<16} {(at - previous) * 1000:8.1f} ms（累计 {(at - _start) * 1000:8.1f} ms）")
+        previous = at
+    if import_timer is not None:
+        import_timer.uninstall()
+        lines.append(f"  模块导入耗时（前 {limit} 项，总耗时 / 自身耗时）：")
+        for name, total, own in import_timer.top(limit):
+            lines.append(f"    {total * 1000:8.1f} ms / {own * 1000:8.1f} ms  {name}")
+    text = "\n".join(lines)
+    logging.info(text)
+    return text
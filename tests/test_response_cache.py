@@ -0,0 +1,94 @@
+# tests/test_response_cache.py
+# -*- coding: utf-8 -*-
+"""响应缓存在真实调用路径（execute_with_polling → 适配器池 → OpenAI 兼容适配器）上的命中测试。"""
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+import config_manager as cm
+import llm_adapters
+from llm_cache import response_cache
+from mock_llm_server import start_mock_server
+from novel_generator.common import collect_stream, execute_with_polling, invoke_stream_with_cleaning
+
+STEP_NAME = "章节定稿_生成章节摘要"
+CONFIG_NAME = "模拟服务"
+
+
+class _Var:
+    def __init__(self, value):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+
+@pytest.fixture
+def mock_server():
+    server = start_mock_server(ttft=0, tokens_per_sec=0, seed=1)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch, mock_server):
+    """在临时目录中准备轮询设定（开启响应缓存），并把配置指向模拟服务。"""
+    monkeypatch.chdir(tmp_path)
+    settings_dir = tmp_path / "ui" / "轮询设定"
+    settings_dir.mkdir(parents=True)
+    (settings_dir / "轮询设定.json").write_text(json.dumps({
+        "设置": {"响应缓存启用": True, "Token计数模式": "estimate"},
+        "轮询列表": [],
+        "步骤": {},
+    }, ensure_ascii=False), encoding="utf-8")
+
+    llm_config = {
+        "interface_format": "OpenAI兼容", "api_key": "test-key", "base_url": f"{mock_server.base_url}/v1",
+        "model_name": "mock-model", "max_tokens": 512, "temperature": 0.7, "timeout": 30,
+    }
+    monkeypatch.setattr(cm, "get_config", lambda name: {"llm_config": llm_config} if name == CONFIG_NAME else None)
+    # 两个单例都与工作目录有关，测试中重新创建
+    monkeypatch.setattr(llm_adapters.PollingManager, "_instance", None)
+    monkeypatch.setattr(response_cache, "cache_dir", os.path.join("ui", "轮询设定", "llm_cache"))
+    monkeypatch.setattr(response_cache, "_loaded", False)
+    monkeypatch.setattr(response_cache, "_entries", type(response_cache._entries)())
+    monkeypatch.setattr(response_cache, "_total_bytes", 0)
+    return tmp_path
+
+
+def _gui_app():
+    return SimpleNamespace(
+        enable_polling_var=_Var(False),
+        main_config_selection_var=_Var(CONFIG_NAME),
+        main_model_name_var=_Var(""),
+        safe_log=lambda *args, **kwargs: None,
+    )
+
+
+def _summary_task(llm_adapter, **kwargs):
+    return collect_stream(invoke_stream_with_cleaning(
+        llm_adapter, "请根据以下章节内容更新前情摘要：主角离开了村庄。",
+        log_func=kwargs.get("log_func"), log_stream=False, check_interrupted=kwargs.get("check_interrupted"),
+    ))
+
+
+def _run_step():
+    return execute_with_polling(
+        gui_app=_gui_app(), step_name=STEP_NAME, target_func=_summary_task,
+        log_func=lambda *args, **kwargs: None, context_info="第 1 章", is_manual_call=False,
+    )
+
+
+def test_second_identical_call_is_served_from_cache(workspace, mock_server):
+    first = _run_step()
+    requests_after_first = mock_server.stats.snapshot().get("POST /v1/chat/completions", 0)
+    second = _run_step()
+
+    assert first and second == first
+    assert requests_after_first == 1
+    # 第二次调用命中缓存，没有再请求服务端
+    assert mock_server.stats.snapshot().get("POST /v1/chat/completions", 0) == 1
+    assert response_cache.hits >= 1
@@ -0,0 +1,114 @@
+# think_filter.py
+# -*- coding: utf-8 -*-
+"""
+推理模型思考内容的流式过滤。
+DeepSeek-R1、通过硅基流动/Ollama 部署的 Qwen 等推理模型会在正文前输出很长的 <think>…</think>，
+ThinkTagFilter 以状态机逐片处理：标签被拆分到多个分片时也能正确识别，思考内容直接分流
+（交给回调或丢弃），正文按原样放行，调用方无需缓存整段文本再用正则清理。
+"""
+from typing import Callable, Optional, Tuple
+
+OPEN_TAG = "<think>"
+CLOSE_TAG = "</think>"
+
+# 配置项 reasoning_mode 的取值
+REASONING_DROP = "drop"        # 丢弃思考内容（默认）
+REASONING_CHANNEL = "channel"  # 思考内容交给 on_reasoning 回调
+REASONING_KEEP = "keep"        # 不过滤，按原样输出
+_MODE_ALIASES = {
+    "丢弃": REASONING_DROP,
+    "分流": REASONING_CHANNEL,
+    "保留": REASONING_KEEP,
+}
+
+
+def normalize_reasoning_mode(mode: Optional[str]) -> str:
+    mode = _MODE_ALIASES.get(mode, mode)
+    return mode if mode in (REASONING_DROP, REASONING_CHANNEL, REASONING_KEEP) else REASONING_DROP
+
+
+def _partial_tag_suffix(text: str, tag: str) -> int:
+    """text 结尾可能是 tag 开头的一部分时，返回这部分的长度。"""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if tag.startswith(text[-size:]):
+            return size
+    return 0
+
+
+class ThinkTagFilter:
+    """
+    把流式分片拆分为 (正文, 思考内容)。
+    只在结尾保留可能构成标签的最多 len("</think>") - 1 个字符，其余内容立即放行。
+    思考块结束后紧跟的空白不计入正文。
+    """
+    def __init__(self):
+        self._in_think = False
+        self._pending = ""
+        self._strip_leading = False
+        self.reasoning_chars = 0
+        # 是否已经放行过正文（用于统计首个正文分片的时间）
+        self.answer_started = False
+
+    @property
+    def in_think(self) -> bool:
+        return self._in_think
+
+    def feed(self, chunk: str) -> Tuple[str, str]:
+        text = self._pending + (chunk or "")
+        self._pending = ""
+        answer_parts = []
+        reasoning_parts = []
+        while text:
+            tag = CLOSE_TAG if self._in_think else OPEN_TAG
+            index = text.find(tag)
+            if index >= 0:
+                if self._in_think:
+                    reasoning_parts.append(text[:index])
+                else:
+                    answer_parts.append(self._answer_part(text[:index]))
+                text = text[index + len(tag):]
+                self._in_think = not self._in_think
+                if not self._in_think:
+                    self._strip_leading = True
+                continue
+            keep = _partial_tag_suffix(text, tag)
+            if self._in_think:
+                reasoning_parts.append(text[:len(text) - keep])
+            else:
+                answer_parts.append(self._answer_part(text[:len(text) - keep]))
+            self._pending = text[len(text) - keep:]
+            break
+        return self._finish(answer_parts, reasoning_parts)
+
+    def flush(self) -> Tuple[str, str]:
+        """流结束时放行残留的半截内容（未闭合的思考块按思考内容处理）。"""
+        text, self._pending = self._pending, ""
+        if self._in_think:
+            return self._finish([], [text])
+        return self._finish([self._answer_part(text)], [])
+
+    def _answer_part(self, text: str) -> str:
+        if self._strip_leading and text:
+            text = text.lstrip()
+            if text:
+                self._strip_leading = False
+        return text
+
+    def _finish(self, answer_parts, reasoning_parts) -> Tuple[str, str]:
+        answer = "".join(answer_parts)
+        reasoning = "".join(reasoning_parts)
+        if answer:
+            self.answer_started = True
+        self.reasoning_chars += len(reasoning)
+        return answer, reasoning
+
+
+def strip_think(text: str, on_reasoning: Optional[Callable[[str], None]] = None) -> str:
+    """非流式结果的一次性过滤，与流式过滤的结果一致。"""
+    think_filter = ThinkTagFilter()
+    answer, reasoning = think_filter.feed(text)
+    tail_answer, tail_reasoning = think_filter.flush()
+    reasoning += tail_reasoning
+    if reasoning and on_reasoning:
+        on_reasoning(reasoning)
+    return answer + tail_answer
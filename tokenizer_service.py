@@ -0,0 +1,149 @@
+# tokenizer_service.py
+# -*- coding: utf-8 -*-
+"""
+进程级共享的Token计数服务。
+- tiktoken 编码器只在首次使用时加载一次，所有适配器共享；
+- 提示词的Token计数可以提交到后台线程，与网络请求并行执行；
+- 流式输出按分片增量计数，不必在结束后对整段文本重新编码；
+- 提供面向中文文本的快速估算模式，用于预算评估等不需要精确值的场景。
+"""
+import logging
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+ENCODING_NAME = "cl100k_base"
+
+# 统计时视为“一个字符约一个Token”的CJK字符及全角标点范围
+_CJK_PATTERN = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+_WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    基于字符类别的快速Token估算，不依赖 tiktoken。
+    中文字符与全角标点按每字约 1 Token 计，英文/数字按约 4 个字符 1 Token 计，
+    其余符号与空白按每 2 个字符 1 Token 计。
+    """
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    word_chars = sum(len(w) for w in _WORD_PATTERN.findall(text))
+    other_count = max(0, len(text) - cjk_count - word_chars)
+    return cjk_count + (word_chars + 3) // 4 + (other_count + 1) // 2
+
+
+class TokenizerService:
+    """
+    Token计数服务（单例）。
+    mode 为 "tiktoken" 时使用精确编码；为 "estimate" 时使用 estimate_tokens 快速估算。
+    tiktoken 不可用时自动退化为估算模式。
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            with cls._lock:
+                if not cls._instance:
+                    cls._instance = super(TokenizerService, cls).__new__(cls)
+        return cls._instance
+
+    def __init__(self, mode: str = "tiktoken"):
+        if hasattr(self, '_initialized') and self._initialized:
+            return
+        with self._lock:
+            if hasattr(self, '_initialized') and self._initialized:
+                return
+            self.mode = mode
+            self._encoder = None
+            self._encoder_failed = False
+            self._encoder_lock = threading.Lock()
+            self._executor = None
+            self._initialized = True
+
+    def set_mode(self, mode: str):
+        """切换计数模式: "tiktoken" 或 "estimate"。"""
+        if mode not in ("tiktoken", "estimate"):
+            logging.warning(f"未知的Token计数模式 '{mode}'，将保持为 '{self.mode}'。")
+            return
+        self.mode = mode
+
+    def get_encoder(self):
+        """懒加载并返回共享的 tiktoken 编码器，加载失败时返回 None。"""
+        if self._encoder is not None or self._encoder_failed:
+            return self._encoder
+        with self._encoder_lock:
+            if self._encoder is None and not self._encoder_failed:
+                try:
+                    import tiktoken
+                    self._encoder = tiktoken.get_encoding(ENCODING_NAME)
+                except Exception as e:
+                    logging.warning(f"无法加载tiktoken编码器: {e}，将使用估算方式计算Token数量。")
+                    self._encoder_failed = True
+        return self._encoder
+
+    def count(self, text: str) -> int:
+        """按当前模式计算文本的Token数量。"""
+        if not text:
+            return 0
+        if self.mode == "estimate":
+            return estimate_tokens(text)
+        encoder = self.get_encoder()
+        if encoder is None:
+            return estimate_tokens(text)
+        try:
+            return len(encoder.encode(text, disallowed_special=()))
+        except Exception as e:
+            logging.error(f"计算token时出错: {e}")
+            return 0
+
+    def count_async(self, text: str) -> Future:
+        """在后台线程中计算Token数量，立即返回 Future，不阻塞调用线程。"""
+        if not text or self.mode == "estimate":
+            future = Future()
+            future.set_result(self.count(text))
+            return future
+        if self._executor is None:
+            with self._encoder_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="token-counter")
+        return self._executor.submit(self.count, text)
+
+    def stream_counter(self) -> "StreamTokenCounter":
+        """创建一个用于流式输出的增量计数器。"""
+        return StreamTokenCounter(self)
+
+
+class StreamTokenCounter:
+    """
+    流式输出的增量Token计数器。
+    每收到一个分片只对该分片编码并累加，分片边界带来的误差通常只有几个Token。
+    """
+    def __init__(self, service: TokenizerService):
+        self._service = service
+        self.total = 0
+        self.chars = 0
+
+    def feed(self, chunk: str) -> int:
+        """累加一个分片，返回当前累计的Token数。"""
+        if chunk:
+            self.total += self._service.count(chunk)
+            self.chars += len(chunk)
+        return self.total
+
+
+def resolve_future(future: Optional[Future], default: int = 0) -> int:
+    """取出后台计数结果；计数失败时返回 default。"""
+    if future is None:
+        return default
+    try:
+        return future.result()
+    except Exception as e:
+        logging.error(f"获取Token计数结果失败: {e}")
+        return default
+
+
+# 全局共享实例
+tokenizer_service = TokenizerService()
@@ -151,7 +151,7 @@ def build_llm_settings_tab(self_instance, parent_tabview):
     import_strategy_frame.grid(row=2, column=0, columnspan=2, padx=0, pady=0, sticky="w")
 
     ctk.CTkLabel(import_strategy_frame, text="轮询策略:", font=("Microsoft YaHei", 14)).grid(row=0, column=0, padx=(5, 0), pady=5, sticky="w")
-    polling_strategy_options = ["顺序轮询", "随机轮询"]
+    polling_strategy_options = ["顺序轮询", "随机轮询", "自适应轮询"]
     polling_strategy_optionmenu = ctk.CTkOptionMenu(import_strategy_frame, variable=self_instance.polling_strategy_var, values=polling_strategy_options, font=("Microsoft YaHei", 14))
     polling_strategy_optionmenu.grid(row=0, column=1, padx=5, pady=5, sticky="w")
 
@@ -427,6 +427,9 @@ def build_ai_config_section(self_instance):
     refresh_models_btn = ctk.CTkButton(button_frame, text="刷新模型", command=self_instance.refresh_models_only, font=("Microsoft YaHei", 14))
     refresh_models_btn.grid(row=0, column=1, padx=5, pady=0, sticky="ew")
 
+    test_all_btn = ctk.CTkButton(button_frame, text="测试全部配置", command=lambda: self_instance.test_all_llm_configs(self_instance.llm_status_textbox), font=("Microsoft YaHei", 14))
+    test_all_btn.grid(row=1, column=0, columnspan=2, padx=5, pady=(5, 0), sticky="ew")
+
     # 11) LLM Status Textbox
     self_instance.llm_status_textbox = ctk.CTkTextbox(ai_config_tab, wrap="word", font=("Microsoft YaHei", 12))
     self_instance.llm_status_textbox.grid(row=10, column=0, columnspan=3, padx=5, pady=5, sticky="nsew")
@@ -3,7 +3,6 @@
 import customtkinter as ctk
 from tkinter import messagebox
 from ui.context_menu import TextWidgetContextMenu
-from ui.workflow_panel import WorkflowPanel
 from .helpers import enable_combobox_wheel_scroll
 from .custom_widgets import CustomComboBox
 import os
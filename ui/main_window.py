@@ -7,6 +7,7 @@ import traceback
 import sys
 import re
 import json
+import time
 from datetime import datetime
 import customtkinter as ctk
 import tkinter as tk
@@ -17,6 +18,8 @@ except ImportError:
     DateEntry = None
 from .role_library import RoleLibrary
 from llm_adapters import create_llm_adapter, PollingManager
+from log_writer import get_log_writer
+from rate_limiter import rate_limiters
 from embedding_adapters import create_embedding_adapter
 
 import config_manager as cm
@@ -331,6 +334,10 @@ class NovelGeneratorGUI:
         # 确保UI状态正确同步
         self.master.after(100, self.update_llm_config_ui_state)
 
+        # 可选的启动预热：并发探测全部LLM配置，预先建立连接并熔断不可达的端点
+        if PollingManager().settings.get("设置", {}).get("启动时预热", False):
+            self.master.after(500, self.start_endpoint_warmup)
+
         # 在所有UI加载和初始值设定完成后，再绑定自动保存的trace，防止启动时错误覆盖
         self._bind_project_info_traces()
 
@@ -1040,7 +1047,7 @@ class NovelGeneratorGUI:
         self.safe_log(f"  - 从UI获取的轮询列表: {polling_config_names}")
         
         # 将中文策略转换回英文保存
-        strategy_map = {"顺序轮询": "sequential", "随机轮询": "random"}
+        strategy_map = {"顺序轮询": "sequential", "随机轮询": "random", "自适应轮询": "adaptive"}
         selected_strategy_chinese = self.polling_strategy_var.get()
         strategy = strategy_map.get(selected_strategy_chinese, "sequential")
 
@@ -1079,6 +1086,9 @@ class NovelGeneratorGUI:
                     existing_data = json.load(f)
                     if "调用状态" in existing_data:
                         data_to_save["调用状态"] = existing_data["调用状态"]
+                    # 保留界面上未提供的高级设置（如日志分段、响应缓存等）
+                    if isinstance(existing_data.get("设置"), dict):
+                        data_to_save["设置"] = {**existing_data["设置"], **data_to_save["设置"]}
                     # 保留现有的步骤配置
                     if "步骤" in existing_data:
                         data_to_save["步骤"] = existing_data["步骤"]
@@ -1222,7 +1232,7 @@ class NovelGeneratorGUI:
 
         # 加载已保存的轮询策略 (英文转换为中文显示)
         saved_strategy_english = cm.get_polling_strategy()
-        strategy_map_reverse = {"sequential": "顺序轮询", "random": "随机轮询"}
+        strategy_map_reverse = {"sequential": "顺序轮询", "random": "随机轮询", "adaptive": "自适应轮询"}
         self.polling_strategy_var.set(strategy_map_reverse.get(saved_strategy_english, "顺序轮询"))
 
         # 加载错误处理设置
@@ -1341,6 +1351,44 @@ class NovelGeneratorGUI:
             handle_exception_func=lambda ctx: self.safe_update_textbox(status_textbox, f"{ctx}\n{traceback.format_exc()}")
         )
 
+    def start_endpoint_warmup(self):
+        """在后台并发探测所有配置，结果写入主日志。"""
+        def task():
+            from health_probe import probe_all
+            polling_manager = PollingManager()
+            timeout = float(polling_manager.settings.get("设置", {}).get("预热超时秒", 10))
+            started = time.time()
+            results = probe_all(polling_manager, timeout=timeout)
+            if not results:
+                return
+            failed = [r for r in results if not r.ok]
+            self.safe_log(f"LLM端点预热完成：{len(results) - len(failed)}/{len(results)} 个配置可用，耗时 {time.time() - started:.1f} 秒。")
+            for result in failed:
+                self.safe_log(f"  {result.describe()}（已暂时从轮询中跳过）")
+        threading.Thread(target=task, name="llm-warmup", daemon=True).start()
+
+    def test_all_llm_configs(self, status_textbox):
+        """并发测试全部已保存的配置和轮询列表成员，逐个输出结果。"""
+        status_textbox.delete("1.0", "end")
+
+        def task():
+            from health_probe import probe_all
+            polling_manager = PollingManager()
+            timeout = float(polling_manager.settings.get("设置", {}).get("预热超时秒", 10))
+            self.safe_update_textbox(status_textbox, "开始并发测试全部配置...")
+            try:
+                results = probe_all(polling_manager, timeout=timeout,
+                                    on_result=lambda result: self.safe_update_textbox(status_textbox, result.describe()))
+            except Exception:
+                self.safe_update_textbox(status_textbox, f"测试全部配置时出错\n{traceback.format_exc()}")
+                return
+            if not results:
+                self.safe_update_textbox(status_textbox, "没有可测试的配置。")
+                return
+            ok_count = sum(1 for r in results if r.ok)
+            self.safe_update_textbox(status_textbox, f"测试完成：{ok_count}/{len(results)} 个配置可用。")
+        threading.Thread(target=task, daemon=True).start()
+
     def test_embedding_config(self, status_textbox):
         """
         测试当前的Embedding配置是否可用
@@ -1557,6 +1605,12 @@ class NovelGeneratorGUI:
         log_dir = os.path.join("ui", "轮询设定")
         run_log_path = os.path.join(log_dir, "polling_run.log")
         error_log_path = os.path.join(log_dir, "polling_error.log")
+        # 日志由后台写入器按大小/日期轮转，查看器通过写入器读取各分段
+        run_log_writer = get_log_writer(run_log_path)
+        error_log_writer = get_log_writer(error_log_path)
+        current_segment_label = "当前日志"
+        run_segment_var = ctk.StringVar(value=current_segment_label)
+        error_segment_var = ctk.StringVar(value=current_segment_label)
 
         # --- Tabbed Interface ---
         tab_view = ctk.CTkTabview(main_frame)
@@ -1705,11 +1759,17 @@ class NovelGeneratorGUI:
             content = textbox.get("1.0", "end-1c")
             label.configure(text=f"字数: {len(content)}")
 
+        def resolve_log_entry(writer, log_entry):
+            """当前分段只在索引中保存摘要，选中时再按偏移量读取完整记录。"""
+            if log_entry and "offset" in log_entry and "length" in log_entry:
+                return writer.read_entry(log_entry["offset"], log_entry["length"]) or log_entry
+            return log_entry
+
         def on_run_log_select(event):
             selected_items = run_tree.selection()
             if not selected_items: return
             item_id = selected_items[0]
-            log_entry = run_log_data_store.get(item_id)
+            log_entry = resolve_log_entry(run_log_writer, run_log_data_store.get(item_id))
             if log_entry:
                 prompt_content = log_entry.get("prompt", "N/A")
                 response_content = log_entry.get("response", "N/A")
@@ -1730,7 +1790,7 @@ class NovelGeneratorGUI:
             selected_items = error_tree.selection()
             if not selected_items: return
             item_id = selected_items[0]
-            log_entry = error_log_data_store.get(item_id)
+            log_entry = resolve_log_entry(error_log_writer, error_log_data_store.get(item_id))
             if log_entry:
                 prompt_content = log_entry.get("prompt", "此错误日志没有记录Prompt。")
                 traceback_content = log_entry.get("traceback", "N/A")
@@ -1761,43 +1821,63 @@ class NovelGeneratorGUI:
                 widget.configure(state="normal"); widget.delete("1.0", "end"); widget.configure(state="disabled")
 
             # 加载运行日志
-            if os.path.exists(run_log_path):
-                with open(run_log_path, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                for line in reversed(lines):
-                    try:
-                        log = json.loads(line)
-                        item_id = run_tree.insert("", "end", values=(
-                            log.get('timestamp', 'N/A'),
-                            log.get('step', log.get('step_name', 'N/A')),
-                            log.get('config', log.get('config_name', 'N/A')),
-                            log.get('model', log.get('model_name', 'N/A')),
-                            log.get('input_tokens', 'N/A'),
-                            log.get('output_tokens', 'N/A'),
-                            f"{log.get('duration_seconds', 0):.2f}"
-                        ))
-                        run_log_data_store[item_id] = log
-                    except (json.JSONDecodeError, KeyError): pass
+            for log in reversed(load_segment_entries(run_log_writer, run_segment_var.get())):
+                try:
+                    item_id = run_tree.insert("", "end", values=(
+                        log.get('timestamp', 'N/A'),
+                        log.get('step', log.get('step_name', 'N/A')),
+                        log.get('config', log.get('config_name', 'N/A')),
+                        log.get('model', log.get('model_name', 'N/A')),
+                        log.get('input_tokens', 'N/A'),
+                        log.get('output_tokens', 'N/A'),
+                        f"{log.get('duration_seconds', 0):.2f}"
+                    ))
+                    run_log_data_store[item_id] = log
+                except (KeyError, TypeError, ValueError): pass
 
             # 加载错误日志
-            if os.path.exists(error_log_path):
-                with open(error_log_path, "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                for line in reversed(lines):
-                    try:
-                        log = json.loads(line)
-                        error_message = str(log.get('error', log.get('error_message', '')))
-                        # 增加健壮性检查，防止空错误信息导致崩溃
-                        display_error = error_message.splitlines()[0] if error_message.strip() else ""
-                        item_id = error_tree.insert("", "end", values=(
-                            log.get('timestamp', 'N/A'),
-                            log.get('step', log.get('step_name', 'N/A')),
-                            log.get('config', log.get('config_name', 'N/A')),
-                            log.get('model', log.get('model_name', 'N/A')),
-                            display_error
-                        ))
-                        error_log_data_store[item_id] = log
-                    except (json.JSONDecodeError, KeyError): pass
+            for log in reversed(load_segment_entries(error_log_writer, error_segment_var.get())):
+                try:
+                    error_message = str(log.get('error', log.get('error_message', '')))
+                    # 增加健壮性检查，防止空错误信息导致崩溃
+                    display_error = error_message.splitlines()[0] if error_message.strip() else ""
+                    item_id = error_tree.insert("", "end", values=(
+                        log.get('timestamp', 'N/A'),
+                        log.get('step', log.get('step_name', 'N/A')),
+                        log.get('config', log.get('config_name', 'N/A')),
+                        log.get('model', log.get('model_name', 'N/A')),
+                        display_error
+                    ))
+                    error_log_data_store[item_id] = log
+                except (KeyError, TypeError): pass
+
+            refresh_segment_menus()
+            refresh_rate_limit_status()
+
+        def refresh_rate_limit_status():
+            """显示各服务商限流队列的排队数和等待时间。"""
+            limiter_stats = rate_limiters.stats()
+            if not limiter_stats:
+                rate_limit_label.configure(text="限流: 未启用")
+                return
+            parts = []
+            for key, stats in limiter_stats.items():
+                parts.append(f"{key.split('#')[0]} 排队 {stats['queue_depth']} / 最近等待 {stats['last_wait_seconds']}s / 平均等待 {stats['avg_wait_seconds']}s")
+            rate_limit_label.configure(text="限流: " + "；".join(parts))
+
+        def segment_labels(writer):
+            return [current_segment_label] + [os.path.basename(p) for p in writer.list_segments() if p != writer.path]
+
+        def load_segment_entries(writer, label):
+            """当前分段使用偏移量索引（仅摘要），历史分段（可能为.gz）整体读取。"""
+            if label == current_segment_label:
+                return writer.get_index()
+            segment_path = os.path.join(log_dir, label)
+            return writer.read_segment(segment_path) if os.path.exists(segment_path) else []
+
+        def refresh_segment_menus():
+            run_segment_menu.configure(values=segment_labels(run_log_writer))
+            error_segment_menu.configure(values=segment_labels(error_log_writer))
 
         def clear_logs_by_date():
             if DateEntry is None:
@@ -1820,22 +1900,8 @@ class NovelGeneratorGUI:
                 try:
                     selected_date = datetime.strptime(selected_date_str, "%Y-%m-%d").date()
                     if messagebox.askyesno("确认", f"确定要删除 {selected_date} 之前的所有日志吗？"):
-                        for log_file in [run_log_path, error_log_path]:
-                            if not os.path.exists(log_file): continue
-                            with open(log_file, "r", encoding="utf-8") as f:
-                                lines = f.readlines()
-                            
-                            lines_to_keep = []
-                            for line in lines:
-                                try:
-                                    log_date = datetime.strptime(json.loads(line)['timestamp'], "%Y-%m-%d %H:%M:%S").date()
-                                    if log_date >= selected_date:
-                                        lines_to_keep.append(line)
-                                except (json.JSONDecodeError, KeyError, ValueError):
-                                    lines_to_keep.append(line) # 保留无法解析的行
-                            
-                            with open(log_file, "w", encoding="utf-8") as f:
-                                f.writelines(lines_to_keep)
+                        for writer in [run_log_writer, error_log_writer]:
+                            writer.clear(before_date=selected_date.strftime("%Y-%m-%d"))
                         
                         messagebox.showinfo("成功", "指定日期前的日志已删除。")
                         load_logs()
@@ -1849,8 +1915,8 @@ class NovelGeneratorGUI:
         def clear_all_logs():
             if messagebox.askyesno("确认", "确定要清空所有运行和错误日志吗？此操作不可恢复。"):
                 try:
-                    if os.path.exists(run_log_path): open(run_log_path, 'w').close()
-                    if os.path.exists(error_log_path): open(error_log_path, 'w').close()
+                    run_log_writer.clear()
+                    error_log_writer.clear()
                     messagebox.showinfo("成功", "所有日志已清空。")
                     load_logs()
                 except Exception as e:
@@ -1866,6 +1932,17 @@ class NovelGeneratorGUI:
         clear_all_btn = ctk.CTkButton(control_frame, text="全部删除", command=clear_all_logs, fg_color="red")
         clear_all_btn.pack(side="left", padx=5, pady=5)
 
+        ctk.CTkLabel(control_frame, text="运行日志分段:").pack(side="left", padx=(20, 5), pady=5)
+        run_segment_menu = ctk.CTkOptionMenu(control_frame, variable=run_segment_var, values=[current_segment_label], command=lambda _: load_logs())
+        run_segment_menu.pack(side="left", padx=5, pady=5)
+
+        rate_limit_label = ctk.CTkLabel(main_frame, text="限流: 未启用", anchor="w")
+        rate_limit_label.grid(row=2, column=0, sticky="ew", pady=(5, 0))
+
+        ctk.CTkLabel(control_frame, text="错误日志分段:").pack(side="left", padx=(20, 5), pady=5)
+        error_segment_menu = ctk.CTkOptionMenu(control_frame, variable=error_segment_var, values=[current_segment_label], command=lambda _: load_logs())
+        error_segment_menu.pack(side="left", padx=5, pady=5)
+
         # 初始加载
         load_logs()
 
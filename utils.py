@@ -32,17 +32,33 @@ def clear_file_content(filepath: str) -> None:
     except Exception as e:
         raise Exception(f"清空文件失败: {str(e)}")
 
+def replace_file_atomically(filepath: str, write_func) -> None:
+    """
+    先写入同目录下的临时文件再替换目标文件，并发读取的任务不会读到写了一半的内容。
+    Windows 上目标文件被其他进程占用而无法替换时，退回直接覆盖写入。
+    """
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            write_func(f)
+        os.replace(tmp_path, filepath)
+    except PermissionError:
+        with open(filepath, 'w', encoding='utf-8') as f:
+            write_func(f)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 def save_string_to_txt(content: str, filepath: str) -> None:
     """保存字符串到文件"""
     try:
         # 获取文件所在的目录
         dir_path = os.path.dirname(filepath)
         # 如果目录不存在，则创建它
-        if not os.path.exists(dir_path):
+        if dir_path and not os.path.exists(dir_path):
             os.makedirs(dir_path)
             
-        with open(filepath, 'w', encoding='utf-8') as f:
-            f.write(content)
+        replace_file_atomically(filepath, lambda f: f.write(content))
     except Exception as e:
         raise Exception(f"保存文件失败: {str(e)}")
 